@@ -2,15 +2,23 @@
 import os
 import logging
 from flask import Flask, request
-from flask_jwt_extended import JWTManager
+from flask_jwt_extended import JWTManager, decode_token
 from flask_login import LoginManager
 from flask_cors import CORS
-from flask_session import Session
 from flask import session as flask_session
-from flask_socketio import SocketIO
+from flask_socketio import SocketIO, join_room, leave_room
 
 from config import config
 from database.db import db, init_db_if_needed
+from database.audit_sink import audit_sink
+from database.token_revocation import revocation_store
+from database.passwords import password_hasher
+from database.activity_ingest import activity_ingestor
+from database.progress_rollups import progress_aggregator
+from database.jobs import job_scheduler, job_room
+from database.progress_push import progress_publisher, can_subscribe, course_room, learner_room
+from database.session_store import session_store
+from database.compression import configure_compression
 from routes import register_blueprints
 from agents.tutor_builder_agent.tutor_builder_agent import TutorBuilderAgent
 import time
@@ -87,8 +95,12 @@ class AgentManager:
             print(f"[AgentManager] Error terminating agent {agent_id}: {e}")
 
 
-def create_app(config_name=None):
-    """Create and configure the Flask application instance (App Factory)."""
+def create_app(config_name=None, overrides=None):
+    """Create and configure the Flask application instance (App Factory).
+
+    @param config_name (str): Key of the config class; FLASK_CONFIG or 'default' if not given.
+    @param overrides (dict): Settings applied on top of the config class.
+    """
     if config_name is None:
         config_name = os.environ.get('FLASK_CONFIG', 'default')
 
@@ -96,9 +108,12 @@ def create_app(config_name=None):
 
     app = Flask(__name__)
     app.config.from_object(config[config_name])
+    app.config.update(overrides or {})
 
     # Configure extensions
     db.init_app(app)
+    configure_compression(app)
+    password_hasher.init_app(app)
     jwt = JWTManager(app)
     socketio = SocketIO(app)  # You might need to pass this to your run script
 
@@ -107,11 +122,11 @@ def create_app(config_name=None):
     # Initialize other extensions like LoginManager, CORS, Session, etc.
     init_extensions(app)
 
-    # Setup JWT blocklist
-    from routes.auth import jwt_blocklist
+    # Setup JWT revocation checks (persistent, shared across workers)
+    revocation_store.init_app(app)
     @jwt.token_in_blocklist_loader
     def check_if_token_in_blocklist(jwt_header, jwt_payload):
-        return jwt_payload["jti"] in jwt_blocklist
+        return revocation_store.is_revoked(jwt_payload["jti"])
 
     # Register all blueprints for the application
     register_blueprints(app)
@@ -120,9 +135,42 @@ def create_app(config_name=None):
     with app.app_context():
         init_db_if_needed(app)
 
+    # Start the background writer for admin audit logs
+    audit_sink.init_app(app)
+
+    # Batched analytics event ingestion
+    activity_ingestor.init_app(app)
+
+    # Keep the learner progress rollups current in the background
+    progress_aggregator.init_app(app)
+
+    # Background jobs (reports, rollup refreshes, purges) with progress pushed over Socket.IO
+    job_scheduler.init_app(app)
+
+    # Coalesced learner progress deltas pushed to course and learner rooms
+    progress_publisher.init_app(app)
+
     # --- SocketIO Event Handlers ---
+    # Sockets authenticate with the access token the client sends as `auth`
+    # (io({auth: {token}})); the user is remembered per sid for later events
+    socket_users = {}  # sid -> user id
+
+    def _socket_principal():
+        from database.identity_cache import identity_cache
+        user_id = socket_users.get(request.sid)
+        return identity_cache.principal(user_id) if user_id is not None else None
+
     @socketio.on('connect')
-    def on_connect():
+    def on_connect(auth=None):
+        token = auth.get('token') if isinstance(auth, dict) else None
+        if token:
+            try:
+                claims = decode_token(token)
+                if claims.get('type') == 'access' and not revocation_store.is_revoked(claims['jti']):
+                    socket_users[request.sid] = claims['sub']
+            except Exception as e:
+                app.logger.info(f"Socket {request.sid} sent an invalid access token: {e}")
+
         agent_id = flask_session.get('agent_id')
         if not agent_id:
             # As a fallback, mint one here (should usually exist from the page route)
@@ -149,6 +197,7 @@ def create_app(config_name=None):
     def on_disconnect():
         agent_id = app.agent_manager._sid_to_agent.get(request.sid)
         app.agent_manager.unbind_sid(request.sid)
+        socket_users.pop(request.sid, None)
         print(f"Client disconnected: {request.sid} (agent_id={agent_id})")
 
     @socketio.on('save_tutor')
@@ -199,6 +248,41 @@ def create_app(config_name=None):
         agent.handle_unlock_tutor(request.sid, message)
         app.agent_manager.mark_active(agent_id)
 
+    @socketio.on('watch_job')
+    def on_watch_job(message):
+        # Progress of a background job is pushed as `job_progress` to its room
+        from models import Job
+        principal = _socket_principal()
+        job = db.session.get(Job, int((message or {}).get('job_id') or 0))
+        if not job or principal is None:
+            return
+        if principal.role == 'admin' or principal.id == job.user_id:
+            join_room(job_room(job.id))
+            return job.to_dict()
+
+    def _progress_room(message):
+        message = message or {}
+        if message.get('course_id') is not None:
+            return course_room(int(message['course_id'])), {'course_id': int(message['course_id'])}
+        if message.get('learner_id') is not None:
+            return learner_room(int(message['learner_id'])), {'learner_id': int(message['learner_id'])}
+        return None, {}
+
+    @socketio.on('subscribe_progress')
+    def on_subscribe_progress(message):
+        # message: {'course_id': ...} or {'learner_id': ...}; deltas then arrive as `progress` events
+        room, scope = _progress_room(message)
+        if room is None or not can_subscribe(_socket_principal(), **scope):
+            return {'subscribed': False}
+        join_room(room)
+        return {'subscribed': True}
+
+    @socketio.on('unsubscribe_progress')
+    def on_unsubscribe_progress(message):
+        room, _ = _progress_room(message)
+        if room is not None:
+            leave_room(room)
+
     # Configure security headers for production
     if not app.debug and not app.testing:
         @app.after_request
@@ -218,16 +302,14 @@ def init_extensions(app):
 
     @login_manager.user_loader
     def load_user(user_id):
-        from models import User
-        return User.query.get(int(user_id))
+        # The cached principal implements the Flask-Login user interface
+        from database.identity_cache import identity_cache
+        return identity_cache.principal(user_id)
 
     CORS(app, resources={r"/api/*": {"origins": "*"}})
 
-    app.config['SESSION_TYPE'] = 'filesystem'
-    app.config['SESSION_FILE_DIR'] = os.path.join(os.path.dirname(__file__), 'sessions')
-    if not os.path.exists(app.config['SESSION_FILE_DIR']):
-        os.makedirs(app.config['SESSION_FILE_DIR'])
-    Session(app)
+    # Server-side sessions: SQLite file with an in-memory LRU in front
+    session_store.init_app(app)
 
     from flask_migrate import Migrate
     Migrate(app, db)
\ No newline at end of file
@@ -17,10 +17,15 @@ class Config:
     JWT_ACCESS_TOKEN_EXPIRES = timedelta(hours=1)
     JWT_REFRESH_TOKEN_EXPIRES = timedelta(days=30)
 
-    # Session settings
-    SESSION_TYPE = 'filesystem'
+    # Session settings (see database/session_store.py)
+    SESSION_TYPE = 'sqlite'  # 'sqlite' or 'memory' (single process, lost on restart)
     SESSION_PERMANENT = True
     PERMANENT_SESSION_LIFETIME = timedelta(days=7)
+    SESSION_STORE_PATH = 'data/sessions.db'  # relative to the instance folder, like the application database
+    SESSION_STORE_MAX_ENTRIES = 10000  # sessions kept in the in-memory LRU
+    SESSION_STORE_CACHE_TTL = 2.0  # seconds a cached session is used before checking for writes by other workers
+    SESSION_STORE_TOUCH_INTERVAL = 300  # seconds between expiry extensions of an unmodified session
+    SESSION_STORE_SWEEP_INTERVAL = 600  # seconds between deletions of expired sessions
 
     # Disable CSRF protection
     WTF_CSRF_ENABLED = False
@@ -28,11 +33,102 @@ class Config:
     # File upload settings
     MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16 MB
 
+    # Admin audit logging (written in batches by a background thread)
+    AUDIT_ASYNC_ENABLED = True
+    AUDIT_QUEUE_MAXSIZE = 10000
+    AUDIT_BATCH_SIZE = 200
+    AUDIT_FLUSH_INTERVAL = 1.0  # seconds
+    AUDIT_OVERFLOW_POLICY = 'spill'  # 'drop_newest', 'drop_oldest' or 'spill'
+    AUDIT_SPILL_PATH = 'data/audit_spill.jsonl'
+
+    # In-memory cache for read-only JSON endpoints (see routes/response_cache.py)
+    RESPONSE_CACHE_ENABLED = True
+    RESPONSE_CACHE_MAX_ENTRIES = 1024
+
+    # Rendered tutor pages, kept with a gzip copy (see routes/view_cache.py)
+    VIEW_CACHE_ENABLED = True
+    VIEW_CACHE_MAX_ENTRIES = 256
+    VIEW_CACHE_GZIP_LEVEL = 6
+
+    # Password hashing (see database/passwords.py); changing the method rehashes on next login
+    PASSWORD_HASH_METHOD = 'scrypt'  # werkzeug method, e.g. 'scrypt:65536:8:1' or 'pbkdf2:sha256:600000'
+    PASSWORD_HASH_SALT_LENGTH = 16
+    PASSWORD_HASH_WORKERS = None  # None: min(4, CPU count)
+    PASSWORD_HASH_MAX_PENDING = 64  # hashes allowed to wait for a worker before returning 503
+    PASSWORD_HASH_TIMEOUT = 10.0  # seconds
+
+    # Seconds a cached principal (user, role, profile ids) may be reused across requests
+    PRINCIPAL_CACHE_TTL = 30
+
+    # Revoked JWTs: SQLite table behind an in-memory Bloom filter (see database/token_revocation.py)
+    JWT_REVOCATION_CAPACITY = 100000  # revoked, unexpired tokens the filter is sized for
+    JWT_REVOCATION_ERROR_RATE = 0.001  # filter false positives, each costing one indexed lookup
+    JWT_REVOCATION_REFRESH_INTERVAL = 2.0  # seconds before revocations by other workers are picked up
+    JWT_REVOCATION_PURGE_INTERVAL = 3600  # seconds between rebuilds of the filter from the live rows
+
+    # Batched analytics events (see database/activity_ingest.py)
+    ANALYTICS_INGEST_MAX_EVENTS = 5000  # events per request
+    ANALYTICS_INGEST_KEY_TTL = timedelta(days=7)  # how long a client may retry a batch without duplicates
+    ANALYTICS_INGEST_PURGE_INTERVAL = 3600  # seconds between deletions of expired idempotency keys
+
+    # Rows per keyset page when streaming report exports (see database/report_export.py)
+    EXPORT_CHUNK_SIZE = 1000
+
+    # Learner progress rollups (see database/progress_rollups.py)
+    PROGRESS_ROLLUP_ENABLED = True
+    PROGRESS_ROLLUP_BATCH_SIZE = 10000  # source rows folded in per transaction
+    PROGRESS_ROLLUP_INTERVAL = 30.0  # seconds between passes when no local write wakes the thread
+    PROGRESS_ROLLUP_DELAY = 0.5  # seconds to wait after a write so bursts are folded in together
+
+    # Real-time progress push over Socket.IO (see database/progress_push.py)
+    PROGRESS_PUSH_ENABLED = True
+    PROGRESS_PUSH_INTERVAL = 0.25  # seconds; writes within an interval are pushed together
+
+    # Downsampled metric series (see database/metric_series.py); day buckets are kept for good
+    METRIC_BUCKET_RETENTION = {60: timedelta(days=7), 3600: timedelta(days=180)}  # bucket width in seconds -> age
+
+    # Cohort percentile sketches (see database/quantile_sketches.py)
+    QUANTILE_SKETCH_K = 200  # compactor size; rank error is roughly 1.7 / K
+
+    # Skill mastery by knowledge tracing (see database/knowledge_tracing.py)
+    KNOWLEDGE_TRACING_DEFAULTS = {'p_init': 0.2, 'p_learn': 0.15, 'p_guess': 0.2, 'p_slip': 0.1}  # until fitted
+    KNOWLEDGE_TRACING_CORRECT_SCORE = 0.6  # normalized score counted as a correct attempt
+    KNOWLEDGE_TRACING_MASTERY = 0.95  # probability reported as mastered
+    KNOWLEDGE_TRACING_MIN_ATTEMPTS = 200  # attempts at a skill before its parameters are fitted
+    KNOWLEDGE_TRACING_FIT_MAX_ATTEMPTS = 200  # attempts per learner used by a fit
+
+    # Background jobs (see database/jobs.py)
+    JOBS_ENABLED = True
+    JOB_WORKERS = 2  # worker threads per process
+    JOB_POLL_INTERVAL = 1.0  # seconds between queue checks when idle
+    JOB_RETRY_BACKOFF = 5.0  # seconds before the first retry; doubles with each attempt
+    JOB_LEASE_TIMEOUT = 300  # seconds without a heartbeat before a running job is requeued
+    JOB_PROGRESS_INTERVAL = 1.0  # seconds between progress writes to the job row
+    JOB_RETENTION = timedelta(days=7)  # finished jobs older than this are purged
+
+    # Fingerprinted, precompressed static assets (see routes/static_assets.py)
+    STATIC_ASSETS_ENABLED = True
+    STATIC_ASSETS_DIR = 'dist'  # build output, relative to the static folder
+    STATIC_ASSETS_MAX_AGE = 31536000  # one year; fingerprinted names never change content
+
+    # Jinja {% cache %} fragments and compiled-template cache (see routes/fragment_cache.py)
+    FRAGMENT_CACHE_ENABLED = True
+    FRAGMENT_CACHE_TTL = 300  # seconds
+    FRAGMENT_CACHE_MAX_ENTRIES = 512
+    JINJA_BYTECODE_CACHE_DIR = 'data/jinja_cache'
+
+    # Compression of large text blobs (see database/compression.py)
+    BLOB_COMPRESSION_THRESHOLD = 4096  # bytes
+    BLOB_COMPRESSION_CODEC = 'auto'  # 'auto' (zstd if installed, else zlib), 'zlib' or 'zstd'
+    BLOB_COMPRESSION_LEVEL = 6
+
 
 class DevelopmentConfig(Config):
     """Development configuration"""
     DEBUG = True
     SQLALCHEMY_ECHO = True
+    FRAGMENT_CACHE_ENABLED = False  # show template edits immediately
+    STATIC_ASSETS_ENABLED = False  # serve the source files, so JS and CSS edits show immediately
 
 
 class TestingConfig(Config):
@@ -40,6 +136,7 @@ class TestingConfig(Config):
     TESTING = True
     SQLALCHEMY_DATABASE_URI = os.environ.get('TEST_DATABASE_URL', 'sqlite:///test_app.db')
     WTF_CSRF_ENABLED = False  # Already disabled in base config
+    AUDIT_ASYNC_ENABLED = False  # Write audit logs in the request session so tests can assert on them
 
 
 class ProductionConfig(Config):
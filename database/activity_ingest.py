@@ -0,0 +1,394 @@
+"""
+Batched ingestion of learner analytics events.
+
+A tutor client buffers its events and posts them as NDJSON (one event per
+line) or as a JSON array. Each event carries a `type` and an
+`idempotency_key` unique per learner:
+
+    {"type": "activity", "idempotency_key": "...", "session_id": 12, "activity_type": "answer",
+     "activity_data": {...}, "score": 0.8, "feedback": "...", "timestamp": "2024-05-01T10:00:00Z"}
+    {"type": "progress", "idempotency_key": "...", "session_id": 12, "module_id": 3, "progress": 50}
+    {"type": "metric", "idempotency_key": "...", "tutor_id": 4, "metric_name": "hints_used",
+     "metric_value": 2, "contextual_data": {...}}
+    {"type": "session_end", "idempotency_key": "...", "session_id": 12}
+
+Events are checked against JSON schemas compiled once at import. Invalid
+events and events for sessions or tutors the learner cannot write to are
+reported back and skipped. Everything else in the batch is written in one
+transaction with bulk statements. The batch's keys are inserted first with
+ON CONFLICT DO NOTHING, and only events whose key was new are applied, so a
+client that retries a batch after a timeout records nothing twice.
+"""
+
+import json
+import logging
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+from jsonschema import Draft7Validator
+from jsonschema.exceptions import best_match
+from sqlalchemy import bindparam, delete, select, update
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from database.db import db
+from database.sqlite_helpers import notify_model_write
+from database.progress_rollups import mark_sessions_ended
+
+logger = logging.getLogger(__name__)
+
+_KEY = {'type': 'string', 'minLength': 1, 'maxLength': 128}
+_ID = {'type': 'integer', 'minimum': 1}
+_TIMESTAMP = {'type': 'string', 'maxLength': 40}
+_OBJECT = {'type': 'object'}
+
+EVENT_SCHEMAS = {
+    'activity': {
+        'type': 'object',
+        'required': ['idempotency_key', 'session_id', 'activity_type'],
+        'properties': {
+            'type': {'const': 'activity'},
+            'idempotency_key': _KEY,
+            'session_id': _ID,
+            'activity_type': {'type': 'string', 'minLength': 1, 'maxLength': 50},
+            'activity_data': _OBJECT,
+            'score': {'type': ['number', 'null']},
+            'feedback': {'type': ['string', 'null']},
+            'timestamp': _TIMESTAMP
+        },
+        'additionalProperties': False
+    },
+    'progress': {
+        'type': 'object',
+        'required': ['idempotency_key', 'session_id', 'module_id', 'progress'],
+        'properties': {
+            'type': {'const': 'progress'},
+            'idempotency_key': _KEY,
+            'session_id': _ID,
+            'module_id': _ID,
+            'progress': {'type': 'number', 'minimum': 0, 'maximum': 100},
+            'timestamp': _TIMESTAMP
+        },
+        'additionalProperties': False
+    },
+    'metric': {
+        'type': 'object',
+        'required': ['idempotency_key', 'tutor_id', 'metric_name', 'metric_value'],
+        'properties': {
+            'type': {'const': 'metric'},
+            'idempotency_key': _KEY,
+            'tutor_id': _ID,
+            'metric_name': {'type': 'string', 'minLength': 1, 'maxLength': 100},
+            'metric_value': {'type': 'number'},
+            'contextual_data': _OBJECT,
+            'timestamp': _TIMESTAMP
+        },
+        'additionalProperties': False
+    },
+    'session_end': {
+        'type': 'object',
+        'required': ['idempotency_key', 'session_id'],
+        'properties': {
+            'type': {'const': 'session_end'},
+            'idempotency_key': _KEY,
+            'session_id': _ID,
+            'timestamp': _TIMESTAMP
+        },
+        'additionalProperties': False
+    }
+}
+
+# Compiled once; one validator per event type is cheaper than a oneOf over all of them
+_VALIDATORS = {}
+for _event_type, _schema in EVENT_SCHEMAS.items():
+    Draft7Validator.check_schema(_schema)
+    _VALIDATORS[_event_type] = Draft7Validator(_schema)
+
+
+class IngestError(ValueError):
+    """Raised when a batch cannot be read at all."""
+
+
+def _parse_timestamp(value, now):
+    if value is None:
+        return now
+    parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    # Client clocks run ahead; never record an event in the future
+    return min(parsed, now)
+
+
+def _completion_percentage(modules):
+    # Same rule as LearnerTutor.update_completion_percentage
+    if not modules:
+        return 0
+    return min(max(sum(modules.values()) / len(modules), 0), 100)
+
+
+def _load_json(text):
+    try:
+        return json.loads(text or '{}')
+    except ValueError:
+        return {}
+
+
+class ActivityIngestor:
+    """Validates event batches and writes them in one transaction."""
+
+    def __init__(self, max_events=5000, key_ttl=timedelta(days=7), purge_interval=3600):
+        self.max_events = max_events
+        self.key_ttl = key_ttl
+        self.purge_interval = purge_interval
+        self._next_purge = 0.0
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        """Read ANALYTICS_INGEST_* settings from the app config."""
+        self.max_events = app.config.get('ANALYTICS_INGEST_MAX_EVENTS', self.max_events)
+        self.key_ttl = app.config.get('ANALYTICS_INGEST_KEY_TTL', self.key_ttl)
+        self.purge_interval = app.config.get('ANALYTICS_INGEST_PURGE_INTERVAL', self.purge_interval)
+        app.extensions['activity_ingest'] = self
+
+    def parse(self, body):
+        """
+        Split a request body into events.
+
+        @param body (bytes): NDJSON, or a JSON array of events.
+        @return (list): (line number, event or None, error or None) tuples.
+        @raises IngestError: If the body is empty, not valid JSON as a whole, or too large.
+        """
+        text = body.decode('utf-8') if isinstance(body, bytes) else body
+        if text.lstrip().startswith('['):
+            try:
+                items = json.loads(text)
+            except ValueError as e:
+                raise IngestError(f"Invalid JSON array: {e}")
+            parsed = [(line, item, None) for line, item in enumerate(items, start=1)]
+        else:
+            parsed = []
+            for line, raw in enumerate(text.splitlines(), start=1):
+                if not raw.strip():
+                    continue
+                try:
+                    parsed.append((line, json.loads(raw), None))
+                except ValueError as e:
+                    parsed.append((line, None, f"Invalid JSON: {e}"))
+        if not parsed:
+            raise IngestError("No events in request")
+        if len(parsed) > self.max_events:
+            raise IngestError(f"Too many events in one batch (max {self.max_events})")
+        return parsed
+
+    def validate(self, parsed, now):
+        """Check each event against its schema and normalize its timestamp."""
+        valid, rejected = [], []
+        for line, event, error in parsed:
+            if error is None:
+                error = self._check(event)
+            if error is None:
+                try:
+                    event['timestamp'] = _parse_timestamp(event.get('timestamp'), now)
+                except ValueError:
+                    error = "Invalid timestamp"
+            if error is None:
+                valid.append((line, event))
+            else:
+                rejected.append({'line': line, 'error': error})
+        return valid, rejected
+
+    def _check(self, event):
+        if not isinstance(event, dict):
+            return "Event must be an object"
+        validator = _VALIDATORS.get(event.get('type'))
+        if validator is None:
+            return f"Unknown event type: {event.get('type')}"
+        error = best_match(validator.iter_errors(event))
+        if error is not None:
+            location = '.'.join(str(part) for part in error.absolute_path)
+            return f"{location}: {error.message}" if location else error.message
+        return None
+
+    def ingest(self, learner_id, body):
+        """
+        Validate and record a batch of events for a learner.
+
+        @param learner_id (int): The learner the events belong to.
+        @param body (bytes): The request body.
+        @return (dict): Counts of accepted and duplicate events, and the rejected events with reasons.
+        @raises IngestError: If the body cannot be read as a batch.
+        """
+        from models import IngestKey, LearnerSession, LearnerTutor, Tutor
+
+        now = datetime.utcnow()
+        events, rejected = self.validate(self.parse(body), now)
+
+        # Events may only write to the learner's own sessions and to existing tutors
+        session_ids = {event['session_id'] for _, event in events if 'session_id' in event}
+        tutor_ids = {event['tutor_id'] for _, event in events if event['type'] == 'metric'}
+        sessions, known_tutors = {}, set()
+        if session_ids:
+            rows = db.session.execute(
+                select(LearnerSession.id, LearnerSession.learner_tutor_id, LearnerSession.start_time,
+                       LearnerSession.end_time)
+                .join(LearnerTutor, LearnerTutor.id == LearnerSession.learner_tutor_id)
+                .where(LearnerSession.id.in_(session_ids), LearnerTutor.learner_id == learner_id)
+            ).all()
+            sessions = {row.id: row for row in rows}
+        if tutor_ids:
+            known_tutors = set(db.session.execute(select(Tutor.id).where(Tutor.id.in_(tutor_ids))).scalars())
+
+        accepted_events = []
+        seen_keys = set()
+        duplicates = 0
+        for line, event in events:
+            if 'session_id' in event and event['session_id'] not in sessions:
+                rejected.append({'line': line, 'error': "Unknown session"})
+            elif event['type'] == 'metric' and event['tutor_id'] not in known_tutors:
+                rejected.append({'line': line, 'error': "Unknown tutor"})
+            elif event['idempotency_key'] in seen_keys:
+                duplicates += 1
+            else:
+                seen_keys.add(event['idempotency_key'])
+                accepted_events.append(event)
+
+        written = set()
+        if accepted_events:
+            with db.engine.begin() as conn:
+                new_keys = set(conn.execute(
+                    sqlite_insert(IngestKey.__table__).on_conflict_do_nothing()
+                    .returning(IngestKey.__table__.c.idempotency_key),
+                    [{'learner_id': learner_id, 'idempotency_key': event['idempotency_key'], 'created_at': now}
+                     for event in accepted_events]
+                ).scalars())
+                duplicates += len(accepted_events) - len(new_keys)
+                accepted_events = [event for event in accepted_events if event['idempotency_key'] in new_keys]
+                written = self._write(conn, learner_id, accepted_events, sessions)
+
+        for table_name, row_id in written:
+            # Core writes bypass the ORM events that feed the caches and the progress push
+            notify_model_write(table_name, row_id)
+        self._maybe_purge()
+        rejected.sort(key=lambda item: item['line'])
+        return {'accepted': len(accepted_events), 'duplicates': duplicates, 'rejected': rejected}
+
+    def _write(self, conn, learner_id, events, sessions):
+        from models import LearnerSession, LearnerTutor, PerformanceMetric, SessionActivity
+
+        written = set()
+        by_type = {event_type: [] for event_type in EVENT_SCHEMAS}
+        for event in events:
+            by_type[event['type']].append(event)
+
+        if by_type['activity']:
+            conn.execute(SessionActivity.__table__.insert(), [{
+                'session_id': event['session_id'],
+                'timestamp': event['timestamp'],
+                'activity_type': event['activity_type'],
+                'activity_data': json.dumps(event.get('activity_data') or {}),
+                'score': event.get('score'),
+                'feedback': event.get('feedback')
+            } for event in by_type['activity']])
+            written.add((SessionActivity.__tablename__, None))
+
+        if by_type['metric']:
+            conn.execute(PerformanceMetric.__table__.insert(), [{
+                'learner_id': learner_id,
+                'tutor_id': event['tutor_id'],
+                'metric_name': event['metric_name'],
+                'metric_value': event['metric_value'],
+                'recorded_at': event['timestamp'],
+                'contextual_data': json.dumps(event.get('contextual_data') or {})
+            } for event in by_type['metric']])
+            written.add((PerformanceMetric.__tablename__, None))
+
+        if by_type['progress']:
+            session_ids, learner_tutor_ids = self._apply_progress(conn, by_type['progress'], sessions)
+            written.update((LearnerSession.__tablename__, session_id) for session_id in session_ids)
+            written.update((LearnerTutor.__tablename__, learner_tutor_id) for learner_tutor_id in learner_tutor_ids)
+
+        ended = {}
+        for event in by_type['session_end']:
+            session = sessions[event['session_id']]
+            if session.end_time is None and event['session_id'] not in ended:
+                end_time = max(event['timestamp'], session.start_time)
+                ended[event['session_id']] = {
+                    'b_id': event['session_id'],
+                    'end_time': end_time,
+                    'duration_minutes': int((end_time - session.start_time).total_seconds() / 60)
+                }
+        if ended:
+            table = LearnerSession.__table__
+            conn.execute(
+                update(table).where(table.c.id == bindparam('b_id'), table.c.end_time.is_(None))
+                .values(end_time=bindparam('end_time'), duration_minutes=bindparam('duration_minutes')),
+                list(ended.values())
+            )
+            # In the same transaction, so the progress rollups cannot miss the ended sessions
+            mark_sessions_ended(conn, {sessions[session_id].learner_tutor_id for session_id in ended})
+            written.update((LearnerSession.__tablename__, session_id) for session_id in ended)
+        return written
+
+    def _apply_progress(self, conn, events, sessions):
+        from models import LearnerSession, LearnerTutor
+
+        session_table = LearnerSession.__table__
+        tutor_table = LearnerTutor.__table__
+        session_ids = {event['session_id'] for event in events}
+        learner_tutor_ids = {sessions[session_id].learner_tutor_id for session_id in session_ids}
+
+        session_progress = {
+            row.id: _load_json(row.module_progress) for row in conn.execute(
+                select(session_table.c.id, session_table.c.module_progress)
+                .where(session_table.c.id.in_(session_ids))
+            )
+        }
+        tutor_progress = {
+            row.id: _load_json(row.progress_data) for row in conn.execute(
+                select(tutor_table.c.id, tutor_table.c.progress_data).where(tutor_table.c.id.in_(learner_tutor_ids))
+            )
+        }
+
+        # Apply in timestamp order so the latest value for a module wins
+        for event in sorted(events, key=lambda event: event['timestamp']):
+            module_key = str(event['module_id'])
+            session_progress[event['session_id']][module_key] = event['progress']
+            learner_tutor_id = sessions[event['session_id']].learner_tutor_id
+            tutor_progress[learner_tutor_id].setdefault('modules', {})[module_key] = event['progress']
+
+        conn.execute(
+            update(session_table).where(session_table.c.id == bindparam('b_id'))
+            .values(module_progress=bindparam('module_progress')),
+            [{'b_id': session_id, 'module_progress': json.dumps(progress)}
+             for session_id, progress in session_progress.items()]
+        )
+        conn.execute(
+            update(tutor_table).where(tutor_table.c.id == bindparam('b_id'))
+            .values(progress_data=bindparam('progress_data'), completion_percentage=bindparam('completion')),
+            [{'b_id': learner_tutor_id, 'progress_data': json.dumps(progress),
+              'completion': _completion_percentage(progress.get('modules'))}
+             for learner_tutor_id, progress in tutor_progress.items()]
+        )
+        return session_ids, learner_tutor_ids
+
+    def _maybe_purge(self):
+        now = time.monotonic()
+        with self._lock:
+            if now < self._next_purge:
+                return
+            self._next_purge = now + self.purge_interval
+        self.purge_expired_keys()
+
+    def purge_expired_keys(self):
+        """Delete idempotency keys older than the retry window. Returns the number deleted."""
+        from models import IngestKey
+
+        table = IngestKey.__table__
+        with db.engine.begin() as conn:
+            deleted = conn.execute(delete(table).where(table.c.created_at < datetime.utcnow() - self.key_ttl)).rowcount
+        if deleted:
+            logger.info("Purged %d expired ingest keys", deleted)
+        return deleted
+
+
+activity_ingestor = ActivityIngestor()
@@ -0,0 +1,293 @@
+"""
+Columnar analytics over learner sessions, activities and metrics.
+
+Rows are pulled straight from the SQLite cursor into pandas frames with
+compact dtypes: int32 ids, float32 scores, and categorical activity types and
+metric names. SQLite does the per-row work that would be slow in Python. It
+reads the module an activity belongs to with json_extract from
+`activity_data.module_id`, and it converts timestamps to epoch seconds. Every
+statistic is then a vectorized pass (groupby, histogram, quantile) over those
+columns. No ORM objects are built, so a million activities are summarized in a
+few seconds.
+
+Scores above 1 are taken to be percentages and scaled to 0-1 before they are
+compared across tutors.
+"""
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import case, func, literal_column, select
+
+from database.db import db
+
+SCORE_BINS = np.linspace(0.0, 1.0, 11)
+FUNNEL_STAGES = ('enrolled', 'started', 'active', 'halfway', 'completed')
+
+
+def _epoch(column):
+    # SQLite computes epoch seconds, so timestamps never go through Python datetime parsing
+    return (func.julianday(column) - 2440587.5) * 86400.0
+
+
+def _read(stmt, dtypes):
+    with db.engine.connect() as conn:
+        result = conn.execute(stmt)
+        # Plain tuples from the DBAPI cursor; wrapping a million Row objects costs more than the query
+        frame = pd.DataFrame(result.cursor.fetchall(), columns=list(result.keys()))
+    for column, dtype in dtypes.items():
+        if dtype == 'category':
+            frame[column] = frame[column].astype('category')
+        else:
+            frame[column] = pd.to_numeric(frame[column], errors='coerce').astype(dtype)
+    return frame
+
+
+def load_frames(tutor_ids, learner_ids=None):
+    """
+    Load the analytics rows of a set of tutors as typed frames.
+
+    @param tutor_ids (list): Tutors to load.
+    @param learner_ids (list): Optionally restrict to these learners (e.g. a course's enrollment).
+    @return (dict): 'learner_tutors', 'sessions', 'activities' and 'metrics' DataFrames.
+    """
+    from models import LearnerSession, LearnerTutor, PerformanceMetric, SessionActivity
+
+    tutor_ids = list(tutor_ids)
+    learner_filter = [LearnerTutor.learner_id.in_(learner_ids)] if learner_ids is not None else []
+
+    learner_tutors = _read(
+        select(LearnerTutor.id.label('learner_tutor_id'), LearnerTutor.learner_id, LearnerTutor.tutor_id,
+               LearnerTutor.completion_percentage.label('completion'))
+        .where(LearnerTutor.tutor_id.in_(tutor_ids), *learner_filter),
+        {'learner_tutor_id': 'int32', 'learner_id': 'int32', 'tutor_id': 'int32', 'completion': 'float32'}
+    )
+    # Sessions that were never ended count up to their last activity
+    last_activity = (
+        select(func.max(SessionActivity.timestamp))
+        .where(SessionActivity.session_id == LearnerSession.id)
+        .scalar_subquery()
+    )
+    sessions = _read(
+        select(LearnerSession.id.label('session_id'), LearnerTutor.learner_id, LearnerTutor.tutor_id,
+               _epoch(LearnerSession.start_time).label('start'), LearnerSession.duration_minutes,
+               case((LearnerSession.duration_minutes.is_(None), _epoch(last_activity))).label('last_activity'))
+        .join(LearnerTutor, LearnerTutor.id == LearnerSession.learner_tutor_id)
+        .where(LearnerTutor.tutor_id.in_(tutor_ids), *learner_filter),
+        {'session_id': 'int32', 'learner_id': 'int32', 'tutor_id': 'int32',
+         'start': 'float64', 'duration_minutes': 'float32', 'last_activity': 'float64'}
+    )
+    activities = _read(
+        select(SessionActivity.session_id, LearnerTutor.learner_id, LearnerTutor.tutor_id,
+               SessionActivity.activity_type, SessionActivity.score,
+               func.json_extract(SessionActivity.activity_data, literal_column("'$.module_id'")).label('module_id'))
+        .join(LearnerSession, LearnerSession.id == SessionActivity.session_id)
+        .join(LearnerTutor, LearnerTutor.id == LearnerSession.learner_tutor_id)
+        .where(LearnerTutor.tutor_id.in_(tutor_ids), *learner_filter),
+        {'session_id': 'int32', 'learner_id': 'int32', 'tutor_id': 'int32',
+         'activity_type': 'category', 'score': 'float32', 'module_id': 'Int32'}
+    )
+    metric_learner_filter = [PerformanceMetric.learner_id.in_(learner_ids)] if learner_ids is not None else []
+    metrics = _read(
+        select(PerformanceMetric.learner_id, PerformanceMetric.tutor_id, PerformanceMetric.metric_name,
+               PerformanceMetric.metric_value.label('value'))
+        .where(PerformanceMetric.tutor_id.in_(tutor_ids), *metric_learner_filter),
+        {'learner_id': 'int32', 'tutor_id': 'int32', 'metric_name': 'category', 'value': 'float64'}
+    )
+    activities['score'] = _normalize_scores(activities['score'])
+    return {'learner_tutors': learner_tutors, 'sessions': sessions, 'activities': activities, 'metrics': metrics}
+
+
+def _normalize_scores(scores):
+    return scores.where(scores <= 1, scores / 100).clip(0, 1)
+
+
+def _round(value, digits=3):
+    return None if value is None or pd.isna(value) else round(float(value), digits)
+
+
+def score_distribution(activities):
+    """Histogram and summary statistics of normalized activity scores."""
+    scores = activities['score'].dropna().to_numpy()
+    counts, _ = np.histogram(scores, bins=SCORE_BINS)
+    if not len(scores):
+        return {'count': 0, 'mean': None, 'std': None, 'quantiles': {}, 'histogram': counts.tolist()}
+    quantiles = np.quantile(scores, [0.25, 0.5, 0.75, 0.9])
+    return {
+        'count': int(len(scores)),
+        'mean': _round(scores.mean()),
+        'std': _round(scores.std()),
+        'quantiles': {label: _round(q) for label, q in zip(('p25', 'p50', 'p75', 'p90'), quantiles)},
+        'histogram': counts.tolist()
+    }
+
+
+def session_minutes(sessions):
+    """
+    Minutes spent in each session: the recorded duration of ended sessions, and
+    the time up to the last activity for sessions that were never ended.
+    """
+    open_minutes = (sessions['last_activity'] - sessions['start']) / 60
+    minutes = sessions['duration_minutes'].astype('float64').fillna(open_minutes).fillna(0)
+    return minutes.clip(lower=0)
+
+
+def time_on_task(sessions):
+    """Total and typical minutes per session and per learner."""
+    if sessions.empty:
+        return {'total_minutes': 0, 'sessions': 0, 'mean_session_minutes': None,
+                'median_session_minutes': None, 'mean_learner_minutes': None}
+    minutes = session_minutes(sessions)
+    per_learner = minutes.groupby(sessions['learner_id']).sum()
+    return {
+        'total_minutes': _round(minutes.sum(), 1),
+        'sessions': int(len(sessions)),
+        'mean_session_minutes': _round(minutes.mean(), 1),
+        'median_session_minutes': _round(minutes.median(), 1),
+        'mean_learner_minutes': _round(per_learner.mean(), 1)
+    }
+
+
+def completion_funnel(learner_tutors, sessions, activities):
+    """Learners reaching each stage: enrolled, started a session, recorded an activity, 50% and 100% complete."""
+    enrolled = learner_tutors[['learner_id', 'tutor_id']]
+    started = enrolled.merge(sessions[['learner_id', 'tutor_id']].drop_duplicates(), how='inner')
+    active = enrolled.merge(activities[['learner_id', 'tutor_id']].drop_duplicates(), how='inner')
+    counts = [
+        len(enrolled),
+        len(started),
+        len(active),
+        int((learner_tutors['completion'] >= 50).sum()),
+        int((learner_tutors['completion'] >= 100).sum())
+    ]
+    return [
+        {'stage': stage, 'learners': count,
+         'rate': _round(count / counts[0]) if counts[0] else None}
+        for stage, count in zip(FUNNEL_STAGES, counts)
+    ]
+
+
+def module_difficulty(activities):
+    """Per-module attempts, learners, mean score and difficulty (1 - mean score), hardest first."""
+    scored = activities.dropna(subset=['module_id', 'score'])
+    if scored.empty:
+        return []
+    grouped = scored.assign(failed=scored['score'] < 0.5).groupby('module_id', observed=True).agg(
+        attempts=('score', 'size'),
+        learners=('learner_id', 'nunique'),
+        mean_score=('score', 'mean'),
+        failure_rate=('failed', 'mean')
+    )
+    grouped['difficulty'] = 1 - grouped['mean_score']
+    grouped = grouped.sort_values('difficulty', ascending=False)
+    return [
+        {'module_id': int(module_id), 'attempts': int(row.attempts), 'learners': int(row.learners),
+         'mean_score': _round(row.mean_score), 'failure_rate': _round(row.failure_rate),
+         'difficulty': _round(row.difficulty)}
+        for module_id, row in grouped.iterrows()
+    ]
+
+
+def activity_mix(activities):
+    """Number of activities of each type."""
+    counts = activities['activity_type'].value_counts()
+    return {str(activity_type): int(count) for activity_type, count in counts.items() if count}
+
+
+def metric_summary(metrics):
+    """Count, mean, median and 90th percentile of each performance metric."""
+    if metrics.empty:
+        return {}
+    grouped = metrics.groupby('metric_name', observed=True)['value']
+    summary = pd.DataFrame({
+        'count': grouped.size(),
+        'mean': grouped.mean(),
+        'p50': grouped.median(),
+        'p90': grouped.quantile(0.9)
+    })
+    return {
+        str(name): {'count': int(row['count']), 'mean': _round(row['mean']),
+                    'p50': _round(row['p50']), 'p90': _round(row['p90'])}
+        for name, row in summary.iterrows()
+    }
+
+
+def summarize(frames):
+    """All statistics for one set of frames."""
+    learner_tutors, sessions = frames['learner_tutors'], frames['sessions']
+    activities, metrics = frames['activities'], frames['metrics']
+    return {
+        'learners': int(learner_tutors['learner_id'].nunique()),
+        'activities': int(len(activities)),
+        'scores': score_distribution(activities),
+        'time_on_task': time_on_task(sessions),
+        'funnel': completion_funnel(learner_tutors, sessions, activities),
+        'modules': module_difficulty(activities),
+        'activity_types': activity_mix(activities),
+        'metrics': metric_summary(metrics)
+    }
+
+
+def per_tutor_summary(frames):
+    """One compact row per tutor, computed with groupbys over the combined frames."""
+    learner_tutors, sessions, activities = frames['learner_tutors'], frames['sessions'], frames['activities']
+    minutes = session_minutes(sessions)
+    by_tutor = pd.DataFrame({
+        'learners': learner_tutors.groupby('tutor_id')['learner_id'].nunique(),
+        'completed': (learner_tutors['completion'] >= 100).groupby(learner_tutors['tutor_id']).sum(),
+        'mean_completion': learner_tutors.groupby('tutor_id')['completion'].mean(),
+        'sessions': sessions.groupby('tutor_id').size(),
+        'total_minutes': minutes.groupby(sessions['tutor_id']).sum(),
+        'activities': activities.groupby('tutor_id').size(),
+        'mean_score': activities.groupby('tutor_id')['score'].mean()
+    })
+    counts = ['learners', 'completed', 'sessions', 'activities']
+    by_tutor[counts] = by_tutor[counts].fillna(0)
+    return [
+        {'tutor_id': int(tutor_id), 'learners': int(row.learners), 'completed': int(row.completed),
+         'mean_completion': _round(row.mean_completion, 1), 'sessions': int(row.sessions),
+         'total_minutes': _round(row.total_minutes, 1) or 0, 'activities': int(row.activities),
+         'mean_score': _round(row.mean_score)}
+        for tutor_id, row in by_tutor.iterrows()
+    ]
+
+
+def tutor_analytics(tutor_id):
+    """Full statistics for one tutor."""
+    return summarize(load_frames([tutor_id]))
+
+
+def course_scope(course_id):
+    """The tutors assigned to a course and the learners actively enrolled in it, as (tutor_ids, learner_ids)."""
+    from models import CourseEnrollment, CourseTutor
+
+    tutor_ids = db.session.execute(select(CourseTutor.tutor_id).where(CourseTutor.course_id == course_id)).scalars().all()
+    learner_ids = db.session.execute(
+        select(CourseEnrollment.learner_id).where(CourseEnrollment.course_id == course_id,
+                                                  CourseEnrollment.is_active.is_(True))
+    ).scalars().all()
+    return tutor_ids, learner_ids
+
+
+def instructor_tutor_ids(instructor_id):
+    """Ids of all of an instructor's tutors."""
+    from models import Tutor
+
+    return db.session.execute(select(Tutor.id).where(Tutor.instructor_id == instructor_id)).scalars().all()
+
+
+def course_performance(course_id):
+    """Statistics across a course's tutors, restricted to the learners enrolled in the course."""
+    tutor_ids, learner_ids = course_scope(course_id)
+    frames = load_frames(tutor_ids, learner_ids)
+    performance = summarize(frames)
+    performance['enrolled_learners'] = len(learner_ids)
+    performance['tutors'] = per_tutor_summary(frames)
+    return performance
+
+
+def instructor_overview(instructor_id):
+    """Per-tutor statistics and totals across all of an instructor's tutors."""
+    frames = load_frames(instructor_tutor_ids(instructor_id))
+    overview = summarize(frames)
+    overview['tutors'] = per_tutor_summary(frames)
+    return overview
@@ -0,0 +1,194 @@
+"""
+Non-blocking sink for admin audit records.
+
+`Admin.log_action` hands records to the sink instead of adding an `AdminLog`
+to the request's session. A background worker drains the queue and writes
+the records in batched transactions, so audit volume never adds latency to
+admin requests. The queue is bounded; when it is full the configured overflow
+policy decides whether records are dropped or spilled to a JSON-lines file
+that is replayed the next time the worker starts.
+"""
+
+import atexit
+import json
+import logging
+import os
+import threading
+from collections import deque
+from datetime import datetime
+
+from database.db import db
+from database.sqlite_helpers import notify_model_write
+
+logger = logging.getLogger(__name__)
+
+OVERFLOW_POLICIES = ('drop_newest', 'drop_oldest', 'spill')
+
+
+class AuditSink:
+    """Bounded in-memory queue of audit records drained by a background writer thread."""
+
+    def __init__(self, max_queue=10000, batch_size=200, flush_interval=1.0,
+                 overflow_policy='spill', spill_path=None):
+        self.max_queue = max_queue
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.overflow_policy = overflow_policy
+        self.spill_path = spill_path
+        self.dropped = 0
+        self.app = None
+        self._queue = deque()
+        self._cond = threading.Condition()
+        self._write_lock = threading.Lock()
+        self._spill_lock = threading.Lock()
+        self._thread = None
+        self._stopping = False
+
+    def init_app(self, app):
+        """Read AUDIT_* settings from the app config and start the writer thread."""
+        if not app.config.get('AUDIT_ASYNC_ENABLED', True):
+            return
+
+        self.max_queue = app.config.get('AUDIT_QUEUE_MAXSIZE', self.max_queue)
+        self.batch_size = app.config.get('AUDIT_BATCH_SIZE', self.batch_size)
+        self.flush_interval = app.config.get('AUDIT_FLUSH_INTERVAL', self.flush_interval)
+        self.overflow_policy = app.config.get('AUDIT_OVERFLOW_POLICY', self.overflow_policy)
+        self.spill_path = app.config.get('AUDIT_SPILL_PATH', self.spill_path)
+        if self.overflow_policy not in OVERFLOW_POLICIES:
+            raise ValueError(f"AUDIT_OVERFLOW_POLICY must be one of: {', '.join(OVERFLOW_POLICIES)}")
+        if self.spill_path and not os.path.isabs(self.spill_path):
+            self.spill_path = os.path.join(app.root_path, self.spill_path)
+
+        self.app = app
+        app.extensions['audit_sink'] = self
+        self._stopping = False
+        self._thread = threading.Thread(target=self._run, name='audit-sink', daemon=True)
+        self._thread.start()
+        atexit.register(self.shutdown)
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive() and not self._stopping
+
+    def enqueue(self, record):
+        """
+        Queue an audit record for writing.
+
+        @param record (dict): AdminLog column values; 'timestamp' defaults to now.
+        @return (bool): False if the sink is not running and the caller should write synchronously.
+        """
+        if not self.running:
+            return False
+
+        record.setdefault('timestamp', datetime.utcnow())
+        overflow = None
+        with self._cond:
+            if len(self._queue) >= self.max_queue:
+                if self.overflow_policy == 'drop_oldest':
+                    self._queue.popleft()
+                    self.dropped += 1
+                elif self.overflow_policy == 'drop_newest':
+                    self.dropped += 1
+                    return True
+                else:
+                    overflow = record
+            if overflow is None:
+                self._queue.append(record)
+                if len(self._queue) >= self.batch_size:
+                    self._cond.notify()
+
+        if overflow is not None:
+            self._spill([overflow])
+        return True
+
+    def flush(self):
+        """Write everything currently queued, blocking until done."""
+        while True:
+            batch = self._take(self.batch_size)
+            if not batch:
+                return
+            self._write(batch)
+
+    def shutdown(self):
+        """Stop the writer thread and flush pending records (registered with atexit)."""
+        if self._thread is None:
+            return
+        with self._cond:
+            self._stopping = True
+            self._cond.notify()
+        self._thread.join(timeout=max(self.flush_interval * 5, 5))
+        self._thread = None
+        self.flush()
+
+    def _take(self, limit):
+        with self._cond:
+            batch = []
+            while self._queue and len(batch) < limit:
+                batch.append(self._queue.popleft())
+            return batch
+
+    def _run(self):
+        self._replay_spill()
+        while True:
+            with self._cond:
+                if not self._stopping and len(self._queue) < self.batch_size:
+                    self._cond.wait(self.flush_interval)
+                stopping = self._stopping
+            self.flush()
+            if stopping:
+                return
+
+    def _write(self, batch):
+        from models import AdminLog
+
+        with self._write_lock, self.app.app_context():
+            try:
+                db.session.execute(AdminLog.__table__.insert(), batch)
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                logger.exception("Failed to write %d audit records", len(batch))
+                if self.spill_path:
+                    self._spill(batch)
+                else:
+                    self.dropped += len(batch)
+                return
+            finally:
+                db.session.remove()
+        notify_model_write(AdminLog.__tablename__)
+
+    def _spill(self, records):
+        if not self.spill_path:
+            self.dropped += len(records)
+            return
+        with self._spill_lock:
+            os.makedirs(os.path.dirname(self.spill_path), exist_ok=True)
+            with open(self.spill_path, 'a', encoding='utf-8') as f:
+                for record in records:
+                    f.write(json.dumps(dict(record, timestamp=record['timestamp'].isoformat())) + '\n')
+
+    def _replay_spill(self):
+        """Write records spilled by a previous run, then remove the spill file."""
+        if not self.spill_path or not os.path.exists(self.spill_path):
+            return
+        with self._spill_lock:
+            replay_path = self.spill_path + '.replay'
+            os.replace(self.spill_path, replay_path)
+        batch = []
+        with open(replay_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                record['timestamp'] = datetime.fromisoformat(record['timestamp'])
+                batch.append(record)
+                if len(batch) >= self.batch_size:
+                    self._write(batch)
+                    batch = []
+        if batch:
+            self._write(batch)
+        os.remove(replay_path)
+        logger.info("Replayed spilled audit records from %s", replay_path)
+
+
+audit_sink = AuditSink()
@@ -1,7 +1,7 @@
 # database/client.py
 
 from sqlalchemy import or_, desc, func
-from werkzeug.security import generate_password_hash
+from database.passwords import password_hasher
 from sqlalchemy.inspection import inspect
 
 class SQLiteDatabaseClient:
@@ -46,7 +46,7 @@ class SQLiteDatabaseClient:
 
             # Special handling for password hashing
             if 'password' in data:
-                data['password_hash'] = generate_password_hash(data.pop('password'))
+                data['password_hash'] = password_hasher.hash(data.pop('password'))
 
             new_record = model(**data)
             self.session.add(new_record)
@@ -107,7 +107,8 @@ class SQLiteDatabaseClient:
                 return None
 
             for key, value in data.items():
-                if hasattr(record, key):
+                # Check the class so deferred columns are not loaded just to be overwritten
+                if hasattr(type(record), key):
                     setattr(record, key, value)
 
             self.session.commit()
@@ -0,0 +1,177 @@
+"""
+Transparent compression for large text columns.
+
+Columns declared with `CompressedText` store values above a size threshold as
+a BLOB made of a small header and the compressed UTF-8 payload:
+
+    b'\\x1fTZ' | format version (1 byte) | codec (1 byte) | payload
+
+Smaller values are stored as plain text, so existing rows stay readable and
+SQL on short values keeps working. zstd is used when the `zstandard` package
+is installed, zlib otherwise. Values are decompressed when the column is
+loaded, which for the deferred blob columns means on first access.
+"""
+
+import logging
+import zlib
+
+from sqlalchemy.types import Text, TypeDecorator
+
+try:
+    import zstandard
+except ImportError:  # optional dependency
+    zstandard = None
+
+from database.db import db
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'\x1fTZ'
+FORMAT_VERSION = 1
+CODEC_ZLIB = ord('z')
+CODEC_ZSTD = ord('s')
+
+_settings = {
+    'threshold': 4096,  # bytes of UTF-8 before a value is compressed
+    'codec': 'auto',    # 'auto', 'zlib' or 'zstd'
+    'level': 6
+}
+
+
+def configure_compression(app):
+    """Read BLOB_COMPRESSION_* settings from the app config."""
+    _settings['threshold'] = app.config.get('BLOB_COMPRESSION_THRESHOLD', _settings['threshold'])
+    _settings['codec'] = app.config.get('BLOB_COMPRESSION_CODEC', _settings['codec'])
+    _settings['level'] = app.config.get('BLOB_COMPRESSION_LEVEL', _settings['level'])
+    if _settings['codec'] == 'zstd' and zstandard is None:
+        raise RuntimeError("BLOB_COMPRESSION_CODEC is 'zstd' but the zstandard package is not installed")
+
+
+def _codec():
+    if _settings['codec'] == 'zlib' or (_settings['codec'] == 'auto' and zstandard is None):
+        return CODEC_ZLIB
+    return CODEC_ZSTD
+
+
+def is_compressed(value):
+    """Check whether a stored value carries the compression header."""
+    return isinstance(value, (bytes, bytearray, memoryview)) and bytes(value[:3]) == MAGIC
+
+
+def compress_text(value):
+    """
+    Encode a text value for storage.
+
+    @param value (str): The value to store.
+    @return: The value unchanged if it is below the threshold, otherwise header + compressed bytes.
+    """
+    if value is None or not isinstance(value, str):
+        return value
+    raw = value.encode('utf-8')
+    if len(raw) < _settings['threshold']:
+        return value
+
+    codec = _codec()
+    if codec == CODEC_ZSTD:
+        payload = zstandard.ZstdCompressor(level=_settings['level']).compress(raw)
+    else:
+        payload = zlib.compress(raw, _settings['level'])
+    if len(payload) + len(MAGIC) + 2 >= len(raw):
+        return value  # incompressible, keep it readable
+    return MAGIC + bytes((FORMAT_VERSION, codec)) + payload
+
+
+def decompress_value(value):
+    """
+    Decode a stored value back into text.
+
+    @param value: A plain string or a compressed BLOB written by compress_text.
+    @return (str): The original text.
+    @raises ValueError: If the header has an unknown version or codec.
+    """
+    if not is_compressed(value):
+        if isinstance(value, (bytes, bytearray, memoryview)):
+            return bytes(value).decode('utf-8')
+        return value
+
+    data = bytes(value)
+    version, codec = data[3], data[4]
+    if version != FORMAT_VERSION:
+        raise ValueError(f"Unsupported compressed value version: {version}")
+    payload = data[5:]
+    if codec == CODEC_ZLIB:
+        return zlib.decompress(payload).decode('utf-8')
+    if codec == CODEC_ZSTD:
+        if zstandard is None:
+            raise ValueError("Value is zstd-compressed but the zstandard package is not installed")
+        return zstandard.ZstdDecompressor().decompress(payload).decode('utf-8')
+    raise ValueError(f"Unsupported compression codec: {codec!r}")
+
+
+class CompressedText(TypeDecorator):
+    """Text column that transparently compresses values above the configured threshold."""
+
+    impl = Text
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        return compress_text(value)
+
+    def process_result_value(self, value, dialect):
+        return decompress_value(value)
+
+
+def compressed_columns():
+    """List (table, column) pairs declared with CompressedText."""
+    return [
+        (table, column)
+        for table in db.Model.metadata.sorted_tables
+        for column in table.columns
+        if isinstance(column.type, CompressedText)
+    ]
+
+
+def compress_existing_rows(app, batch_size=200):
+    """
+    One-time migration compressing existing plain-text rows of every
+    CompressedText column. Each batch is written in its own transaction,
+    so the command can be interrupted and re-run.
+
+    @return (dict): 'table.column' -> number of rows compressed.
+    """
+    results = {}
+    with app.app_context():
+        for table, column in compressed_columns():
+            pk = list(table.primary_key.columns)[0]
+            select_sql = db.text(
+                f"SELECT {pk.name}, {column.name} FROM {table.name} "
+                f"WHERE {pk.name} > :last_id AND typeof({column.name}) = 'text' "
+                f"AND length(CAST({column.name} AS BLOB)) >= :threshold "
+                f"ORDER BY {pk.name} LIMIT :limit"
+            )
+            update_sql = db.text(f"UPDATE {table.name} SET {column.name} = :value WHERE {pk.name} = :id")
+
+            compressed = 0
+            last_id = 0
+            while True:
+                with db.engine.begin() as conn:
+                    rows = conn.execute(select_sql, {
+                        'last_id': last_id,
+                        'threshold': _settings['threshold'],
+                        'limit': batch_size
+                    }).fetchall()
+                    if not rows:
+                        break
+                    updates = []
+                    for row_id, value in rows:
+                        encoded = compress_text(value)
+                        if encoded is not value:
+                            updates.append({'id': row_id, 'value': encoded})
+                    if updates:
+                        conn.execute(update_sql, updates)
+                    compressed += len(updates)
+                    last_id = rows[-1][0]
+
+            results[f"{table.name}.{column.name}"] = compressed
+            logger.info("Compressed %d rows in %s.%s", compressed, table.name, column.name)
+    return results
@@ -7,6 +7,77 @@ import time
 # Initialize SQLAlchemy instance
 db = SQLAlchemy()
 
+SCHEMA_DIR = os.path.join(os.path.dirname(__file__), 'schema')
+
+# Columns added to tables that existing databases already have. CREATE TABLE IF NOT
+# EXISTS leaves those tables as they are, so the columns are added with ALTER TABLE.
+# Each entry is (table, column, column definition); the definition must also be in
+# the table's CREATE TABLE statement for new databases.
+COLUMN_MIGRATIONS = [
+    ('tutors', 'revision_id', 'INTEGER'),
+    ('tutors', 'cloned_from_id', 'INTEGER'),
+    ('tutors', 'is_materialized', 'INTEGER DEFAULT 1'),
+    ('learners', 'grade_level', 'TEXT'),
+    ('learners', 'learning_preferences', "TEXT DEFAULT '{}'"),
+    ('courses', 'course_code', 'TEXT'),  # unique through idx_courses_course_code
+    ('learner_tutor_progress', 'last_score_at', 'TIMESTAMP'),
+]
+
+
+def schema_statements():
+    """Yield (file, statement) for every statement in the schema/*.sql files, in file order."""
+    for sql_file in sorted(glob.glob(os.path.join(SCHEMA_DIR, '*.sql'))):
+        with open(sql_file, 'r') as f:
+            sql_content = f.read()
+        for statement in sql_content.split(';'):
+            if statement.strip():
+                yield sql_file, statement
+
+
+def migrate_columns(conn):
+    """
+    Add the COLUMN_MIGRATIONS columns that existing tables lack. Tables that do
+    not exist yet are skipped; their CREATE TABLE statement has the columns.
+
+    @param conn (Connection): An open transaction.
+    @return (list): The added columns as 'table.column'.
+    """
+    added = []
+    for table, column, definition in COLUMN_MIGRATIONS:
+        existing = {row[1] for row in conn.execute(db.text(f"PRAGMA table_info({table})"))}
+        if existing and column not in existing:
+            conn.execute(db.text(f"ALTER TABLE {table} ADD COLUMN {column} {definition}"))
+            added.append(f"{table}.{column}")
+    return added
+
+
+def apply_schema_updates(app):
+    """
+    Create the tables and indexes added to the schema files since an existing
+    database was initialized. Every schema statement is CREATE ... IF NOT EXISTS,
+    so statements for objects that already exist do nothing. Columns added to
+    existing tables are migrated first, since new indexes may cover them.
+
+    @return (int): The number of statements that failed (each is logged).
+    """
+    failed = 0
+    with app.app_context():
+        try:
+            with db.engine.begin() as conn:
+                for column in migrate_columns(conn):
+                    app.logger.info(f"Added column {column}")
+        except Exception as e:
+            failed += 1
+            app.logger.warning(f"Column migration failed: {e}")
+        for sql_file, statement in schema_statements():
+            try:
+                with db.engine.begin() as conn:
+                    conn.execute(db.text(statement))
+            except Exception as e:
+                failed += 1
+                app.logger.warning(f"Schema statement in {os.path.basename(sql_file)} failed: {e}")
+    return failed
+
 def init_db_if_needed(app):
     """
     Checks if the database exists. If not, it calls force_init_db to create it.
@@ -25,7 +96,8 @@ def init_db_if_needed(app):
             app.logger.info("Database not found. Initializing...")
             force_init_db(app)
         else:
-            app.logger.info("Database already exists. Skipping initialization.")
+            app.logger.info("Database already exists. Applying schema updates.")
+            apply_schema_updates(app)
 
 
 def force_init_db(app):
@@ -62,25 +134,23 @@ def force_init_db(app):
                     app.logger.error(f"Cannot create SQLite file at {db_path}: {ioe}")
                     return False
 
-                schema_dir = os.path.join(os.path.dirname(__file__), 'schema')
-                sql_files = sorted(glob.glob(os.path.join(schema_dir, '*.sql')))
-
-                if not sql_files:
-                    app.logger.warning(f"No SQL files found in {schema_dir}. Database will be empty.")
+                if not glob.glob(os.path.join(SCHEMA_DIR, '*.sql')):
+                    app.logger.warning(f"No SQL files found in {SCHEMA_DIR}. Database will be empty.")
                     return True
 
                 # Use the SQLAlchemy engine to execute schema statements
                 with db.engine.connect() as conn:
                     # Begin a transaction
                     with conn.begin():
-                        for sql_file in sql_files:
-                            app.logger.info(f"Executing SQL file: {sql_file}")
-                            with open(sql_file, 'r') as f:
-                                sql_content = f.read()
-                                # Execute each statement separately
-                                for statement in sql_content.split(';'):
-                                    if statement.strip():
-                                        conn.execute(db.text(statement))
+                        # An existing database may predate some columns the indexes cover
+                        migrate_columns(conn)
+                        current_file = None
+                        # Execute each statement separately
+                        for sql_file, statement in schema_statements():
+                            if sql_file != current_file:
+                                app.logger.info(f"Executing SQL file: {sql_file}")
+                                current_file = sql_file
+                            conn.execute(db.text(statement))
 
                 app.logger.info("Database schema initialized successfully")
                 return True
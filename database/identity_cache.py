@@ -0,0 +1,266 @@
+"""
+Shared cache for resolving user, admin, instructor and learner ids to display names,
+and for the authenticated principal of a request.
+
+Admin and listing endpoints used to walk `row.admin.user.full_name` (or call
+`Admin.query.get`) once per row. The cache resolves a whole page of ids with a
+single query and keeps the results until a committed write touches the
+underlying user or profile row.
+
+`principal(user_id)` returns the user's role, active flag and role-specific
+profile ids for authorization checks. It is memoized on `flask.g` for the
+request and in a short-TTL process cache, so admin_required, the Flask-Login
+user loader, /auth/me and /auth/refresh normally cost no query. Committed
+writes to the user or its profiles drop the entry; the TTL bounds how long
+other processes can serve a stale entry.
+"""
+
+import threading
+import time
+
+from flask import g, has_request_context
+
+from database.db import db
+from database.sqlite_helpers import subscribe_model_writes
+
+UNKNOWN_NAME = "Unknown"
+
+# Profile tables whose rows map onto a user through a user_id column
+_PROFILE_TABLES = ('admins', 'instructors', 'learners')
+
+
+class Principal:
+    """Authorization-relevant snapshot of a user and its role profiles."""
+
+    __slots__ = ('id', 'email', 'first_name', 'last_name', 'role', 'active', 'created_at', 'last_login',
+                 'instructor_id', 'institution', 'department', 'learner_id', 'grade_level',
+                 'admin_id', 'admin_level')
+
+    def __init__(self, **fields):
+        for name in self.__slots__:
+            setattr(self, name, fields.get(name))
+
+    @property
+    def full_name(self):
+        return f"{self.first_name} {self.last_name}"
+
+    # Flask-Login user interface
+    is_authenticated = True
+    is_anonymous = False
+
+    @property
+    def is_active(self):
+        return bool(self.active)
+
+    def get_id(self):
+        return str(self.id)
+
+    def profile_id(self, table_name):
+        """The id of this user's row in a profile table, if any."""
+        return {'instructors': self.instructor_id, 'learners': self.learner_id, 'admins': self.admin_id}.get(table_name)
+
+    def to_dict(self):
+        """Serialize like routes.auth.get_user_data."""
+        data = {
+            'id': self.id,
+            'email': self.email,
+            'first_name': self.first_name,
+            'last_name': self.last_name,
+            'role': self.role,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'last_login': self.last_login.isoformat() if self.last_login else None,
+            'is_active': self.is_active
+        }
+        if self.role == 'instructor' and self.instructor_id is not None:
+            data['instructor_id'] = self.instructor_id
+            data['institution'] = self.institution
+            data['department'] = self.department
+        elif self.role == 'learner' and self.learner_id is not None:
+            data['learner_id'] = self.learner_id
+            data['grade_level'] = self.grade_level
+        return data
+
+    def __repr__(self):
+        return f"<Principal {self.id}: {self.role}>"
+
+
+class IdentityCache:
+    """Process-wide cache of user display names and profile-to-user mappings."""
+
+    def __init__(self, max_entries=10000, principal_ttl=30):
+        self.max_entries = max_entries
+        self.principal_ttl = principal_ttl
+        self._user_names = {}      # user_id -> full name
+        self._profile_users = {}   # (table_name, profile_id) -> user_id
+        self._principals = {}      # user_id -> (expires_at, Principal)
+        self._principal_generation = 0
+        self._lock = threading.RLock()
+
+    def user_names(self, user_ids):
+        """
+        Resolve user ids to full names.
+
+        @param user_ids: An iterable of user ids (None entries are ignored).
+        @return (dict): user_id -> full name for every id that exists.
+        """
+        wanted = {user_id for user_id in user_ids if user_id is not None}
+        with self._lock:
+            found = {user_id: self._user_names[user_id] for user_id in wanted if user_id in self._user_names}
+        missing = wanted - found.keys()
+        if missing:
+            from models import User
+            rows = db.session.query(User.id, User.first_name, User.last_name).filter(User.id.in_(missing)).all()
+            loaded = {user_id: f"{first_name} {last_name}" for user_id, first_name, last_name in rows}
+            self._store(self._user_names, loaded)
+            found.update(loaded)
+        return found
+
+    def profile_names(self, model, profile_ids):
+        """
+        Resolve admin/instructor/learner ids to the full name of their user.
+
+        @param model: A profile model with a user_id column (Admin, Instructor or Learner).
+        @param profile_ids: An iterable of profile ids.
+        @return (dict): profile_id -> full name for every profile that exists.
+        """
+        table_name = model.__tablename__
+        wanted = {profile_id for profile_id in profile_ids if profile_id is not None}
+        with self._lock:
+            user_ids = {
+                profile_id: self._profile_users[(table_name, profile_id)]
+                for profile_id in wanted if (table_name, profile_id) in self._profile_users
+            }
+        missing = wanted - user_ids.keys()
+        if missing:
+            from models import User
+            rows = db.session.query(model.id, User.id, User.first_name, User.last_name) \
+                .join(User, model.user_id == User.id) \
+                .filter(model.id.in_(missing)).all()
+            self._store(self._profile_users, {(table_name, profile_id): user_id for profile_id, user_id, _, _ in rows})
+            self._store(self._user_names, {user_id: f"{first} {last}" for _, user_id, first, last in rows})
+            user_ids.update({profile_id: user_id for profile_id, user_id, _, _ in rows})
+
+        names = self.user_names(user_ids.values())
+        return {profile_id: names[user_id] for profile_id, user_id in user_ids.items() if user_id in names}
+
+    def admin_names(self, admin_ids):
+        """Resolve admin ids to full names."""
+        from models import Admin
+        return self.profile_names(Admin, admin_ids)
+
+    def instructor_names(self, instructor_ids):
+        """Resolve instructor ids to full names."""
+        from models import Instructor
+        return self.profile_names(Instructor, instructor_ids)
+
+    def principal(self, user_id):
+        """
+        Get the principal for a user id (e.g. a JWT identity).
+
+        @param user_id: The user's id, as an int or numeric string.
+        @return (Principal): The principal, or None if the user does not exist.
+        """
+        try:
+            user_id = int(user_id)
+        except (TypeError, ValueError):
+            return None
+
+        request_cache = g.setdefault('_principals', {}) if has_request_context() else {}
+        if user_id in request_cache:
+            return request_cache[user_id]
+
+        with self._lock:
+            cached = self._principals.get(user_id)
+            generation = self._principal_generation
+        if cached is not None and cached[0] > time.monotonic():
+            principal = cached[1]
+        else:
+            principal = self._load_principal(user_id)
+            with self._lock:
+                # Skip storing if a write invalidated principals while this one was loading
+                if self._principal_generation == generation:
+                    if len(self._principals) >= self.max_entries:
+                        self._principals.clear()
+                    self._principals[user_id] = (time.monotonic() + self.principal_ttl, principal)
+
+        request_cache[user_id] = principal
+        return principal
+
+    def _load_principal(self, user_id):
+        from models import User, Instructor, Learner, Admin
+        row = db.session.query(
+            User.id, User.email, User.first_name, User.last_name, User.role, User.is_active,
+            User.created_at, User.last_login,
+            Instructor.id, Instructor.institution, Instructor.department,
+            Learner.id, Learner.grade_level,
+            Admin.id, Admin.admin_level
+        ).outerjoin(Instructor, Instructor.user_id == User.id) \
+         .outerjoin(Learner, Learner.user_id == User.id) \
+         .outerjoin(Admin, Admin.user_id == User.id) \
+         .filter(User.id == user_id).first()
+        if row is None:
+            return None
+        return Principal(**dict(zip(Principal.__slots__, row)))
+
+    def invalidate_principal(self, user_id=None):
+        """Drop a cached principal, or all of them when user_id is None."""
+        with self._lock:
+            self._principal_generation += 1
+            if user_id is None:
+                self._principals.clear()
+            else:
+                self._principals.pop(user_id, None)
+        if has_request_context():
+            g.pop('_principals', None)
+
+    def _principal_for_profile(self, table_name, profile_id):
+        with self._lock:
+            user_id = self._profile_users.get((table_name, profile_id))
+            if user_id is None:
+                user_id = next(
+                    (uid for uid, (_, principal) in self._principals.items()
+                     if principal is not None and principal.profile_id(table_name) == profile_id),
+                    None
+                )
+        return user_id
+
+    def invalidate_user(self, user_id):
+        """Drop a cached user name and principal."""
+        with self._lock:
+            self._user_names.pop(user_id, None)
+        self.invalidate_principal(user_id)
+
+    def invalidate_profile(self, table_name, profile_id):
+        """Drop a cached profile-to-user mapping and the principal it belongs to."""
+        user_id = self._principal_for_profile(table_name, profile_id)
+        with self._lock:
+            self._profile_users.pop((table_name, profile_id), None)
+        # An unknown profile may be new, e.g. a role change, so every principal is suspect
+        self.invalidate_principal(user_id)
+
+    def clear(self):
+        """Drop every cached entry."""
+        with self._lock:
+            self._user_names.clear()
+            self._profile_users.clear()
+        self.invalidate_principal()
+
+    def _store(self, mapping, entries):
+        with self._lock:
+            # Entries are cheap to rebuild, so a full reset is enough to bound memory
+            if len(mapping) + len(entries) > self.max_entries:
+                mapping.clear()
+            mapping.update(entries)
+
+
+identity_cache = IdentityCache()
+
+
+@subscribe_model_writes
+def _invalidate_on_write(table_name, row_id):
+    if row_id is None and (table_name == 'users' or table_name in _PROFILE_TABLES):
+        identity_cache.clear()
+    elif table_name == 'users':
+        identity_cache.invalidate_user(row_id)
+    elif table_name in _PROFILE_TABLES:
+        identity_cache.invalidate_profile(table_name, row_id)
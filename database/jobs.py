@@ -0,0 +1,472 @@
+"""
+In-process background job scheduler.
+
+Jobs are rows in the `jobs` table, so queued work survives restarts and is
+shared by every worker process. Each process runs JOB_WORKERS threads. A
+worker claims the highest-priority due job with one UPDATE ... RETURNING, so
+two workers never claim the same job.
+
+- Handlers are registered by name with `job_scheduler.register` and receive
+  the job's payload and a `JobContext` for reporting progress.
+- A job key deduplicates work: while a job with a given key is queued or
+  running, enqueueing the same key returns the existing job (a partial unique
+  index enforces this).
+- A failed job is retried with exponential backoff until it has run
+  max_attempts times.
+- While a handler runs, its worker renews the job's heartbeat every third of
+  JOB_LEASE_TIMEOUT. A job whose heartbeat is older than JOB_LEASE_TIMEOUT (its
+  process died) is put back in the queue, or marked failed once it has run
+  max_attempts times. A worker only records the outcome of the attempt it
+  claimed, so a worker whose lease expired cannot overwrite a later attempt.
+- Progress is saved on the job row and pushed over Socket.IO as `job_progress`
+  to the room `job_<id>`, which clients join with the `watch_job` event.
+- Handlers registered with `every=` are enqueued periodically. The last
+  enqueue time is an `aggregate_watermarks` row per job, claimed with a
+  conditional UPDATE, so the schedule survives restarts and only one process
+  enqueues each period.
+
+The built-in jobs at the bottom of this module build analytics reports, run the
+progress rollups, refit knowledge tracing and purge expired rows, keeping that
+work off the request path.
+"""
+
+import json
+import logging
+import threading
+import time
+import traceback
+from datetime import datetime, timedelta
+
+from sqlalchemy import and_, insert, select, update
+from sqlalchemy.exc import IntegrityError
+
+from database.db import db
+from database.sqlite_helpers import notify_model_write
+
+logger = logging.getLogger(__name__)
+
+JOB_STATUSES = ('queued', 'running', 'succeeded', 'failed')
+
+
+def job_room(job_id):
+    """Socket.IO room receiving a job's progress events."""
+    return f"job_{job_id}"
+
+
+class JobContext:
+    """Passed to a job handler to report progress."""
+
+    def __init__(self, scheduler, job_id, user_id, attempt):
+        self.scheduler = scheduler
+        self.job_id = job_id
+        self.user_id = user_id
+        self.attempt = attempt
+        self._last_saved = 0.0
+
+    def progress(self, fraction, message=None):
+        """
+        Report progress. Always pushed to watchers; saved to the job row at most
+        every JOB_PROGRESS_INTERVAL seconds.
+
+        @param fraction (float): Work done so far, from 0 to 1.
+        @param message (str): Optional human-readable status.
+        """
+        fraction = min(max(float(fraction), 0.0), 1.0)
+        now = time.monotonic()
+        if now - self._last_saved >= self.scheduler.progress_interval or fraction >= 1.0:
+            self._last_saved = now
+            self.scheduler._update(self.job_id, self.attempt, progress=fraction, message=message,
+                                   heartbeat_at=datetime.utcnow())
+        self.scheduler._emit(self.job_id, {'status': 'running', 'progress': fraction, 'message': message})
+
+
+class JobScheduler:
+    """Runs registered job handlers from the jobs table on a pool of worker threads."""
+
+    def __init__(self, workers=2, poll_interval=1.0, lease_timeout=300, retry_backoff=5.0,
+                 progress_interval=1.0, retention=timedelta(days=7)):
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self.lease_timeout = lease_timeout
+        self.retry_backoff = retry_backoff
+        self.progress_interval = progress_interval
+        self.retention = retention
+        self.app = None
+        self.socketio = None
+        self._handlers = {}
+        self._periodic = {}  # name -> (interval seconds, payload)
+        self._threads = []
+        self._wake = threading.Condition()
+        self._stopping = False
+
+    def register(self, name, every=None, payload=None, priority=0, max_attempts=3):
+        """
+        Decorator registering a job handler `fn(payload, ctx)`. Its return value
+        (JSON-serializable) is stored as the job's result.
+
+        @param name (str): Name jobs are enqueued under.
+        @param every (float): If set, enqueue this job every `every` seconds (deduplicated by name).
+        """
+        def decorator(fn):
+            self._handlers[name] = (fn, priority, max_attempts)
+            if every:
+                self._periodic[name] = (every, payload or {})
+            return fn
+        return decorator
+
+    def init_app(self, app):
+        """Read JOB_* settings from the app config and start the worker threads."""
+        self.workers = app.config.get('JOB_WORKERS', self.workers)
+        self.poll_interval = app.config.get('JOB_POLL_INTERVAL', self.poll_interval)
+        self.lease_timeout = app.config.get('JOB_LEASE_TIMEOUT', self.lease_timeout)
+        self.retry_backoff = app.config.get('JOB_RETRY_BACKOFF', self.retry_backoff)
+        self.progress_interval = app.config.get('JOB_PROGRESS_INTERVAL', self.progress_interval)
+        self.retention = app.config.get('JOB_RETENTION', self.retention)
+        self.app = app
+        self.socketio = app.extensions.get('socketio')
+        app.extensions['job_scheduler'] = self
+        if not app.config.get('JOBS_ENABLED', True) or self.workers <= 0:
+            return
+
+        self._stopping = False
+        self._threads = [
+            threading.Thread(target=self._run, name=f'job-worker-{i}', daemon=True) for i in range(self.workers)
+        ]
+        self._threads.append(threading.Thread(target=self._run_maintenance, name='job-maintenance', daemon=True))
+        for thread in self._threads:
+            thread.start()
+
+    def shutdown(self):
+        """Stop the worker threads once their current jobs finish."""
+        with self._wake:
+            self._stopping = True
+            self._wake.notify_all()
+        for thread in self._threads:
+            thread.join(timeout=5)
+        self._threads = []
+
+    # Queue
+
+    def enqueue(self, name, payload=None, key=None, priority=None, max_attempts=None, user_id=None, delay=0):
+        """
+        Queue a job.
+
+        @param name (str): A registered handler name.
+        @param payload (dict): JSON-serializable arguments for the handler.
+        @param key (str): Deduplication key; if a job with this key is queued or running, that job is returned.
+        @param priority (int): Higher runs first; defaults to the handler's registered priority.
+        @param max_attempts (int): Runs before the job is marked failed.
+        @param user_id (int): The user the job runs for.
+        @param delay (float): Seconds before the job may start.
+        @return (tuple): (job id, created) where created is False for a deduplicated job.
+        """
+        from models import Job
+
+        if name not in self._handlers:
+            raise ValueError(f"Unknown job: {name}")
+        _, default_priority, default_attempts = self._handlers[name]
+        table = Job.__table__
+        now = datetime.utcnow()
+        try:
+            with db.engine.begin() as conn:
+                job_id = conn.execute(table.insert().returning(table.c.id), {
+                    'name': name,
+                    'job_key': key,
+                    'payload': json.dumps(payload or {}),
+                    'priority': default_priority if priority is None else priority,
+                    'status': 'queued',
+                    'attempts': 0,
+                    'max_attempts': default_attempts if max_attempts is None else max_attempts,
+                    'run_after': now + timedelta(seconds=delay),
+                    'progress': 0,
+                    'user_id': user_id,
+                    'created_at': now
+                }).scalar()
+        except IntegrityError:
+            with db.engine.connect() as conn:
+                existing = conn.execute(
+                    select(table.c.id).where(table.c.job_key == key, table.c.status.in_(('queued', 'running')))
+                ).scalar()
+            if existing is not None:
+                return existing, False
+            raise
+        notify_model_write(Job.__tablename__, job_id)
+        with self._wake:
+            self._wake.notify()
+        return job_id, True
+
+    def get(self, job_id):
+        """The job row as a dict, or None."""
+        from models import Job
+
+        job = db.session.get(Job, job_id)
+        return job.to_dict() if job else None
+
+    # Workers
+
+    def _run(self):
+        while True:
+            with self._wake:
+                if self._stopping:
+                    return
+            try:
+                with self.app.app_context():
+                    claimed = self._claim()
+                    if claimed is not None:
+                        self._execute(*claimed)
+                        continue
+            except Exception:
+                logger.exception("Job worker failed")
+            with self._wake:
+                if not self._stopping:
+                    self._wake.wait(self.poll_interval)
+
+    def _claim(self):
+        from models import Job
+
+        table = Job.__table__
+        now = datetime.utcnow()
+        next_job = (
+            select(table.c.id)
+            .where(table.c.status == 'queued', table.c.run_after <= now, table.c.name.in_(list(self._handlers)))
+            .order_by(table.c.priority.desc(), table.c.id)
+            .limit(1)
+            .scalar_subquery()
+        )
+        with db.engine.begin() as conn:
+            row = conn.execute(
+                update(table)
+                .where(table.c.id == next_job, table.c.status == 'queued')
+                .values(status='running', attempts=table.c.attempts + 1, started_at=now, heartbeat_at=now,
+                        progress=0, error=None)
+                .returning(table.c.id, table.c.name, table.c.payload, table.c.attempts, table.c.max_attempts,
+                           table.c.user_id)
+            ).first()
+        return tuple(row) if row else None
+
+    def _execute(self, job_id, name, payload, attempt, max_attempts, user_id):
+        handler = self._handlers[name][0]
+        ctx = JobContext(self, job_id, user_id, attempt)
+        self._emit(job_id, {'status': 'running', 'progress': 0, 'attempt': attempt})
+        stop = threading.Event()
+        heartbeat = threading.Thread(target=self._heartbeat, args=(job_id, attempt, stop),
+                                     name=f'job-heartbeat-{job_id}', daemon=True)
+        heartbeat.start()
+        try:
+            result = handler(json.loads(payload or '{}'), ctx)
+        except Exception as e:
+            db.session.rollback()
+            error = ''.join(traceback.format_exception_only(type(e), e)).strip()
+            if attempt < max_attempts:
+                backoff = self.retry_backoff * 2 ** (attempt - 1)
+                logger.warning("Job %s (%s) failed on attempt %d, retrying in %.0fs: %s",
+                               job_id, name, attempt, backoff, error)
+                if self._update(job_id, attempt, status='queued', error=error,
+                                run_after=datetime.utcnow() + timedelta(seconds=backoff)):
+                    self._emit(job_id, {'status': 'queued', 'error': error, 'retry_in': backoff})
+            else:
+                logger.error("Job %s (%s) failed after %d attempts: %s", job_id, name, attempt, error)
+                if self._update(job_id, attempt, status='failed', error=error, finished_at=datetime.utcnow()):
+                    self._emit(job_id, {'status': 'failed', 'error': error})
+            return
+        finally:
+            stop.set()
+            heartbeat.join()
+            db.session.remove()
+
+        if self._update(job_id, attempt, status='succeeded', progress=1.0, result=json.dumps(result, default=str),
+                        finished_at=datetime.utcnow()):
+            self._emit(job_id, {'status': 'succeeded', 'progress': 1.0})
+        else:
+            logger.warning("Job %s (%s) finished after its lease expired; result discarded", job_id, name)
+
+    def _heartbeat(self, job_id, attempt, stop):
+        """Renew a running job's lease until `stop` is set, however long its handler runs."""
+        while not stop.wait(self.lease_timeout / 3):
+            try:
+                with self.app.app_context():
+                    if not self._update(job_id, attempt, notify=False, heartbeat_at=datetime.utcnow()):
+                        return  # the lease expired and the job was requeued
+            except Exception:
+                logger.exception("Failed to renew the lease of job %s", job_id)
+
+    def _update(self, job_id, attempt, notify=True, **values):
+        """
+        Update a job row, if it is still running the given attempt.
+
+        @return (bool): Whether the row was updated (False once the lease was lost).
+        """
+        from models import Job
+
+        table = Job.__table__
+        with db.engine.begin() as conn:
+            updated = conn.execute(
+                update(table)
+                .where(table.c.id == job_id, table.c.attempts == attempt, table.c.status == 'running')
+                .values(**values)
+            ).rowcount
+        if updated and notify:
+            notify_model_write(Job.__tablename__, job_id)
+        return bool(updated)
+
+    def _emit(self, job_id, data):
+        if self.socketio is None:
+            return
+        try:
+            self.socketio.emit('job_progress', dict(data, job_id=job_id), to=job_room(job_id))
+        except Exception:
+            logger.exception("Failed to push progress of job %s", job_id)
+
+    # Maintenance
+
+    def _run_maintenance(self):
+        while True:
+            with self._wake:
+                if self._stopping:
+                    return
+            try:
+                with self.app.app_context():
+                    self._enqueue_periodic()
+                    self.requeue_expired_leases()
+            except Exception:
+                logger.exception("Job maintenance failed")
+            with self._wake:
+                if not self._stopping:
+                    self._wake.wait(max(self.poll_interval, 5.0))
+
+    def _enqueue_periodic(self):
+        for name, (every, payload) in self._periodic.items():
+            if self._claim_period(f"jobs.periodic:{name}", every):
+                self.enqueue(name, payload, key=f"periodic:{name}")
+
+    def _claim_period(self, watermark, every):
+        # True for the one process that moves the job's last enqueue time forward, or records the first one
+        from models import AggregateWatermark
+
+        table = AggregateWatermark.__table__
+        now = datetime.utcnow()
+        with db.engine.begin() as conn:
+            claimed = conn.execute(
+                update(table)
+                .where(table.c.name == watermark, table.c.updated_at <= now - timedelta(seconds=every))
+                .values(updated_at=now)
+            ).rowcount
+            if not claimed:
+                claimed = conn.execute(
+                    insert(table).prefix_with('OR IGNORE'), {'name': watermark, 'position': 0, 'updated_at': now}
+                ).rowcount
+        return bool(claimed)
+
+    def requeue_expired_leases(self):
+        """
+        Put running jobs whose worker stopped sending heartbeats back in the queue,
+        or mark them failed if they have run max_attempts times.
+
+        @return (int): The number of requeued jobs.
+        """
+        from models import Job
+
+        table = Job.__table__
+        now = datetime.utcnow()
+        expired = and_(table.c.status == 'running', table.c.heartbeat_at < now - timedelta(seconds=self.lease_timeout))
+        with db.engine.begin() as conn:
+            failed = conn.execute(
+                update(table).where(expired, table.c.attempts >= table.c.max_attempts)
+                .values(status='failed', error='Lease expired', finished_at=now)
+            ).rowcount
+            requeued = conn.execute(
+                update(table).where(expired)
+                .values(status='queued', error='Lease expired', run_after=now)
+            ).rowcount
+        if failed:
+            logger.error("Failed %d jobs whose lease expired on their last attempt", failed)
+        if requeued:
+            logger.warning("Requeued %d jobs with expired leases", requeued)
+        if failed or requeued:
+            notify_model_write(Job.__tablename__)
+        return requeued
+
+    def purge_finished(self):
+        """Delete succeeded and failed jobs older than JOB_RETENTION."""
+        from models import Job
+
+        table = Job.__table__
+        cutoff = datetime.utcnow() - self.retention
+        with db.engine.begin() as conn:
+            return conn.execute(
+                table.delete().where(and_(table.c.status.in_(('succeeded', 'failed')), table.c.finished_at < cutoff))
+            ).rowcount
+
+
+job_scheduler = JobScheduler()
+
+
+# Built-in jobs
+
+REPORT_SCOPES = ('instructor', 'course', 'tutor')
+
+
+@job_scheduler.register('analytics.report', priority=10)
+def build_report(payload, ctx):
+    """Build an instructor, course or tutor analytics report (payload: scope, object_id)."""
+    from database import analytics_engine
+
+    builders = {
+        'instructor': analytics_engine.instructor_overview,
+        'course': analytics_engine.course_performance,
+        'tutor': analytics_engine.tutor_analytics,
+    }
+    scope = payload.get('scope')
+    if scope not in builders:
+        raise ValueError(f"Unknown report scope: {scope}")
+    ctx.progress(0.1, f"Building {scope} report")
+    return builders[scope](int(payload['object_id']))
+
+
+@job_scheduler.register('progress_rollups.catch_up', priority=5)
+def refresh_progress_rollups(payload, ctx):
+    """Fold every pending session and activity into the learner progress rollups."""
+    from database.progress_rollups import progress_aggregator
+
+    ctx.progress(0.0, "Refreshing progress rollups")
+    return {'processed': progress_aggregator.catch_up()}
+
+
+@job_scheduler.register('knowledge_tracing.refit', every=86400, priority=-5)
+def refit_knowledge_tracing(payload, ctx):
+    """Refit skill mastery parameters of one tutor (payload: tutor_id), or of every tutor with new attempts."""
+    from database import knowledge_tracing
+
+    tutor_ids = [int(payload['tutor_id'])] if payload.get('tutor_id') is not None else knowledge_tracing.stale_tutors()
+    results = {}
+    for i, tutor_id in enumerate(tutor_ids):
+        ctx.progress(i / len(tutor_ids), f"Refitting tutor {tutor_id}")
+        # Skill fits report their share of this tutor's slice of the job
+        results[str(tutor_id)] = knowledge_tracing.refit_tutor(
+            tutor_id, progress=lambda fraction, message, i=i: ctx.progress((i + fraction) / len(tutor_ids), message)
+        )
+    return results
+
+
+@job_scheduler.register('maintenance.purge', every=3600, priority=-10)
+def purge_expired_rows(payload, ctx):
+    """Delete expired ingest keys, revoked tokens, sessions, metric buckets and old finished jobs."""
+    from flask import current_app
+    from database.activity_ingest import activity_ingestor
+    from database.metric_series import purge_expired_buckets
+    from database.session_store import session_store
+    from database.token_revocation import revocation_store
+
+    purged = {}
+    steps = [
+        ('ingest_keys', activity_ingestor.purge_expired_keys),
+        ('revoked_tokens', revocation_store.purge_expired),
+        ('metric_buckets', purge_expired_buckets),
+        ('jobs', job_scheduler.purge_finished),
+    ]
+    if current_app.session_interface is session_store:
+        steps.append(('sessions', session_store.sweep))
+    for i, (name, purge) in enumerate(steps):
+        ctx.progress(i / len(steps), f"Purging {name.replace('_', ' ')}")
+        purged[name] = purge()
+    return purged
@@ -0,0 +1,443 @@
+"""
+Per-skill mastery estimates by Bayesian Knowledge Tracing (BKT).
+
+Every scored activity is an attempt at a skill. The skill is the activity's
+`skill` key in activity_data, or its activity_type if there is none. A score
+of at least KNOWLEDGE_TRACING_CORRECT_SCORE counts as correct; scores above 1
+are read as percentages. BKT treats each learner's grasp of a skill as a
+hidden mastered / not-yet-mastered state with four parameters per skill:
+
+- p_init: mastery before the first attempt.
+- p_learn: chance of mastering the skill at each attempt.
+- p_guess: chance of a correct answer without mastery.
+- p_slip: chance of a wrong answer despite mastery.
+
+Estimates are maintained two ways:
+
+- Incrementally. The progress aggregator (see database/progress_rollups.py)
+  hands each new batch of activities to fold_activities. That applies the
+  closed-form BKT update to the learner's `skill_mastery` row, in the same
+  transaction and watermark pass as the rollups. An update is a handful of
+  float operations, about a microsecond per attempt.
+- Batch refits. refit_tutor loads every attempt at a tutor's skills into
+  padded (learners x attempts) arrays. It fits each skill's parameters by
+  expectation-maximization, vectorized with NumPy across learners, then
+  recomputes every learner's mastery with the new parameters. Refits run as
+  background jobs, daily and on request. A daily run only refits tutors with
+  attempts folded in since their last refit. Each refit is recorded in
+  `aggregate_watermarks` as 'knowledge_tracing.refit:<tutor id>', with the
+  attempts read and the time of the refit.
+
+Skills without fitted parameters use KNOWLEDGE_TRACING_DEFAULTS.
+"""
+
+import logging
+from datetime import datetime
+
+import numpy as np
+from flask import current_app
+from sqlalchemy import case, func, select, tuple_
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from database.db import db
+
+logger = logging.getLogger(__name__)
+
+PARAMETER_NAMES = ('p_init', 'p_learn', 'p_guess', 'p_slip')
+DEFAULT_PARAMETERS = {'p_init': 0.2, 'p_learn': 0.15, 'p_guess': 0.2, 'p_slip': 0.1}
+# Past these, guessing and slipping explain answers better than mastery does, and fits stop meaning anything
+MAX_GUESS = 0.3
+MAX_SLIP = 0.3
+_EPSILON = 1e-4
+
+
+def _config(name, default):
+    return current_app.config.get(name, default)
+
+
+def _default_parameters():
+    defaults = _config('KNOWLEDGE_TRACING_DEFAULTS', DEFAULT_PARAMETERS)
+    return tuple(defaults[name] for name in PARAMETER_NAMES)
+
+
+def skill_column(activity_table):
+    """SQL expression for an activity's skill: the `skill` key of activity_data, else the activity_type."""
+    data = activity_table.c.activity_data
+    return func.coalesce(case((func.json_valid(data), func.json_extract(data, '$.skill'))),
+                         activity_table.c.activity_type)
+
+
+def is_correct(score, threshold):
+    """Whether a score (0-1, or a percentage) counts as a correct attempt."""
+    return (score / 100 if score > 1 else score) >= threshold
+
+
+def update_mastery(p_mastery, correct, p_learn, p_guess, p_slip):
+    """
+    One BKT step: the probability of mastery given the attempt, then the chance of learning from it.
+
+    @param p_mastery (float): Probability of mastery before the attempt.
+    @param correct (bool): Whether the attempt was correct.
+    @return (float): Probability of mastery after the attempt.
+    """
+    if correct:
+        known = p_mastery * (1 - p_slip)
+        p_mastery = known / (known + (1 - p_mastery) * p_guess)
+    else:
+        known = p_mastery * p_slip
+        p_mastery = known / (known + (1 - p_mastery) * (1 - p_guess))
+    return p_mastery + (1 - p_mastery) * p_learn
+
+
+def _parameters(conn, keys):
+    # (tutor_id, skill) -> (p_init, p_learn, p_guess, p_slip), fitted or default
+    from models import SkillParameters
+
+    table = SkillParameters.__table__
+    keys = list(keys)
+    fitted = {}
+    for start in range(0, len(keys), 300):
+        for row in conn.execute(
+            select(table.c.tutor_id, table.c.skill, *(table.c[name] for name in PARAMETER_NAMES))
+            .where(tuple_(table.c.tutor_id, table.c.skill).in_(keys[start:start + 300]))
+        ):
+            fitted[(row[0], row[1])] = tuple(row[2:])
+    defaults = _default_parameters()
+    return {key: fitted.get(key, defaults) for key in keys}
+
+
+def _write_states(conn, states, now=None):
+    # states: (learner_id, tutor_id, skill) -> [p_mastery, attempts, correct, last_practiced_at]
+    from models import SkillMastery
+
+    if not states:
+        return
+    table = SkillMastery.__table__
+    now = now or datetime.utcnow()
+    stmt = sqlite_insert(table)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[table.c.learner_id, table.c.tutor_id, table.c.skill],
+        set_={column: stmt.excluded[column]
+              for column in ('p_mastery', 'attempts', 'correct', 'last_practiced_at', 'updated_at')}
+    )
+    conn.execute(stmt, [{
+        'learner_id': learner_id, 'tutor_id': tutor_id, 'skill': skill, 'p_mastery': float(p_mastery),
+        'attempts': attempts, 'correct': correct, 'last_practiced_at': last_practiced_at, 'updated_at': now
+    } for (learner_id, tutor_id, skill), (p_mastery, attempts, correct, last_practiced_at) in states.items()])
+
+
+def fold_activities(conn, activities):
+    """
+    Apply new attempts to the learners' mastery estimates; call inside the
+    transaction that advances the activity watermark.
+
+    @param conn (Connection): An open transaction.
+    @param activities (list): Rows with learner_id, tutor_id, skill, score and timestamp, in id order.
+    """
+    from models import SkillMastery
+
+    threshold = _config('KNOWLEDGE_TRACING_CORRECT_SCORE', 0.6)
+    attempts = [(row.learner_id, row.tutor_id, str(row.skill)[:100], is_correct(row.score, threshold), row.timestamp)
+                for row in activities if row.score is not None and row.skill is not None]
+    if not attempts:
+        return
+
+    keys = list({attempt[:3] for attempt in attempts})
+    parameters = _parameters(conn, {(tutor_id, skill) for _, tutor_id, skill in keys})
+    table = SkillMastery.__table__
+    states = {}
+    for start in range(0, len(keys), 300):
+        for row in conn.execute(
+            select(table.c.learner_id, table.c.tutor_id, table.c.skill, table.c.p_mastery, table.c.attempts,
+                   table.c.correct, table.c.last_practiced_at)
+            .where(tuple_(table.c.learner_id, table.c.tutor_id, table.c.skill).in_(keys[start:start + 300]))
+        ):
+            states[tuple(row[:3])] = list(row[3:])
+
+    for learner_id, tutor_id, skill, correct, timestamp in attempts:
+        p_init, p_learn, p_guess, p_slip = parameters[(tutor_id, skill)]
+        state = states.get((learner_id, tutor_id, skill))
+        if state is None:
+            state = states[(learner_id, tutor_id, skill)] = [p_init, 0, 0, None]
+        state[0] = update_mastery(state[0], correct, p_learn, p_guess, p_slip)
+        state[1] += 1
+        state[2] += correct
+        state[3] = timestamp if state[3] is None else max(state[3], timestamp)
+    _write_states(conn, states)
+
+
+def _pad(sequences, max_length=None):
+    """
+    Pack answer sequences into a (sequences x attempts) boolean array, longest first.
+
+    @return (tuple): (order, answers, active). Row i holds sequences[order[i]].
+                     active[step] is the number of rows with an attempt at that
+                     step; those rows come first.
+    """
+    lengths = np.array([len(sequence) for sequence in sequences])
+    if max_length is not None:
+        lengths = np.minimum(lengths, max_length)
+    order = np.argsort(-lengths, kind='stable')
+    lengths = lengths[order]
+    answers = np.zeros((len(sequences), lengths[0]), dtype=bool)
+    for row, index in enumerate(order):
+        answers[row, :lengths[row]] = sequences[index][:lengths[row]]
+    active = np.searchsorted(-lengths, -np.arange(lengths[0]), side='left')
+    return order, answers, active
+
+
+def _forward(answers, active, parameters, keep_steps=False):
+    """
+    Run the BKT filter over every row at once.
+
+    @return (tuple): (mastery after each row's last attempt, total log-likelihood,
+                     and, with keep_steps, the per-attempt posteriors and evidence
+                     the EM step needs).
+    """
+    p_init, p_learn, p_guess, p_slip = parameters
+    known = np.full(len(answers), p_init)
+    log_likelihood = 0.0
+    posteriors = np.zeros(answers.shape) if keep_steps else None
+    evidence = np.ones(answers.shape) if keep_steps else None
+    for step, rows in enumerate(active):
+        correct, prior = answers[:rows, step], known[:rows]
+        if_known = np.where(correct, 1 - p_slip, p_slip)
+        if_unknown = np.where(correct, p_guess, 1 - p_guess)
+        step_evidence = prior * if_known + (1 - prior) * if_unknown
+        posterior = prior * if_known / step_evidence
+        known[:rows] = posterior + (1 - posterior) * p_learn
+        log_likelihood += np.log(step_evidence).sum()
+        if keep_steps:
+            posteriors[:rows, step] = posterior
+            evidence[:rows, step] = step_evidence
+    return known, log_likelihood, posteriors, evidence
+
+
+def _expectation_maximization_step(answers, active, parameters):
+    # Forward-backward over all rows, then closed-form re-estimates of the four parameters
+    p_init, p_learn, p_guess, p_slip = parameters
+    _, log_likelihood, posteriors, evidence = _forward(answers, active, parameters, keep_steps=True)
+
+    steps = answers.shape[1]
+    mask = np.arange(len(answers))[:, None] < active[None, :]
+
+    beta_known = np.ones(answers.shape)
+    beta_unknown = np.ones(answers.shape)
+    learned = np.zeros(answers.shape)  # P(not mastered at step, mastered at step + 1 | all answers)
+    for step in range(steps - 2, -1, -1):
+        rows = active[step + 1]
+        correct = answers[:rows, step + 1]
+        if_known = np.where(correct, 1 - p_slip, p_slip)
+        if_unknown = np.where(correct, p_guess, 1 - p_guess)
+        scale = evidence[:rows, step + 1]
+        ahead_known = if_known * beta_known[:rows, step + 1] / scale
+        ahead_unknown = if_unknown * beta_unknown[:rows, step + 1] / scale
+        beta_known[:rows, step] = ahead_known
+        beta_unknown[:rows, step] = p_learn * ahead_known + (1 - p_learn) * ahead_unknown
+        learned[:rows, step] = (1 - posteriors[:rows, step]) * p_learn * ahead_known
+
+    known = posteriors * beta_known * mask
+    unknown = (1 - posteriors) * beta_unknown * mask
+    has_next = np.zeros(answers.shape, dtype=bool)
+    has_next[:, :-1] = mask[:, 1:]
+
+    estimates = (
+        known[:, 0].mean(),
+        learned[has_next].sum() / max(unknown[has_next].sum(), _EPSILON),
+        (unknown * answers).sum() / max(unknown.sum(), _EPSILON),
+        (known * ~answers).sum() / max(known.sum(), _EPSILON)
+    )
+    limits = (1 - _EPSILON, 1 - _EPSILON, MAX_GUESS, MAX_SLIP)
+    return tuple(float(min(max(value, _EPSILON), limit)) for value, limit in zip(estimates, limits)), log_likelihood
+
+
+def fit_parameters(sequences, start=None, max_length=200, iterations=100, tolerance=1e-6):
+    """
+    Fit the BKT parameters of one skill by expectation-maximization over every learner's answers.
+
+    @param sequences (list): Per learner, the correctness of each attempt in order.
+    @param start (tuple): Starting (p_init, p_learn, p_guess, p_slip); defaults to KNOWLEDGE_TRACING_DEFAULTS.
+    @param max_length (int): Attempts per learner used for the fit; later ones add little and cost memory.
+    @param iterations (int): Upper bound on EM iterations.
+    @param tolerance (float): Stop once an iteration improves the log-likelihood by less than this fraction.
+    @return (tuple): (parameters, log-likelihood of the answers under them).
+    """
+    _, answers, active = _pad(sequences, max_length)
+    parameters = start or _default_parameters()
+    previous = None
+    for _ in range(iterations):
+        updated, log_likelihood = _expectation_maximization_step(answers, active, parameters)
+        if previous is not None and log_likelihood - previous <= tolerance * abs(previous):
+            break
+        parameters, previous = updated, log_likelihood
+    _, log_likelihood, _, _ = _forward(answers, active, parameters)
+    return parameters, float(log_likelihood)
+
+
+def filter_mastery(sequences, parameters):
+    """
+    Mastery of each learner after all of their attempts, vectorized across learners.
+
+    @param sequences (list): Per learner, the correctness of each attempt in order.
+    @param parameters (tuple): (p_init, p_learn, p_guess, p_slip).
+    @return (ndarray): One probability per sequence, in the order given.
+    """
+    order, answers, active = _pad(sequences)
+    known, _, _, _ = _forward(answers, active, parameters)
+    mastery = np.empty(len(sequences))
+    mastery[order] = known
+    return mastery
+
+
+def _tutor_activities(conn, tutor_id, after, upto):
+    from models import LearnerSession, LearnerTutor, SessionActivity
+
+    activity_table = SessionActivity.__table__
+    session_table = LearnerSession.__table__
+    learner_tutor_table = LearnerTutor.__table__
+    return conn.execute(
+        select(activity_table.c.id, learner_tutor_table.c.learner_id, learner_tutor_table.c.tutor_id,
+               skill_column(activity_table).label('skill'), activity_table.c.score, activity_table.c.timestamp)
+        .join(session_table, session_table.c.id == activity_table.c.session_id)
+        .join(learner_tutor_table, learner_tutor_table.c.id == session_table.c.learner_tutor_id)
+        .where(learner_tutor_table.c.tutor_id == tutor_id, activity_table.c.id > after,
+               activity_table.c.id <= upto, activity_table.c.score.isnot(None))
+        .order_by(activity_table.c.id)
+    ).all()
+
+
+REFIT_WATERMARK_PREFIX = 'knowledge_tracing.refit:'
+
+
+def _activity_watermark(conn):
+    from models import AggregateWatermark, SessionActivity
+
+    table = AggregateWatermark.__table__
+    return conn.execute(
+        select(table.c.position).where(table.c.name == SessionActivity.__tablename__)
+    ).scalar() or 0
+
+
+def refit_tutor(tutor_id, progress=None):
+    """
+    Refit the parameters of every skill of a tutor and recompute its learners' mastery.
+
+    The fit reads the attempts the aggregator has already folded in, without
+    holding the write lock. The results are written in one short transaction.
+    That transaction first re-applies any attempts folded in meanwhile, so none
+    are lost or counted twice.
+
+    @param tutor_id (int): The tutor.
+    @param progress (callable): Optional `progress(fraction, message)` callback.
+    @return (dict): Skills fitted, skills left on their current parameters, and learner-skill estimates written.
+    """
+    from models import AggregateWatermark, SkillMastery, SkillParameters
+
+    threshold = _config('KNOWLEDGE_TRACING_CORRECT_SCORE', 0.6)
+    min_attempts = _config('KNOWLEDGE_TRACING_MIN_ATTEMPTS', 200)
+    max_length = _config('KNOWLEDGE_TRACING_FIT_MAX_ATTEMPTS', 200)
+
+    with db.engine.connect() as conn:
+        mark = _activity_watermark(conn)
+        activities = _tutor_activities(conn, tutor_id, 0, mark)
+        answers, last_practiced = {}, {}
+        for row in activities:
+            if row.skill is None:
+                continue
+            skill = str(row.skill)[:100]
+            answers.setdefault(skill, {}).setdefault(row.learner_id, []).append(is_correct(row.score, threshold))
+            key = (row.learner_id, tutor_id, skill)
+            last_practiced[key] = max(last_practiced.get(key) or row.timestamp, row.timestamp)
+        current = _parameters(conn, {(tutor_id, skill) for skill in answers})
+
+    now = datetime.utcnow()
+    fitted, states = [], {}
+    for i, (skill, by_learner) in enumerate(sorted(answers.items())):
+        sequences = list(by_learner.values())
+        observations = sum(len(sequence) for sequence in sequences)
+        parameters = current[(tutor_id, skill)]
+        if observations >= min_attempts:
+            parameters, log_likelihood = fit_parameters(sequences, max_length=max_length)
+            fitted.append({
+                'tutor_id': tutor_id, 'skill': skill, **dict(zip(PARAMETER_NAMES, parameters)),
+                'learners': len(sequences), 'observations': observations, 'log_likelihood': log_likelihood,
+                'fitted_at': now
+            })
+        for learner_id, sequence, mastery in zip(by_learner, sequences, filter_mastery(sequences, parameters)):
+            states[(learner_id, tutor_id, skill)] = [mastery, len(sequence), sum(sequence),
+                                                     last_practiced[(learner_id, tutor_id, skill)]]
+        if progress:
+            progress((i + 1) / len(answers), f"Fitted {skill}")
+
+    with db.engine.begin() as conn:
+        # Writing first takes the write lock, so no rollup pass runs until this commits.
+        # The refit is recorded even if no skill had enough attempts to fit, so the
+        # tutor is not refit again until new attempts arrive
+        table = AggregateWatermark.__table__
+        stmt = sqlite_insert(table).values(name=f"{REFIT_WATERMARK_PREFIX}{tutor_id}", position=mark, updated_at=now)
+        conn.execute(stmt.on_conflict_do_update(
+            index_elements=[table.c.name],
+            set_={'position': stmt.excluded.position, 'updated_at': stmt.excluded.updated_at}
+        ))
+        if states:
+            if fitted:
+                table = SkillParameters.__table__
+                stmt = sqlite_insert(table)
+                stmt = stmt.on_conflict_do_update(
+                    index_elements=[table.c.tutor_id, table.c.skill],
+                    set_={column: stmt.excluded[column] for column in fitted[0] if column not in ('tutor_id', 'skill')}
+                )
+                conn.execute(stmt, fitted)
+            # Stamped with the refit time, so only attempts folded in later mark the tutor stale
+            _write_states(conn, states, now)
+            latest = _activity_watermark(conn)
+            if latest > mark:
+                fold_activities(conn, _tutor_activities(conn, tutor_id, mark, latest))
+
+    from database.sqlite_helpers import notify_model_write
+    notify_model_write(AggregateWatermark.__tablename__)
+    if states:
+        notify_model_write(SkillMastery.__tablename__)
+    if fitted:
+        notify_model_write(SkillParameters.__tablename__)
+    logger.info("Refit knowledge tracing for tutor %s: %d skills fitted", tutor_id, len(fitted))
+    fitted_skills = [row['skill'] for row in fitted]
+    return {'fitted': fitted_skills, 'unchanged': sorted(set(answers) - set(fitted_skills)), 'estimates': len(states)}
+
+
+def stale_tutors():
+    """Tutors with attempts folded in since their last refit, or never refit."""
+    from models import AggregateWatermark, SkillMastery
+
+    mastery_table = SkillMastery.__table__
+    watermark_table = AggregateWatermark.__table__
+    refit_at = {
+        int(name[len(REFIT_WATERMARK_PREFIX):]): updated_at for name, updated_at in db.session.execute(
+            select(watermark_table.c.name, watermark_table.c.updated_at)
+            .where(watermark_table.c.name.startswith(REFIT_WATERMARK_PREFIX))
+        )
+    }
+    return [
+        tutor_id for tutor_id, updated_at in db.session.execute(
+            select(mastery_table.c.tutor_id, func.max(mastery_table.c.updated_at)).group_by(mastery_table.c.tutor_id)
+        )
+        if tutor_id not in refit_at or updated_at > refit_at[tutor_id]
+    ]
+
+
+def learner_mastery(learner_id):
+    """
+    A learner's mastery of every skill they have attempted.
+
+    @param learner_id (int): The learner.
+    @return (dict): Tutor id to a list of skills (skill, p_mastery, mastered, attempts, correct, last_practiced_at).
+    """
+    from models import SkillMastery
+
+    threshold = _config('KNOWLEDGE_TRACING_MASTERY', 0.95)
+    by_tutor = {}
+    for row in SkillMastery.query.filter_by(learner_id=learner_id).order_by(SkillMastery.skill):
+        skill = row.to_dict()
+        skill['mastered'] = row.p_mastery >= threshold
+        by_tutor.setdefault(row.tutor_id, []).append(skill)
+    return by_tutor
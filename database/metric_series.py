@@ -0,0 +1,182 @@
+"""
+Downsampled performance metric series.
+
+`metric_buckets` holds the count, sum, min and max of every metric per learner
+and per tutor, over minute, hour and day buckets. The progress aggregator (see
+database/progress_rollups.py) folds new `performance_metrics` rows into the
+buckets in the same pass as the progress rollups. Charts read a few hundred
+buckets through the unique (scope, owner_id, metric_name, resolution,
+bucket_start) index, however long the raw history is.
+
+Minute and hour buckets are purged after METRIC_BUCKET_RETENTION. Day buckets
+are kept for good.
+"""
+
+import logging
+import math
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import delete, func, select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from database.db import db
+
+logger = logging.getLogger(__name__)
+
+MINUTE, HOUR, DAY = 60, 3600, 86400
+RESOLUTIONS = (MINUTE, HOUR, DAY)
+RESOLUTION_NAMES = {MINUTE: 'minute', HOUR: 'hour', DAY: 'day'}
+SCOPES = ('learner', 'tutor')
+DEFAULT_RETENTION = {MINUTE: timedelta(days=7), HOUR: timedelta(days=180)}
+
+_EPOCH = datetime(1970, 1, 1)
+
+
+def bucket_start(timestamp, resolution):
+    """Start of the bucket of width `resolution` seconds holding `timestamp`."""
+    seconds = int((timestamp - _EPOCH).total_seconds())
+    return _EPOCH + timedelta(seconds=seconds - seconds % resolution)
+
+
+def _retention():
+    return current_app.config.get('METRIC_BUCKET_RETENTION', DEFAULT_RETENTION)
+
+
+def fold_metrics(conn, metrics):
+    """
+    Add performance metrics to their buckets; call inside the transaction that advances the watermark.
+
+    @param conn (Connection): An open transaction.
+    @param metrics (list): Rows with learner_id, tutor_id, metric_name, metric_value and recorded_at.
+    """
+    from models import MetricBucket
+
+    deltas = {}
+    for row in metrics:
+        if row.metric_value is None or row.recorded_at is None:
+            continue
+        for scope, owner_id in (('learner', row.learner_id), ('tutor', row.tutor_id)):
+            for resolution in RESOLUTIONS:
+                key = (scope, owner_id, row.metric_name, resolution, bucket_start(row.recorded_at, resolution))
+                delta = deltas.get(key)
+                if delta is None:
+                    deltas[key] = {
+                        'scope': scope, 'owner_id': owner_id, 'metric_name': row.metric_name,
+                        'resolution': resolution, 'bucket_start': key[4], 'count': 1,
+                        'value_sum': row.metric_value, 'min_value': row.metric_value, 'max_value': row.metric_value
+                    }
+                else:
+                    delta['count'] += 1
+                    delta['value_sum'] += row.metric_value
+                    delta['min_value'] = min(delta['min_value'], row.metric_value)
+                    delta['max_value'] = max(delta['max_value'], row.metric_value)
+    if not deltas:
+        return
+
+    table = MetricBucket.__table__
+    stmt = sqlite_insert(table)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[table.c.scope, table.c.owner_id, table.c.metric_name, table.c.resolution,
+                        table.c.bucket_start],
+        set_={
+            'count': table.c.count + stmt.excluded.count,
+            'value_sum': table.c.value_sum + stmt.excluded.value_sum,
+            'min_value': func.min(table.c.min_value, stmt.excluded.min_value),
+            'max_value': func.max(table.c.max_value, stmt.excluded.max_value)
+        }
+    )
+    conn.execute(stmt, list(deltas.values()))
+
+
+def choose_resolution(start, end, max_points, now=None):
+    """
+    Coarsest resolution that still gives the chart enough detail: the finest one
+    whose bucket count over [start, end] fits in max_points and whose buckets
+    are still retained back to `start`.
+
+    @return (tuple): (resolution in seconds, buckets merged per point). Spans too
+                     long for day buckets merge several days into each point.
+    """
+    now = now or datetime.utcnow()
+    span = max((end - start).total_seconds(), 1)
+    retention = _retention()
+    for resolution in RESOLUTIONS:
+        kept = retention.get(resolution)
+        if kept is not None and start < now - kept:
+            continue
+        if span / resolution <= max_points:
+            return resolution, 1
+    return DAY, math.ceil(span / DAY / max_points)
+
+
+def metric_series(scope, owner_id, metric_name, start=None, end=None, max_points=200):
+    """
+    A downsampled series of one metric of a learner or tutor.
+
+    @param scope (str): 'learner' or 'tutor'.
+    @param owner_id (int): The learner or tutor.
+    @param metric_name (str): The metric.
+    @param start (datetime): First instant of the series; defaults to the first recorded value.
+    @param end (datetime): Last instant of the series; defaults to now.
+    @param max_points (int): Upper bound on the number of points returned.
+    @return (dict): 'resolution' (name), 'step_seconds' and 'points', each with
+                    t, count, mean, min and max. Empty buckets are omitted.
+    """
+    from models import MetricBucket
+
+    if scope not in SCOPES:
+        raise ValueError(f"Unknown metric scope: {scope}")
+    table = MetricBucket.__table__
+    owner = [table.c.scope == scope, table.c.owner_id == owner_id, table.c.metric_name == metric_name]
+    end = end or datetime.utcnow()
+    if start is None:
+        start = db.session.execute(
+            select(func.min(table.c.bucket_start)).where(*owner, table.c.resolution == DAY)
+        ).scalar()
+        if start is None:
+            return {'resolution': RESOLUTION_NAMES[MINUTE], 'step_seconds': MINUTE, 'points': []}
+
+    resolution, merge = choose_resolution(start, end, max_points)
+    rows = db.session.execute(
+        select(table.c.bucket_start, table.c.count, table.c.value_sum, table.c.min_value, table.c.max_value)
+        .where(*owner, table.c.resolution == resolution,
+               table.c.bucket_start >= bucket_start(start, resolution), table.c.bucket_start <= end)
+        .order_by(table.c.bucket_start)
+    ).all()
+
+    step = resolution * merge
+    points = []
+    for started, count, value_sum, low, high in rows:
+        t = bucket_start(started, step) if merge > 1 else started
+        if points and points[-1]['t'] == t:
+            point = points[-1]
+            point['count'] += count
+            point['sum'] += value_sum
+            point['min'] = min(point['min'], low)
+            point['max'] = max(point['max'], high)
+        else:
+            points.append({'t': t, 'count': count, 'sum': value_sum, 'min': low, 'max': high})
+    for point in points:
+        point['t'] = point['t'].isoformat()
+        point['mean'] = point.pop('sum') / point['count'] if point['count'] else None
+
+    name = RESOLUTION_NAMES[resolution] if merge == 1 else f"{merge} days"
+    return {'resolution': name, 'step_seconds': step, 'points': points}
+
+
+def purge_expired_buckets():
+    """Delete minute and hour buckets older than METRIC_BUCKET_RETENTION. Returns the number deleted."""
+    from models import MetricBucket
+
+    table = MetricBucket.__table__
+    now = datetime.utcnow()
+    deleted = 0
+    with db.engine.begin() as conn:
+        for resolution, kept in _retention().items():
+            deleted += conn.execute(
+                delete(table).where(table.c.resolution == resolution, table.c.bucket_start < now - kept)
+            ).rowcount
+    if deleted:
+        logger.info("Purged %d expired metric buckets", deleted)
+    return deleted
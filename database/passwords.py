@@ -0,0 +1,110 @@
+"""
+Password hashing service.
+
+Hashes use werkzeug's format, with the algorithm and cost taken from
+PASSWORD_HASH_METHOD (e.g. 'scrypt', 'scrypt:65536:8:1' or
+'pbkdf2:sha256:600000'). A successful login whose stored hash was made with
+other parameters returns a fresh hash, so raising the cost upgrades accounts
+as users sign in.
+
+Hashing and verification run on a small worker pool. The request thread waits
+for its result, but at most PASSWORD_HASH_WORKERS hashes run at once and at
+most PASSWORD_HASH_MAX_PENDING wait for a worker. Beyond that `PasswordHasherBusy`
+is raised and the request can be answered with a 503, so a login storm queues
+up behind the pool instead of taking every CPU from the rest of the app.
+"""
+
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+
+class PasswordHasherBusy(Exception):
+    """Raised when too many hashes are already queued."""
+
+
+class PasswordHasher:
+    """Bounded worker pool for generating and checking password hashes."""
+
+    def __init__(self, method='scrypt', salt_length=16, workers=None, max_pending=64, timeout=10.0):
+        self.method = method
+        self.salt_length = salt_length
+        self.workers = workers or min(4, os.cpu_count() or 1)
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self._method_prefix = None
+        self._executor = None
+        self._slots = None
+
+    def init_app(self, app):
+        """Read PASSWORD_HASH_* settings from the app config and start the worker pool."""
+        self.method = app.config.get('PASSWORD_HASH_METHOD', self.method)
+        self.salt_length = app.config.get('PASSWORD_HASH_SALT_LENGTH', self.salt_length)
+        self.workers = app.config.get('PASSWORD_HASH_WORKERS') or self.workers
+        self.max_pending = app.config.get('PASSWORD_HASH_MAX_PENDING', self.max_pending)
+        self.timeout = app.config.get('PASSWORD_HASH_TIMEOUT', self.timeout)
+        # Hashing once up front validates the method and yields the prefix stored hashes start with
+        self._method_prefix = generate_password_hash('', method=self.method, salt_length=1).split('$', 1)[0]
+
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='password-hash')
+        self._slots = threading.BoundedSemaphore(self.workers + self.max_pending)
+        app.extensions['password_hasher'] = self
+
+    def hash(self, password):
+        """Hash a password with the configured method."""
+        return self._run(self._hash, password)
+
+    def verify(self, password_hash, password):
+        """
+        Check a password against a stored hash.
+
+        @return (tuple): (matches, new_hash). new_hash is a rehash with the current
+                         parameters when the password matched an outdated hash, else None.
+        """
+        return self._run(self._verify, password_hash, password)
+
+    def hash_many(self, passwords):
+        """
+        Hash a batch of passwords on the pool (e.g. for bulk imports), in order.
+        Waits for free slots instead of failing when the pool is busy.
+        """
+        futures = [self._submit(self._hash, password, block=True) for password in passwords]
+        return [future.result() for future in futures]
+
+    def needs_rehash(self, password_hash):
+        """Whether a stored hash was made with different parameters than the configured ones."""
+        prefix = self._method_prefix or generate_password_hash('', method=self.method, salt_length=1).split('$', 1)[0]
+        return password_hash.split('$', 1)[0] != prefix
+
+    def _hash(self, password):
+        return generate_password_hash(password, method=self.method, salt_length=self.salt_length)
+
+    def _verify(self, password_hash, password):
+        if not check_password_hash(password_hash, password):
+            return False, None
+        return True, self._hash(password) if self.needs_rehash(password_hash) else None
+
+    def _run(self, fn, *args):
+        return self._submit(fn, *args).result(timeout=self.timeout)
+
+    def _submit(self, fn, *args, block=False):
+        if self._executor is None:
+            # Not initialized (e.g. in scripts): hash inline
+            future = Future()
+            future.set_result(fn(*args))
+            return future
+        acquired = self._slots.acquire(timeout=self.timeout) if block else self._slots.acquire(blocking=False)
+        if not acquired:
+            raise PasswordHasherBusy("Too many password hashes in progress")
+        try:
+            future = self._executor.submit(fn, *args)
+        except Exception:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+
+password_hasher = PasswordHasher()
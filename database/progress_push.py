@@ -0,0 +1,194 @@
+"""
+Real-time learner progress over Socket.IO.
+
+Dashboards subscribe to a course or a learner with the `subscribe_progress`
+event. After that, they receive `progress` events carrying compact deltas and
+do not need to re-fetch whole payloads:
+
+    {'deltas': [{'learner_tutor_id', 'learner_id', 'learner_name', 'tutor_id',
+                 'tutor_title', 'completion', 'sessions': [{'id', 'active', 'minutes'}]}]}
+
+Deltas come from committed writes to `learner_tutors` and `learner_sessions`,
+through the same subscribe_model_writes feed that drives the caches. That
+covers LearnerTutor.update_progress, LearnerSession.end_session and batched
+ingestion alike. Writes are coalesced: every PROGRESS_PUSH_INTERVAL seconds the
+rows written since the last push are read back with a few queries, and each
+room receives one event listing every delta for it. A class full of learners
+therefore costs a handful of emits per interval, not one per write.
+
+A delta goes to the learner's room and to the room of every course that both
+assigns the tutor and enrolls the learner.
+"""
+
+import logging
+import threading
+
+from sqlalchemy import select
+
+from database.db import db
+from database.sqlite_helpers import subscribe_model_writes
+
+logger = logging.getLogger(__name__)
+
+
+def course_room(course_id):
+    """Socket.IO room receiving the progress of a course's learners."""
+    return f"course_progress_{course_id}"
+
+
+def learner_room(learner_id):
+    """Socket.IO room receiving a learner's progress."""
+    return f"learner_progress_{learner_id}"
+
+
+def can_subscribe(principal, course_id=None, learner_id=None):
+    """
+    Course progress is visible to the course's instructor and to admins. A
+    learner's progress is visible to the learner, to admins and to instructors
+    whose tutors they use.
+    """
+    from models import Course, LearnerTutor, Tutor
+
+    if principal is None or not principal.is_authenticated:
+        return False
+    if principal.role == 'admin':
+        return True
+    if course_id is not None:
+        course = db.session.get(Course, course_id)
+        return course is not None and principal.instructor_id is not None \
+            and course.instructor_id == principal.instructor_id
+    if learner_id is not None:
+        if principal.learner_id == learner_id:
+            return True
+        return principal.instructor_id is not None and db.session.query(
+            LearnerTutor.query.join(Tutor, Tutor.id == LearnerTutor.tutor_id)
+            .filter(LearnerTutor.learner_id == learner_id, Tutor.instructor_id == principal.instructor_id)
+            .exists()
+        ).scalar()
+    return False
+
+
+class ProgressPublisher:
+    """Coalesces committed progress writes and pushes them to subscribed dashboards."""
+
+    def __init__(self, interval=0.25, max_tracked=50000):
+        self.interval = interval
+        self.max_tracked = max_tracked
+        self.app = None
+        self.socketio = None
+        self._lock = threading.Lock()
+        self._learner_tutors = set()
+        self._sessions = set()
+        self._last_completion = {}  # learner_tutor_id -> completion last pushed
+        self._listening = False
+        self._running = False
+
+    def init_app(self, app):
+        """Read PROGRESS_PUSH_* settings and start the push loop on the app's SocketIO instance."""
+        self.socketio = app.extensions.get('socketio')
+        if not app.config.get('PROGRESS_PUSH_ENABLED', True) or self.socketio is None:
+            return
+        self.interval = app.config.get('PROGRESS_PUSH_INTERVAL', self.interval)
+        self.app = app
+        app.extensions['progress_push'] = self
+        if not self._listening:
+            subscribe_model_writes(self._on_write)
+            self._listening = True
+        if not self._running:
+            self._running = True
+            self.socketio.start_background_task(self._run)
+
+    def _on_write(self, table_name, row_id):
+        if row_id is None or self.app is None:
+            return
+        if table_name == 'learner_tutors':
+            with self._lock:
+                self._learner_tutors.add(row_id)
+        elif table_name == 'learner_sessions':
+            with self._lock:
+                self._sessions.add(row_id)
+
+    def _run(self):
+        while self._running:
+            self.socketio.sleep(self.interval)
+            try:
+                with self.app.app_context():
+                    self.flush()
+            except Exception:
+                logger.exception("Progress push failed")
+
+    def flush(self):
+        """Push the deltas of every write since the last flush. Returns the number of deltas."""
+        with self._lock:
+            learner_tutor_ids, session_ids = self._learner_tutors, self._sessions
+            self._learner_tutors, self._sessions = set(), set()
+        if not learner_tutor_ids and not session_ids:
+            return 0
+        try:
+            deltas, rooms = self._load(learner_tutor_ids, session_ids)
+        finally:
+            db.session.remove()
+
+        for room, learner_tutor_ids in rooms.items():
+            batch = [deltas[learner_tutor_id] for learner_tutor_id in sorted(learner_tutor_ids)]
+            self.socketio.emit('progress', {'deltas': batch}, to=room)
+        return len(deltas)
+
+    def _load(self, learner_tutor_ids, session_ids):
+        from models import CourseEnrollment, CourseTutor, Learner, LearnerSession, LearnerTutor, Tutor
+        from database.identity_cache import identity_cache
+
+        sessions = {}
+        if session_ids:
+            for row in db.session.execute(
+                select(LearnerSession.id, LearnerSession.learner_tutor_id, LearnerSession.end_time,
+                       LearnerSession.duration_minutes)
+                .where(LearnerSession.id.in_(session_ids))
+            ):
+                sessions.setdefault(row.learner_tutor_id, []).append(
+                    {'id': row.id, 'active': row.end_time is None, 'minutes': row.duration_minutes}
+                )
+
+        rows = db.session.execute(
+            select(LearnerTutor.id, LearnerTutor.learner_id, LearnerTutor.tutor_id,
+                   LearnerTutor.completion_percentage, Tutor.title)
+            .join(Tutor, Tutor.id == LearnerTutor.tutor_id)
+            .where(LearnerTutor.id.in_(learner_tutor_ids | sessions.keys()))
+        ).all()
+
+        deltas = {}
+        with self._lock:
+            for row in rows:
+                completion = round(row.completion_percentage or 0, 2)
+                # Skip access-time bumps and other writes that changed nothing a dashboard shows
+                if row.id not in sessions and self._last_completion.get(row.id) == completion:
+                    continue
+                if row.id not in self._last_completion and len(self._last_completion) >= self.max_tracked:
+                    self._last_completion.pop(next(iter(self._last_completion)))
+                self._last_completion[row.id] = completion
+                deltas[row.id] = {
+                    'learner_tutor_id': row.id, 'learner_id': row.learner_id, 'tutor_id': row.tutor_id,
+                    'tutor_title': row.title, 'completion': completion, 'sessions': sessions.get(row.id, [])
+                }
+        if not deltas:
+            return {}, {}
+
+        names = identity_cache.profile_names(Learner, {delta['learner_id'] for delta in deltas.values()})
+        rooms = {}
+        for delta in deltas.values():
+            delta['learner_name'] = names.get(delta['learner_id'])
+            rooms.setdefault(learner_room(delta['learner_id']), set()).add(delta['learner_tutor_id'])
+
+        # Courses that assign the tutor and enroll the learner
+        for course_id, learner_tutor_id in db.session.execute(
+            select(CourseTutor.course_id, LearnerTutor.id)
+            .join(CourseTutor, CourseTutor.tutor_id == LearnerTutor.tutor_id)
+            .join(CourseEnrollment, (CourseEnrollment.course_id == CourseTutor.course_id)
+                  & (CourseEnrollment.learner_id == LearnerTutor.learner_id))
+            .where(LearnerTutor.id.in_(list(deltas)))
+        ):
+            rooms.setdefault(course_room(course_id), set()).add(learner_tutor_id)
+        return deltas, rooms
+
+
+progress_publisher = ProgressPublisher()
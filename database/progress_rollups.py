@@ -0,0 +1,446 @@
+"""
+Incrementally maintained learner progress rollups.
+
+`learner_tutor_progress` holds per learner-tutor totals (sessions, minutes,
+activities, mean and last score). `learner_progress` holds the same totals per
+learner, plus the daily activity streak. Dashboards read one row per learner
+instead of scanning sessions and activities.
+
+The same passes fold new `performance_metrics` rows into the metric buckets
+charts read (see database/metric_series.py). They also fold new metrics and
+activity scores into the cohort quantile sketches (see
+database/quantile_sketches.py), and new scored activities into the skill
+mastery estimates (see database/knowledge_tracing.py).
+
+A background thread keeps the rows current. It is woken by committed writes to
+`learner_sessions`, `session_activities` and `performance_metrics`, and also runs every
+PROGRESS_ROLLUP_INTERVAL seconds for writes made by other workers. Each pass
+does the following:
+
+- It reads activities, sessions and metrics past the watermarks in
+  `aggregate_watermarks`, up to PROGRESS_ROLLUP_BATCH_SIZE rows of each, and
+  folds them into the rollups.
+- It recounts the sessions of learner-tutors that are new or flagged stale.
+  A session that ends flags its learner-tutor row stale in the same
+  transaction, so no ended session is missed.
+- It advances the watermarks in the same transaction as the rollups, so a
+  restarted process resumes where the last committed pass stopped.
+
+The first statement of a pass writes the watermark row. That takes SQLite's
+write lock, so passes running in several workers are serialized and never
+fold the same rows twice.
+"""
+
+import logging
+import threading
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import case, event, func, inspect, select, union, update
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from database.db import db
+from database.knowledge_tracing import fold_activities as fold_attempts, learner_mastery, skill_column
+from database.metric_series import fold_metrics
+from database.quantile_sketches import fold_sketch_values
+from database.sqlite_helpers import notify_model_write, subscribe_model_writes
+
+logger = logging.getLogger(__name__)
+
+SOURCE_TABLES = ('learner_sessions', 'session_activities', 'performance_metrics')
+
+
+def apply_active_dates(last_date, streak, longest, dates):
+    """
+    Extend a daily streak with newly seen active dates.
+
+    @param last_date (date): Last active date so far, or None.
+    @param streak (int): Consecutive active days ending on last_date.
+    @param longest (int): Longest streak so far.
+    @param dates (iterable): Active dates to fold in; dates up to last_date are ignored, so a
+                             batch holding any must be folded into the learner's full history instead.
+    @return (tuple): (last_date, streak, longest).
+    """
+    for day in sorted(set(dates)):
+        if last_date is not None and day <= last_date:
+            continue
+        streak = streak + 1 if last_date is not None and day - last_date == timedelta(days=1) else 1
+        last_date = day
+        longest = max(longest or 0, streak)
+    return last_date, streak or 0, longest or 0
+
+
+def mark_sessions_ended(conn, learner_tutor_ids):
+    """Flag rollups whose session totals changed; call inside the transaction that ends the sessions."""
+    from models import LearnerTutorProgress
+
+    if learner_tutor_ids:
+        table = LearnerTutorProgress.__table__
+        conn.execute(update(table).where(table.c.learner_tutor_id.in_(list(learner_tutor_ids))).values(is_stale=True))
+
+
+def _flag_ended_session(mapper, connection, target):
+    # ORM counterpart of mark_sessions_ended, e.g. for LearnerSession.end_session()
+    if inspect(target).attrs.end_time.history.has_changes():
+        mark_sessions_ended(connection, [target.learner_tutor_id])
+
+
+def learner_summary(learner_id):
+    """
+    Precomputed progress of a learner, overall and per tutor.
+
+    @param learner_id (int): The learner.
+    @return (dict): 'overall' (None before the learner's first session is folded in) and 'tutors',
+                    each with its skill mastery estimates.
+    """
+    from models import LearnerProgress, LearnerTutor, LearnerTutorProgress, Tutor
+
+    overall = LearnerProgress.query.filter_by(learner_id=learner_id).first()
+    rows = db.session.execute(
+        select(LearnerTutorProgress, Tutor.title, LearnerTutor.completion_percentage)
+        .join(Tutor, Tutor.id == LearnerTutorProgress.tutor_id)
+        .join(LearnerTutor, LearnerTutor.id == LearnerTutorProgress.learner_tutor_id)
+        .where(LearnerTutorProgress.learner_id == learner_id)
+        .order_by(LearnerTutorProgress.last_activity_at.desc())
+    ).all()
+    mastery = learner_mastery(learner_id)
+    tutors = []
+    for progress, title, completion in rows:
+        tutor = progress.to_dict()
+        tutor.update({'title': title, 'completion_percentage': completion,
+                      'skills': mastery.get(progress.tutor_id, [])})
+        tutors.append(tutor)
+    return {'overall': overall.to_dict() if overall else None, 'tutors': tutors}
+
+
+class ProgressAggregator:
+    """Folds new sessions and activities into the learner rollups on a background thread."""
+
+    def __init__(self, batch_size=10000, interval=30.0, delay=0.5):
+        self.batch_size = batch_size
+        self.interval = interval
+        self.delay = delay
+        self.app = None
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._pass_lock = threading.Lock()
+        self._listening = False
+
+    def init_app(self, app):
+        """Read PROGRESS_ROLLUP_* settings from the app config and start the aggregation thread."""
+        from models import LearnerSession
+
+        if not self._listening:
+            event.listen(LearnerSession, 'after_update', _flag_ended_session)
+            subscribe_model_writes(self._on_write)
+            self._listening = True
+
+        if not app.config.get('PROGRESS_ROLLUP_ENABLED', True):
+            return
+        self.batch_size = app.config.get('PROGRESS_ROLLUP_BATCH_SIZE', self.batch_size)
+        self.interval = app.config.get('PROGRESS_ROLLUP_INTERVAL', self.interval)
+        self.delay = app.config.get('PROGRESS_ROLLUP_DELAY', self.delay)
+        self.app = app
+        app.extensions['progress_rollups'] = self
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='progress-rollups', daemon=True)
+        self._thread.start()
+
+    def shutdown(self):
+        """Stop the aggregation thread."""
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._wake.set()
+        self._thread.join(timeout=5)
+        self._thread = None
+
+    def _on_write(self, table_name, row_id):
+        if table_name in SOURCE_TABLES:
+            self._wake.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.wait(self.interval)
+            # Let a burst of writes land before folding them in
+            self._stop.wait(self.delay)
+            self._wake.clear()
+            try:
+                with self.app.app_context():
+                    self.catch_up()
+            except Exception:
+                logger.exception("Progress rollup pass failed")
+
+    def catch_up(self):
+        """Run passes until every committed session, activity and metric is folded in. Returns the rows processed."""
+        total = 0
+        while True:
+            processed = self.run_once()
+            total += processed
+            if processed < self.batch_size:
+                return total
+
+    def run_once(self):
+        """
+        Fold one batch of new activities, sessions and metrics into the rollups.
+
+        @return (int): The largest number of rows read from one source table.
+        """
+        from models import (AggregateWatermark, LearnerProgress, LearnerSession, LearnerTutor,
+                            LearnerTutorProgress, MetricBucket, PerformanceMetric, QuantileSketch,
+                            SessionActivity, SkillMastery)
+
+        activity_table = SessionActivity.__table__
+        session_table = LearnerSession.__table__
+        learner_tutor_table = LearnerTutor.__table__
+        rollup_table = LearnerTutorProgress.__table__
+        metric_table = PerformanceMetric.__table__
+
+        with self._pass_lock, db.engine.begin() as conn:
+            activity_mark = self._claim_watermark(conn, AggregateWatermark, activity_table.name)
+            session_mark = self._claim_watermark(conn, AggregateWatermark, session_table.name)
+            metric_mark = self._claim_watermark(conn, AggregateWatermark, metric_table.name)
+
+            activities = conn.execute(
+                select(activity_table.c.id, session_table.c.learner_tutor_id, learner_tutor_table.c.learner_id,
+                       learner_tutor_table.c.tutor_id, activity_table.c.score, activity_table.c.timestamp,
+                       skill_column(activity_table).label('skill'))
+                .join(session_table, session_table.c.id == activity_table.c.session_id)
+                .join(learner_tutor_table, learner_tutor_table.c.id == session_table.c.learner_tutor_id)
+                .where(activity_table.c.id > activity_mark)
+                .order_by(activity_table.c.id).limit(self.batch_size)
+            ).all()
+            sessions = conn.execute(
+                select(session_table.c.id, session_table.c.learner_tutor_id, learner_tutor_table.c.learner_id,
+                       session_table.c.start_time)
+                .join(learner_tutor_table, learner_tutor_table.c.id == session_table.c.learner_tutor_id)
+                .where(session_table.c.id > session_mark)
+                .order_by(session_table.c.id).limit(self.batch_size)
+            ).all()
+            metrics = conn.execute(
+                select(metric_table.c.id, metric_table.c.learner_id, metric_table.c.tutor_id,
+                       metric_table.c.metric_name, metric_table.c.metric_value, metric_table.c.recorded_at)
+                .where(metric_table.c.id > metric_mark)
+                .order_by(metric_table.c.id).limit(self.batch_size)
+            ).all()
+            stale = set(conn.execute(
+                select(rollup_table.c.learner_tutor_id).where(rollup_table.c.is_stale.is_(True))
+            ).scalars())
+            if not activities and not sessions and not metrics and not stale:
+                return 0
+
+            fold_metrics(conn, metrics)
+            fold_sketch_values(conn, activities, metrics)
+            fold_attempts(conn, activities)
+
+            self._fold_activities(conn, activities)
+            self._recount_sessions(conn, {row.learner_tutor_id for row in sessions} | stale)
+
+            active_dates = {}
+            for row in activities:
+                active_dates.setdefault(row.learner_id, []).append(row.timestamp.date())
+            for row in sessions:
+                active_dates.setdefault(row.learner_id, []).append(row.start_time.date())
+            stale_learners = conn.execute(
+                select(learner_tutor_table.c.learner_id).where(learner_tutor_table.c.id.in_(stale))
+            ).scalars() if stale else []
+            for learner_id in stale_learners:
+                active_dates.setdefault(learner_id, [])
+            self._roll_up_learners(conn, active_dates)
+
+            if activities:
+                self._set_watermark(conn, AggregateWatermark, activity_table.name, activities[-1].id)
+            if sessions:
+                self._set_watermark(conn, AggregateWatermark, session_table.name, sessions[-1].id)
+            if metrics:
+                self._set_watermark(conn, AggregateWatermark, metric_table.name, metrics[-1].id)
+
+        if activities or sessions or stale:
+            notify_model_write(LearnerTutorProgress.__tablename__)
+            notify_model_write(LearnerProgress.__tablename__)
+        if metrics:
+            notify_model_write(MetricBucket.__tablename__)
+        if activities or metrics:
+            notify_model_write(QuantileSketch.__tablename__)
+        if activities:
+            notify_model_write(SkillMastery.__tablename__)
+        return max(len(activities), len(sessions), len(metrics))
+
+    def _claim_watermark(self, conn, model, name):
+        # Writing first takes the database write lock for the rest of the pass
+        table = model.__table__
+        stmt = sqlite_insert(table).values(name=name, position=0, updated_at=datetime.utcnow())
+        stmt = stmt.on_conflict_do_update(index_elements=[table.c.name], set_={'updated_at': stmt.excluded.updated_at})
+        return conn.execute(stmt.returning(table.c.position)).scalar()
+
+    def _set_watermark(self, conn, model, name, position):
+        table = model.__table__
+        conn.execute(update(table).where(table.c.name == name).values(position=position, updated_at=datetime.utcnow()))
+
+    def _fold_activities(self, conn, activities):
+        from models import LearnerTutorProgress
+
+        deltas = {}
+        for row in activities:
+            delta = deltas.setdefault(row.learner_tutor_id, {
+                'learner_tutor_id': row.learner_tutor_id, 'learner_id': row.learner_id, 'tutor_id': row.tutor_id,
+                'activities': 0, 'scored_activities': 0, 'score_sum': 0.0, 'last_score': None,
+                'last_score_at': None, 'last_activity_at': row.timestamp, 'updated_at': datetime.utcnow()
+            })
+            delta['activities'] += 1
+            if row.score is not None:
+                delta['scored_activities'] += 1
+                delta['score_sum'] += row.score
+                # Offline batches arrive out of order; the latest activity wins, not the latest row
+                if delta['last_score_at'] is None or row.timestamp >= delta['last_score_at']:
+                    delta['last_score'] = row.score
+                    delta['last_score_at'] = row.timestamp
+            delta['last_activity_at'] = max(delta['last_activity_at'], row.timestamp)
+        if not deltas:
+            return
+
+        table = LearnerTutorProgress.__table__
+        stmt = sqlite_insert(table)
+        # False when the batch has no scored activity (NULL last_score_at)
+        newer_score = stmt.excluded.last_score_at >= func.coalesce(table.c.last_score_at, stmt.excluded.last_score_at)
+        stmt = stmt.on_conflict_do_update(index_elements=[table.c.learner_tutor_id], set_={
+            'activities': table.c.activities + stmt.excluded.activities,
+            'scored_activities': table.c.scored_activities + stmt.excluded.scored_activities,
+            'score_sum': table.c.score_sum + stmt.excluded.score_sum,
+            'last_score': case((newer_score, stmt.excluded.last_score), else_=table.c.last_score),
+            'last_score_at': case((newer_score, stmt.excluded.last_score_at), else_=table.c.last_score_at),
+            'last_activity_at': func.max(func.coalesce(table.c.last_activity_at, stmt.excluded.last_activity_at),
+                                         stmt.excluded.last_activity_at),
+            'updated_at': stmt.excluded.updated_at
+        })
+        conn.execute(stmt, list(deltas.values()))
+
+    def _recount_sessions(self, conn, learner_tutor_ids):
+        from models import LearnerSession, LearnerTutor, LearnerTutorProgress
+
+        if not learner_tutor_ids:
+            return
+        session_table = LearnerSession.__table__
+        learner_tutor_table = LearnerTutor.__table__
+        # Few sessions per learner-tutor, all reached through the learner_tutor_id index
+        totals = conn.execute(
+            select(learner_tutor_table.c.id, learner_tutor_table.c.learner_id, learner_tutor_table.c.tutor_id,
+                   func.count(session_table.c.id), func.count(session_table.c.end_time),
+                   func.coalesce(func.sum(session_table.c.duration_minutes), 0))
+            .outerjoin(session_table, session_table.c.learner_tutor_id == learner_tutor_table.c.id)
+            .where(learner_tutor_table.c.id.in_(list(learner_tutor_ids)))
+            .group_by(learner_tutor_table.c.id)
+        ).all()
+        if not totals:
+            return
+
+        table = LearnerTutorProgress.__table__
+        stmt = sqlite_insert(table)
+        stmt = stmt.on_conflict_do_update(index_elements=[table.c.learner_tutor_id], set_={
+            'sessions': stmt.excluded.sessions,
+            'ended_sessions': stmt.excluded.ended_sessions,
+            'total_minutes': stmt.excluded.total_minutes,
+            'is_stale': False,
+            'updated_at': stmt.excluded.updated_at
+        })
+        conn.execute(stmt, [{
+            'learner_tutor_id': learner_tutor_id, 'learner_id': learner_id, 'tutor_id': tutor_id,
+            'sessions': sessions, 'ended_sessions': ended, 'total_minutes': minutes,
+            'is_stale': False, 'updated_at': datetime.utcnow()
+        } for learner_tutor_id, learner_id, tutor_id, sessions, ended, minutes in totals])
+
+    def _roll_up_learners(self, conn, active_dates):
+        from models import LearnerProgress, LearnerTutorProgress
+
+        if not active_dates:
+            return
+        rollup_table = LearnerTutorProgress.__table__
+        learner_table = LearnerProgress.__table__
+        learner_ids = list(active_dates)
+
+        latest = rollup_table.alias('latest')
+        last_score = (
+            select(latest.c.last_score)
+            .where(latest.c.learner_id == rollup_table.c.learner_id, latest.c.last_score.is_not(None))
+            .order_by(latest.c.last_score_at.desc(), latest.c.last_activity_at.desc())
+            .limit(1).scalar_subquery()
+        )
+        sums = conn.execute(
+            select(rollup_table.c.learner_id, func.count(), func.sum(rollup_table.c.sessions),
+                   func.sum(rollup_table.c.total_minutes), func.sum(rollup_table.c.activities),
+                   func.sum(rollup_table.c.scored_activities), func.sum(rollup_table.c.score_sum),
+                   last_score, func.max(rollup_table.c.last_activity_at))
+            .where(rollup_table.c.learner_id.in_(learner_ids))
+            .group_by(rollup_table.c.learner_id)
+        ).all()
+        streaks = {
+            row.learner_id: row for row in conn.execute(
+                select(learner_table.c.learner_id, learner_table.c.last_active_date, learner_table.c.streak_days,
+                       learner_table.c.longest_streak_days)
+                .where(learner_table.c.learner_id.in_(learner_ids))
+            )
+        }
+
+        # A back-dated batch (e.g. an offline sync) may fill a gap in a past streak: recount those from scratch
+        backfilled = [
+            learner_id for learner_id, row in streaks.items()
+            if row.last_active_date is not None and any(day <= row.last_active_date for day in active_dates[learner_id])
+        ]
+        history = self._active_dates(conn, backfilled)
+
+        rows = []
+        for learner_id, tutors, sessions, minutes, activities, scored, score_sum, last_score, last_at in sums:
+            previous = streaks.get(learner_id)
+            if learner_id in history:
+                last_date, streak, longest = apply_active_dates(None, 0, 0, history[learner_id])
+                longest = max(longest, previous.longest_streak_days or 0)
+            else:
+                last_date, streak, longest = apply_active_dates(
+                    previous.last_active_date if previous else None,
+                    previous.streak_days if previous else 0,
+                    previous.longest_streak_days if previous else 0,
+                    active_dates[learner_id]
+                )
+            rows.append({
+                'learner_id': learner_id, 'tutors': tutors, 'sessions': sessions or 0,
+                'total_minutes': minutes or 0, 'activities': activities or 0, 'scored_activities': scored or 0,
+                'score_sum': score_sum or 0, 'last_score': last_score, 'last_activity_at': last_at,
+                'last_active_date': last_date, 'streak_days': streak, 'longest_streak_days': longest,
+                'updated_at': datetime.utcnow()
+            })
+        if not rows:
+            return
+
+        stmt = sqlite_insert(learner_table)
+        stmt = stmt.on_conflict_do_update(index_elements=[learner_table.c.learner_id], set_={
+            column: stmt.excluded[column] for column in rows[0] if column != 'learner_id'
+        })
+        conn.execute(stmt, rows)
+
+    def _active_dates(self, conn, learner_ids):
+        from models import LearnerSession, LearnerTutor, SessionActivity
+
+        if not learner_ids:
+            return {}
+        activity_table = SessionActivity.__table__
+        session_table = LearnerSession.__table__
+        learner_tutor_table = LearnerTutor.__table__
+        activity_days = (
+            select(learner_tutor_table.c.learner_id, func.date(activity_table.c.timestamp))
+            .join(session_table, session_table.c.id == activity_table.c.session_id)
+            .join(learner_tutor_table, learner_tutor_table.c.id == session_table.c.learner_tutor_id)
+            .where(learner_tutor_table.c.learner_id.in_(learner_ids))
+        )
+        session_days = (
+            select(learner_tutor_table.c.learner_id, func.date(session_table.c.start_time))
+            .join(learner_tutor_table, learner_tutor_table.c.id == session_table.c.learner_tutor_id)
+            .where(learner_tutor_table.c.learner_id.in_(learner_ids))
+        )
+        dates = {}
+        for learner_id, day in conn.execute(union(activity_days, session_days)):
+            if day:
+                dates.setdefault(learner_id, []).append(date.fromisoformat(day))
+        return dates
+
+
+progress_aggregator = ProgressAggregator()
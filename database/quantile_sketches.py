@@ -0,0 +1,328 @@
+"""
+Cohort percentiles from precomputed quantile sketches.
+
+`quantile_sketches` holds a KLL sketch per tutor and per course of every
+performance metric, and of activity scores under the name 'activity_score'.
+The progress aggregator (see database/progress_rollups.py) folds new
+`performance_metrics` and `session_activities` rows into the sketches in the
+same pass as the rollups. A value counts towards its tutor, and towards every
+course that both assigns the tutor and enrolls the learner at the time the
+value is folded in.
+
+Course sketches therefore overlap when courses share tutors and learners. A
+merge of such courses counts a shared value once per course. Sketches keep no
+record of which values they hold, so the overlap cannot be subtracted. A
+tutor cohort has no overlap: each value is in exactly one tutor sketch.
+
+A sketch keeps a few hundred values whatever the number of values folded in,
+and estimates any quantile or rank to within about 1.7 / QUANTILE_SKETCH_K of
+the true rank. Sketches are mergeable, so the distribution of any union of
+courses or tutors is read by merging their rows. No values are scanned.
+"""
+
+import logging
+import math
+import random
+import struct
+from datetime import datetime
+
+from flask import current_app
+from sqlalchemy import func, select, tuple_
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from database.db import db
+
+logger = logging.getLogger(__name__)
+
+SCOPES = ('tutor', 'course')
+ACTIVITY_SCORE = 'activity_score'
+DEFAULT_K = 200
+DEFAULT_FRACTIONS = (0.1, 0.25, 0.5, 0.75, 0.9)
+
+# Lower levels keep 2/3 of the capacity of the level above them
+_DECAY = 2 / 3
+_VERSION = 1
+# version, k, count, min, max, number of levels
+_HEADER = struct.Struct('<BHQddB')
+
+
+class KLLSketch:
+    """
+    KLL quantile sketch (Karnin, Lang and Liberty, 2016).
+
+    Values enter level 0. When the sketch is full, a level is sorted and every
+    other value, starting at a random offset, moves up a level with twice the
+    weight. The rest of that level is dropped. The total weight always equals
+    the number of values folded in.
+    """
+
+    def __init__(self, k=DEFAULT_K):
+        self.k = k
+        self.count = 0
+        self.min = None
+        self.max = None
+        self.levels = [[]]
+        self._size = 0
+
+    def _capacity(self, level):
+        depth = len(self.levels) - level - 1
+        return max(int(math.ceil(self.k * _DECAY ** depth)), 2)
+
+    def _max_size(self):
+        return sum(self._capacity(level) for level in range(len(self.levels)))
+
+    def update(self, value):
+        """Fold one value into the sketch."""
+        value = float(value)
+        self.levels[0].append(value)
+        self._size += 1
+        self.count += 1
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+        if self._size >= self._max_size():
+            self._compress()
+        return self
+
+    def merge(self, other):
+        """Fold another sketch into this one; returns this sketch."""
+        if not other.count:
+            return self
+        while len(self.levels) < len(other.levels):
+            self.levels.append([])
+        for level, items in enumerate(other.levels):
+            self.levels[level].extend(items)
+        self._size += other._size
+        self.count += other.count
+        self.min = other.min if self.min is None else min(self.min, other.min)
+        self.max = other.max if self.max is None else max(self.max, other.max)
+        self._compress()
+        return self
+
+    def _compress(self):
+        while self._size >= self._max_size():
+            for level in range(len(self.levels)):
+                if len(self.levels[level]) >= self._capacity(level):
+                    if level + 1 == len(self.levels):
+                        self.levels.append([])
+                    self._compact(level)
+                    break
+
+    def _compact(self, level):
+        items = sorted(self.levels[level])
+        # An odd value out stays behind
+        keep = items[:len(items) % 2]
+        pairs = items[len(keep):]
+        self.levels[level + 1].extend(pairs[random.getrandbits(1)::2])
+        self.levels[level] = keep
+        self._size -= len(pairs) // 2
+
+    def _weighted(self):
+        return sorted((value, 1 << level) for level, items in enumerate(self.levels) for value in items)
+
+    def quantiles(self, fractions):
+        """
+        Estimated values at the given fractions of the distribution.
+
+        @param fractions (iterable): Fractions between 0 and 1; 0 and 1 give the exact min and max.
+        @return (list): One value per fraction, or Nones if the sketch is empty.
+        """
+        if not self.count:
+            return [None for _ in fractions]
+        weighted = self._weighted()
+        results = []
+        for fraction in fractions:
+            if fraction <= 0:
+                results.append(self.min)
+                continue
+            if fraction >= 1:
+                results.append(self.max)
+                continue
+            target, seen = fraction * self.count, 0
+            for value, weight in weighted:
+                seen += weight
+                if seen >= target:
+                    results.append(value)
+                    break
+            else:
+                results.append(self.max)
+        return results
+
+    def rank(self, value):
+        """Estimated fraction of values below `value`, counting equal values as half below."""
+        if not self.count:
+            return None
+        below = equal = 0
+        for item, weight in self._weighted():
+            if item < value:
+                below += weight
+            elif item == value:
+                equal += weight
+            else:
+                break
+        return (below + equal / 2) / self.count
+
+    def to_bytes(self):
+        """Compact serialization: a fixed header, the level lengths and the retained values as doubles."""
+        lengths = [len(items) for items in self.levels]
+        values = [value for items in self.levels for value in items]
+        return b''.join((
+            _HEADER.pack(_VERSION, self.k, self.count, self.min or 0.0, self.max or 0.0, len(lengths)),
+            struct.pack(f'<{len(lengths)}I', *lengths),
+            struct.pack(f'<{len(values)}d', *values)
+        ))
+
+    @classmethod
+    def from_bytes(cls, data):
+        """Rebuild a sketch serialized by to_bytes."""
+        version, k, count, low, high, level_count = _HEADER.unpack_from(data)
+        if version != _VERSION:
+            raise ValueError(f"Unsupported sketch version: {version}")
+        offset = _HEADER.size
+        lengths = struct.unpack_from(f'<{level_count}I', data, offset)
+        offset += 4 * level_count
+        values = struct.unpack_from(f'<{sum(lengths)}d', data, offset)
+
+        sketch = cls(k)
+        sketch.count = count
+        sketch.min, sketch.max = (low, high) if count else (None, None)
+        sketch.levels, start = [], 0
+        for length in lengths:
+            sketch.levels.append(list(values[start:start + length]))
+            start += length
+        sketch._size = len(values)
+        return sketch
+
+
+def _sketch_size():
+    return current_app.config.get('QUANTILE_SKETCH_K', DEFAULT_K)
+
+
+def fold_sketch_values(conn, activities, metrics):
+    """
+    Add activity scores and performance metrics to the tutor and course sketches;
+    call inside the transaction that advances the watermarks.
+
+    @param conn (Connection): An open transaction.
+    @param activities (list): Rows with learner_id, tutor_id and score.
+    @param metrics (list): Rows with learner_id, tutor_id, metric_name and metric_value.
+    """
+    from models import CourseEnrollment, CourseTutor, QuantileSketch
+
+    values = []
+    values.extend((row.learner_id, row.tutor_id, ACTIVITY_SCORE, row.score)
+                  for row in activities if row.score is not None)
+    values.extend((row.learner_id, row.tutor_id, row.metric_name, row.metric_value)
+                  for row in metrics if row.metric_value is not None)
+    if not values:
+        return
+
+    # Courses that assign the tutor and enroll the learner
+    enrollment_table = CourseEnrollment.__table__
+    course_tutor_table = CourseTutor.__table__
+    courses = {}
+    for course_id, learner_id, tutor_id in conn.execute(
+        select(course_tutor_table.c.course_id, enrollment_table.c.learner_id, course_tutor_table.c.tutor_id)
+        .join(enrollment_table, enrollment_table.c.course_id == course_tutor_table.c.course_id)
+        .where(course_tutor_table.c.tutor_id.in_({tutor_id for _, tutor_id, _, _ in values}),
+               enrollment_table.c.learner_id.in_({learner_id for learner_id, _, _, _ in values}))
+    ):
+        courses.setdefault((learner_id, tutor_id), set()).add(course_id)
+
+    grouped = {}
+    for learner_id, tutor_id, metric_name, value in values:
+        grouped.setdefault(('tutor', tutor_id, metric_name), []).append(value)
+        for course_id in courses.get((learner_id, tutor_id), ()):
+            grouped.setdefault(('course', course_id, metric_name), []).append(value)
+
+    table = QuantileSketch.__table__
+    k = _sketch_size()
+    sketches = {}
+    keys = list(grouped)
+    for start in range(0, len(keys), 300):
+        for scope, owner_id, metric_name, data in conn.execute(
+            select(table.c.scope, table.c.owner_id, table.c.metric_name, table.c.data)
+            .where(tuple_(table.c.scope, table.c.owner_id, table.c.metric_name).in_(keys[start:start + 300]))
+        ):
+            sketches[(scope, owner_id, metric_name)] = KLLSketch.from_bytes(data)
+
+    rows = []
+    for key, new_values in grouped.items():
+        sketch = sketches.get(key) or KLLSketch(k)
+        for value in new_values:
+            sketch.update(value)
+        rows.append({'scope': key[0], 'owner_id': key[1], 'metric_name': key[2], 'count': sketch.count,
+                     'data': sketch.to_bytes(), 'updated_at': datetime.utcnow()})
+
+    stmt = sqlite_insert(table)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[table.c.scope, table.c.owner_id, table.c.metric_name],
+        set_={'count': stmt.excluded.count, 'data': stmt.excluded.data, 'updated_at': stmt.excluded.updated_at}
+    )
+    conn.execute(stmt, rows)
+
+
+def owner_sketches(scope, owner_ids, metric_name):
+    """
+    The sketches of a metric for some tutors or courses. Merge them for the distribution of their union.
+
+    @param scope (str): 'tutor' or 'course'.
+    @param owner_ids (iterable): The tutors or courses.
+    @param metric_name (str): A performance metric, or 'activity_score'.
+    @return (dict): Owner id to KLLSketch; owners with no values are left out.
+    """
+    from models import QuantileSketch
+
+    if scope not in SCOPES:
+        raise ValueError(f"Unknown sketch scope: {scope}")
+    table = QuantileSketch.__table__
+    return {
+        owner_id: KLLSketch.from_bytes(data) for owner_id, data in db.session.execute(
+            select(table.c.owner_id, table.c.data)
+            .where(table.c.scope == scope, table.c.owner_id.in_(list(owner_ids)),
+                   table.c.metric_name == metric_name)
+        )
+    }
+
+
+def describe(sketch, fractions=DEFAULT_FRACTIONS):
+    """
+    @return (dict): count, min, max and 'quantiles' keyed by percentile ('p50', 'p90', ...).
+    """
+    return {
+        'count': sketch.count, 'min': sketch.min, 'max': sketch.max,
+        'quantiles': {f"p{fraction * 100:g}": value
+                      for fraction, value in zip(fractions, sketch.quantiles(fractions))}
+    }
+
+
+def learner_mean(learner_id, metric_name, tutor_ids):
+    """
+    A learner's mean value of a metric on a cohort's tutors, so it is compared
+    with values of the same tutors. Activity scores are read from the
+    per-tutor rollups; performance metrics from the learner's own rows (the
+    metric buckets keep no tutor), reached through the learner index.
+
+    @param learner_id (int): The learner.
+    @param metric_name (str): A performance metric name or 'activity_score'.
+    @param tutor_ids (iterable): The cohort's tutors.
+    @return (float): The mean, or None if the learner has no values on those tutors.
+    """
+    from models import LearnerTutorProgress, PerformanceMetric
+
+    tutor_ids = list(tutor_ids)
+    if not tutor_ids:
+        return None
+    if metric_name == ACTIVITY_SCORE:
+        table = LearnerTutorProgress.__table__
+        count, value_sum = db.session.execute(
+            select(func.sum(table.c.scored_activities), func.sum(table.c.score_sum))
+            .where(table.c.learner_id == learner_id, table.c.tutor_id.in_(tutor_ids))
+        ).one()
+    else:
+        table = PerformanceMetric.__table__
+        count, value_sum = db.session.execute(
+            select(func.count(table.c.metric_value), func.sum(table.c.metric_value))
+            .where(table.c.learner_id == learner_id, table.c.metric_name == metric_name,
+                   table.c.tutor_id.in_(tutor_ids))
+        ).one()
+    return value_sum / count if count else None
@@ -0,0 +1,319 @@
+"""
+Query plan regression checks.
+
+`check_query_plans()` builds a scratch SQLite database from database/schema/*.sql
+with force_init_db, as for a new deployment. A model column the schema lacks
+fails the check, since the application could not write it. It then seeds a
+few rows per model table and runs
+the model classmethods and the queries behind the routes while recording each
+statement they execute. It then runs EXPLAIN QUERY PLAN on every recorded
+statement.
+
+A statement whose plan scans a whole table without an index ("SCAN <table>")
+fails the check, unless its case lists that table as an intended scan. Walks
+of an index in order (e.g. ORDER BY ... LIMIT over an index) pass.
+
+Run it with `python run.py --check-query-plans`. It exits non-zero when any
+query regresses to a full scan.
+"""
+
+import os
+import re
+import tempfile
+from datetime import date, datetime, timedelta
+
+from flask import Flask
+from sqlalchemy import Boolean, Date, DateTime, Float, Integer, LargeBinary, event, inspect as sa_inspect
+
+from database.db import db, force_init_db
+
+SEED_ROWS = 20
+
+_SCAN = re.compile(r'^SCAN (\w+)(?: AS (\w+))?(.*)$')
+
+
+class PlanCase:
+    """A query or group of queries to check, run against the seeded database."""
+
+    def __init__(self, label, run, scans=()):
+        """
+        @param label (str): Name shown in the report.
+        @param run (callable): Runs the queries; called inside the scratch app context.
+        @param scans (tuple): Tables this case is meant to scan in full (e.g. counting every row).
+        """
+        self.label = label
+        self.run = run
+        self.scans = set(scans)
+
+
+class PlanResult:
+    """The recorded statements of a case and any full scans found in their plans."""
+
+    def __init__(self, case):
+        self.case = case
+        self.statements = []  # (sql, plan lines)
+        self.violations = []  # (sql, plan line)
+        self.error = None
+
+    @property
+    def ok(self):
+        return self.error is None and not self.violations
+
+
+def _cases():
+    """Model classmethods and the queries behind the routes, each with seeded ids."""
+    from models import (Admin, AdminLog, Agent, ContentChunk, Course, CourseEnrollment, CourseTutor, Instructor,
+                        Learner, LearnerSession, LearnerTutor, PerformanceMetric, Tutor, TutorModule,
+                        TutorRevision, User)
+    from database import analytics_engine, metric_series, quantile_sketches, report_export
+    from database.identity_cache import identity_cache
+    from database.jobs import job_scheduler
+    from database.progress_rollups import learner_summary
+
+    now = datetime.utcnow()
+
+    def export(dataset):
+        columns, chunks = report_export.export_rows([1, 2], [1, 2], dataset=dataset)
+        for _ in chunks:
+            pass
+
+    def modules():
+        module = db.session.get(TutorModule, 2)
+        module.get_next_module()
+        module.get_previous_module()
+
+    def admin_dashboard():
+        User.query.filter(User.last_login >= now - timedelta(days=7)).count()
+        User.query.order_by(User.created_at.desc()).limit(5).all()
+        Tutor.query.filter_by(is_published=True).count()
+        User.query.filter(User.created_at >= now - timedelta(days=30)).count()
+        Tutor.query.filter(Tutor.created_at >= now - timedelta(days=30)).count()
+        Course.query.filter(Course.created_at >= now - timedelta(days=30)).count()
+
+    return [
+        PlanCase('User.get_user_by_email', lambda: User.get_user_by_email('email-1@example.com')),
+        PlanCase('User.get_user_by_id', lambda: User.get_user_by_id(1)),
+        PlanCase('Instructor.get_instructor_by_user_id', lambda: Instructor.get_instructor_by_user_id(1)),
+        PlanCase('Instructor.get_all_instructors', Instructor.get_all_instructors, scans=('instructors',)),
+        PlanCase('Learner.get_learner_by_user_id', lambda: Learner.get_learner_by_user_id(1)),
+        PlanCase('Learner.get_all_learners', Learner.get_all_learners, scans=('learners',)),
+        PlanCase('Admin.get_admin_by_user_id', lambda: Admin.get_admin_by_user_id(1)),
+        PlanCase('Admin.get_all_admins', Admin.get_all_admins, scans=('admins',)),
+        PlanCase('AdminLog.get_logs_by_admin', lambda: AdminLog.get_logs_by_admin(1)),
+        PlanCase('AdminLog.get_logs_by_action', lambda: AdminLog.get_logs_by_action('action-1')),
+        PlanCase('AdminLog.get_logs_by_target', lambda: AdminLog.get_logs_by_target('target_type-1', 1)),
+        PlanCase('Tutor.get_tutor_with_content', lambda: Tutor.get_tutor_with_content(1)),
+        PlanCase('Tutor.get_published_tutors', Tutor.get_published_tutors),
+        PlanCase('Tutor.get_tutors_by_instructor', lambda: Tutor.get_tutors_by_instructor(1)),
+        PlanCase('Tutor by instructor, newest first',
+                 lambda: Tutor.query.filter_by(instructor_id=1).order_by(Tutor.updated_at.desc()).all()),
+        PlanCase('TutorModule next and previous', modules),
+        PlanCase('TutorModule by tutor in sequence',
+                 lambda: TutorModule.query.filter_by(tutor_id=1).order_by(TutorModule.sequence_order).all()),
+        PlanCase('TutorRevision.get_history', lambda: TutorRevision.get_history(1)),
+        PlanCase('ContentChunk.load_many', lambda: ContentChunk.load_many(['hash-1', 'hash-2'])),
+        PlanCase('Agent.get_by_tutor', lambda: Agent.get_by_tutor(1, with_blobs=True)),
+        PlanCase('Course.get_active_courses', Course.get_active_courses),
+        PlanCase('Course.get_courses_by_instructor', lambda: Course.get_courses_by_instructor(1)),
+        PlanCase('CourseEnrollment.get_enrollments_by_learner', lambda: CourseEnrollment.get_enrollments_by_learner(1)),
+        PlanCase('CourseEnrollment.get_enrollments_by_course', lambda: CourseEnrollment.get_enrollments_by_course(1)),
+        PlanCase('CourseEnrollment by course and learner',
+                 lambda: CourseEnrollment.query.filter_by(course_id=1, learner_id=1).first()),
+        PlanCase('CourseTutor.get_assignments_by_tutor', lambda: CourseTutor.get_assignments_by_tutor(1)),
+        PlanCase('CourseTutor.get_assignments_by_course', lambda: CourseTutor.get_assignments_by_course(1)),
+        PlanCase('CourseTutor by course and tutor', lambda: CourseTutor.query.filter_by(course_id=1, tutor_id=1).first()),
+        PlanCase('LearnerTutor.get_by_learner_and_tutor', lambda: LearnerTutor.get_by_learner_and_tutor(1, 1)),
+        PlanCase('LearnerSession.get_by_learner', lambda: LearnerSession.get_by_learner(1)),
+        PlanCase('PerformanceMetric.get_by_learner_and_metric',
+                 lambda: PerformanceMetric.get_by_learner_and_metric(1, 'metric_name-1', since=now, limit=10)),
+        PlanCase('PerformanceMetric.get_by_tutor_and_metric',
+                 lambda: PerformanceMetric.get_by_tutor_and_metric(1, 'metric_name-1', since=now, limit=10)),
+        PlanCase('identity_cache.principal', lambda: identity_cache.principal(1)),
+        PlanCase('admin dashboard', admin_dashboard),
+        PlanCase('analytics_engine.load_frames', lambda: analytics_engine.load_frames([1, 2], [1, 2])),
+        PlanCase('analytics_engine.course_scope', lambda: analytics_engine.course_scope(1)),
+        PlanCase('analytics_engine.instructor_tutor_ids', lambda: analytics_engine.instructor_tutor_ids(1)),
+        PlanCase('progress_rollups.learner_summary', lambda: learner_summary(1)),
+        PlanCase('metric_series.metric_series',
+                 lambda: metric_series.metric_series('learner', 1, 'metric_name-1', start=now - timedelta(days=30))),
+        PlanCase('quantile_sketches.owner_sketches',
+                 lambda: quantile_sketches.owner_sketches('course', [1, 2], 'metric_name-1')),
+        PlanCase('quantile_sketches.learner_mean',
+                 lambda: (quantile_sketches.learner_mean(1, 'metric_name-1', [1, 2]),
+                          quantile_sketches.learner_mean(1, quantile_sketches.ACTIVITY_SCORE, [1, 2]))),
+        PlanCase('report_export activities', lambda: export('activities')),
+        PlanCase('report_export sessions', lambda: export('sessions')),
+        PlanCase('Job lookup', lambda: job_scheduler.get(1)),
+        PlanCase('Job claim', job_scheduler._claim),
+        PlanCase('Periodic job schedule', job_scheduler._enqueue_periodic),
+        PlanCase('Job purge and lease sweep',
+                 lambda: (job_scheduler.requeue_expired_leases(), job_scheduler.purge_finished())),
+    ]
+
+
+def _value(column, i):
+    # Column n of row i: foreign keys and ids point at row i of the other tables, strings are unique per row
+    if column.name == 'email':
+        return f"email-{i}@example.com"
+    if column.name == 'role':
+        return ('admin', 'instructor', 'learner')[i % 3]
+    if column.name == 'admin_level':
+        return 'standard'
+    default = column.default.arg if column.default is not None and column.default.is_scalar else None
+    if isinstance(default, str):
+        return default  # e.g. '{}' for JSON columns
+    if column.foreign_keys or column.name.endswith('_id'):
+        return i
+    if isinstance(column.type, Boolean):
+        return i % 2 == 0
+    if isinstance(column.type, DateTime):
+        return datetime.utcnow() - timedelta(hours=i)
+    if isinstance(column.type, Date):
+        return date.today() - timedelta(days=i)
+    if isinstance(column.type, Integer):
+        return i
+    if isinstance(column.type, Float):
+        return i / SEED_ROWS
+    if isinstance(column.type, LargeBinary):
+        return f"{column.name}-{i}".encode()
+    return f"{column.name}-{i}"
+
+
+def _seed():
+    with db.engine.begin() as conn:
+        for table in db.metadata.sorted_tables:
+            conn.execute(table.insert(), [
+                {column.name: _value(column, i) for column in table.columns
+                 if not (column.primary_key and isinstance(column.type, Integer))}
+                for i in range(1, SEED_ROWS + 1)
+            ])
+
+
+def _schema_drift():
+    """
+    Differences between the models and the schema-built database that break writes.
+
+    @return (list): Model tables and columns the schema lacks ('table', 'table.column'),
+                    and NOT NULL schema columns without a default that no model maps.
+    """
+    inspector = sa_inspect(db.engine)
+    existing = set(inspector.get_table_names())
+    drift = []
+    for table in db.metadata.sorted_tables:
+        if table.name not in existing:
+            drift.append(table.name)
+            continue
+        columns = inspector.get_columns(table.name)
+        names = {column['name'] for column in columns}
+        drift.extend(f"{table.name}.{column.name}" for column in table.columns if column.name not in names)
+        drift.extend(
+            f"{table.name}.{column['name']} (NOT NULL, not mapped)" for column in columns
+            if column['name'] not in table.columns and not column['nullable'] and column['default'] is None
+            and not column.get('primary_key')
+        )
+    return drift
+
+
+def _plan(conn, statement, parameters):
+    rows = conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters).all()
+    return [row[3] for row in rows]
+
+
+def _full_scans(plan, tables, allowed):
+    scans = []
+    for line in plan:
+        match = _SCAN.match(line)
+        if not match or match.group(3).strip():
+            continue  # not a scan, or a scan through an index
+        table = match.group(1)
+        if table in tables and table not in allowed:
+            scans.append(line)
+    return scans
+
+
+def check_query_plans(cases=None):
+    """
+    Run the plan checks on a scratch database.
+
+    @param cases (list): PlanCase objects; defaults to the model and route queries.
+    @return (list): A PlanResult per case.
+    """
+    from config import config
+    import models  # noqa: F401 - registers every table on db.metadata
+
+    fd, path = tempfile.mkstemp(suffix='.db', prefix='query-plans-')
+    os.close(fd)
+    app = Flask(__name__)
+    app.config.from_object(config['testing'])
+    app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{path}"
+    app.config['SQLALCHEMY_ECHO'] = False
+    db.init_app(app)
+
+    results = []
+    try:
+        with app.app_context():
+            if not force_init_db(app):
+                raise RuntimeError("The schema files did not build a database; see the log")
+            drift = _schema_drift()
+            if drift:
+                result = PlanResult(PlanCase('Schema matches the models', lambda: None))
+                result.error = f"Model and database/schema differ: {', '.join(drift)}"
+                db.engine.dispose()
+                return [result]
+            _seed()
+            tables = set(sa_inspect(db.engine).get_table_names())
+
+            recorded = []
+
+            def record(conn, cursor, statement, parameters, context, executemany):
+                if not executemany and statement.lstrip().upper().startswith(('SELECT', 'UPDATE', 'DELETE', 'WITH')):
+                    recorded.append((statement, parameters))
+
+            event.listen(db.engine, 'before_cursor_execute', record)
+            try:
+                for case in cases if cases is not None else _cases():
+                    result = PlanResult(case)
+                    recorded.clear()
+                    try:
+                        case.run()
+                    except Exception as e:
+                        result.error = f"{type(e).__name__}: {e}"
+                    finally:
+                        db.session.rollback()
+                        db.session.remove()
+                    statements = list(recorded)
+                    with db.engine.connect() as conn:
+                        for statement, parameters in statements:
+                            plan = _plan(conn, statement, parameters)
+                            result.statements.append((statement, plan))
+                            result.violations.extend(
+                                (statement, line) for line in _full_scans(plan, tables, case.scans)
+                            )
+                    recorded.clear()
+                    results.append(result)
+            finally:
+                event.remove(db.engine, 'before_cursor_execute', record)
+            db.engine.dispose()
+    finally:
+        os.remove(path)
+    return results
+
+
+def format_report(results, verbose=False):
+    """Render check results as text; failing cases show the offending statement and plan line."""
+    lines = []
+    for result in results:
+        status = 'ok' if result.ok else 'FAIL'
+        lines.append(f"[{status}] {result.case.label} ({len(result.statements)} statements)")
+        if result.error:
+            lines.append(f"    error: {result.error}")
+        for statement, line in result.violations:
+            lines.append(f"    full scan: {line}")
+            lines.append(f"      in: {' '.join(statement.split())}")
+        if verbose:
+            for statement, plan in result.statements:
+                lines.append(f"    {' '.join(statement.split())}")
+                lines.extend(f"      {step}" for step in plan)
+    failed = sum(1 for result in results if not result.ok)
+    lines.append(f"{len(results) - failed} passed, {failed} failed")
+    return '\n'.join(lines)
@@ -0,0 +1,123 @@
+"""
+Streaming row-level report exports.
+
+Exports list every activity or session behind an instructor, course or tutor
+report as CSV or NDJSON. Rows are read in keyset pages of EXPORT_CHUNK_SIZE
+(`WHERE id > :last ORDER BY id LIMIT n`) and encoded as they arrive, so memory
+stays flat however large the export is. Each page is read on its own
+short-lived connection. A slow download therefore never holds a read
+transaction open, and in rollback-journal mode that would block writers.
+
+Rows are ordered by their `id`, which is always the first column. A client
+whose download was cut off passes the last id it received as `after`, and the
+export continues from the next row.
+"""
+
+import csv
+import io
+import json
+from datetime import datetime
+
+from sqlalchemy import func, literal_column, select
+
+from database.db import db
+
+EXPORT_FORMATS = {'csv': 'text/csv', 'ndjson': 'application/x-ndjson'}
+EXPORT_DATASETS = ('activities', 'sessions')
+
+
+def _activity_query(tutor_ids, learner_ids, after):
+    from models import LearnerSession, LearnerTutor, SessionActivity
+
+    query = (
+        select(SessionActivity.id, SessionActivity.timestamp, LearnerTutor.learner_id, LearnerTutor.tutor_id,
+               SessionActivity.session_id, SessionActivity.activity_type, SessionActivity.score,
+               func.json_extract(SessionActivity.activity_data, literal_column("'$.module_id'")).label('module_id'))
+        .join(LearnerSession, LearnerSession.id == SessionActivity.session_id)
+        .join(LearnerTutor, LearnerTutor.id == LearnerSession.learner_tutor_id)
+        .where(LearnerTutor.tutor_id.in_(tutor_ids), SessionActivity.id > after)
+        .order_by(SessionActivity.id)
+    )
+    if learner_ids is not None:
+        query = query.where(LearnerTutor.learner_id.in_(learner_ids))
+    return query
+
+
+def _session_query(tutor_ids, learner_ids, after):
+    from models import LearnerSession, LearnerTutor
+
+    query = (
+        select(LearnerSession.id, LearnerSession.start_time, LearnerSession.end_time, LearnerSession.duration_minutes,
+               LearnerTutor.learner_id, LearnerTutor.tutor_id, LearnerTutor.completion_percentage)
+        .join(LearnerTutor, LearnerTutor.id == LearnerSession.learner_tutor_id)
+        .where(LearnerTutor.tutor_id.in_(tutor_ids), LearnerSession.id > after)
+        .order_by(LearnerSession.id)
+    )
+    if learner_ids is not None:
+        query = query.where(LearnerTutor.learner_id.in_(learner_ids))
+    return query
+
+
+def export_rows(tutor_ids, learner_ids=None, dataset='activities', after=0, chunk_size=1000):
+    """
+    Stream the rows of an export.
+
+    @param tutor_ids (list): Tutors whose data is exported.
+    @param learner_ids (list): Optionally restrict to these learners (e.g. a course's enrollment).
+    @param dataset (str): 'activities' or 'sessions'.
+    @param after (int): Resume after the row with this id.
+    @param chunk_size (int): Rows per page.
+    @return (tuple): (column names, generator of row-tuple chunks). Each page is
+                     queried when the generator reaches it, on its own connection.
+    """
+    if dataset not in EXPORT_DATASETS:
+        raise ValueError(f"Unknown dataset: {dataset}")
+    build = _activity_query if dataset == 'activities' else _session_query
+    tutor_ids = list(tutor_ids)
+    learner_ids = list(learner_ids) if learner_ids is not None else None
+    columns = [column.name for column in build(tutor_ids, learner_ids, after).selected_columns]
+    # Bound here: the generator may run after the app context of the request has been torn down
+    engine = db.engine
+
+    def chunks():
+        last = after
+        while True:
+            with engine.connect() as conn:
+                rows = conn.execute(build(tutor_ids, learner_ids, last).limit(chunk_size)).all()
+            if rows:
+                yield rows
+                last = rows[-1][0]
+            if len(rows) < chunk_size:
+                return
+
+    return columns, chunks()
+
+
+def _value(value):
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+def encode_csv(columns, chunks):
+    """Encode row chunks as CSV text, one string per chunk, starting with the header."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    yield buffer.getvalue()
+    for chunk in chunks:
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows([_value(value) for value in row] for row in chunk)
+        yield buffer.getvalue()
+
+
+def encode_ndjson(columns, chunks):
+    """Encode row chunks as NDJSON text, one string per chunk."""
+    for chunk in chunks:
+        yield ''.join(json.dumps(dict(zip(columns, map(_value, row)))) + '\n' for row in chunk)
+
+
+def encode(fmt, columns, chunks):
+    """Encode row chunks in an export format ('csv' or 'ndjson')."""
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown export format: {fmt}")
+    return encode_csv(columns, chunks) if fmt == 'csv' else encode_ndjson(columns, chunks)
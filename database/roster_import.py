@@ -0,0 +1,221 @@
+"""
+Bulk import of learner accounts from class rosters.
+
+A roster is a CSV file or a JSON-lines stream with one learner per row:
+
+    email, first_name, last_name[, password][, grade_level]
+
+The whole roster is validated in one vectorized pass (email format,
+required fields, password strength, duplicates within the file and against
+existing accounts). Valid rows are then imported in chunks: the chunk's
+passwords are hashed in parallel on the password worker pool, and its users,
+learner profiles and (optionally) course enrollments are inserted with bulk
+statements in a single transaction. Rows without a password get a random
+temporary password, which is reported back once.
+
+`import_roster` is a generator of progress events, so both the admin
+endpoint (streamed as NDJSON) and `run.py --import-roster` can report
+progress while a large roster is processed.
+"""
+
+import io
+import secrets
+from datetime import datetime
+
+import pandas as pd
+from sqlalchemy import insert, select
+from sqlalchemy.exc import IntegrityError
+
+from database.db import db
+from database.passwords import password_hasher
+from database.sqlite_helpers import notify_model_write
+
+ROSTER_FORMATS = ('csv', 'jsonl')
+REQUIRED_COLUMNS = ('email', 'first_name', 'last_name')
+OPTIONAL_COLUMNS = ('password', 'grade_level')
+
+# Same rules as routes.auth.is_valid_email / is_strong_password
+EMAIL_PATTERN = r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$'
+PASSWORD_RULES = (
+    (r'[A-Z]', "an uppercase letter"),
+    (r'[a-z]', "a lowercase letter"),
+    (r'[0-9]', "a digit"),
+    (r'[!@#$%^&*(),.?":{}|<>]', "a special character"),
+)
+
+
+class RosterError(ValueError):
+    """Raised when a roster cannot be read at all (bad format or missing columns)."""
+
+
+def detect_format(filename=None, content_type=None):
+    """Guess the roster format from a filename or content type; defaults to CSV."""
+    name = (filename or '').lower()
+    content_type = (content_type or '').lower()
+    if name.endswith(('.jsonl', '.ndjson', '.json')) or 'json' in content_type:
+        return 'jsonl'
+    return 'csv'
+
+
+def read_roster(source, fmt='csv'):
+    """
+    Parse a roster into a DataFrame of strings.
+
+    @param source: A path, bytes, or a file-like object.
+    @param fmt (str): 'csv' or 'jsonl'.
+    @return (DataFrame): One row per learner with the known columns, blanks as ''.
+    @raises RosterError: If the roster cannot be parsed or lacks required columns.
+    """
+    if fmt not in ROSTER_FORMATS:
+        raise RosterError(f"Unsupported roster format: {fmt}")
+    if isinstance(source, bytes):
+        source = io.BytesIO(source)
+    try:
+        if fmt == 'csv':
+            df = pd.read_csv(source, dtype=str, keep_default_na=False, skipinitialspace=True)
+        else:
+            df = pd.read_json(source, lines=True, dtype=False)
+    except ValueError as e:
+        raise RosterError(f"Could not parse roster: {e}")
+
+    df.columns = [str(column).strip().lower() for column in df.columns]
+    missing = [column for column in REQUIRED_COLUMNS if column not in df.columns]
+    if missing:
+        raise RosterError(f"Roster is missing required columns: {', '.join(missing)}")
+    for column in OPTIONAL_COLUMNS:
+        if column not in df.columns:
+            df[column] = ''
+    df = df[list(REQUIRED_COLUMNS + OPTIONAL_COLUMNS)].fillna('').astype(str)
+    for column in ('email', 'first_name', 'last_name', 'grade_level'):
+        df[column] = df[column].str.strip()
+    df['email'] = df['email'].str.lower()
+    return df.reset_index(drop=True)
+
+
+def validate_roster(df):
+    """
+    Validate every row at once.
+
+    @param df (DataFrame): A roster from read_roster.
+    @return (Series): An error message per row, '' for valid rows.
+    """
+    errors = pd.Series('', index=df.index, dtype=object)
+
+    def flag(mask, message):
+        # Keep the first error found for a row
+        errors[mask & (errors == '')] = message
+
+    for column in REQUIRED_COLUMNS:
+        flag(df[column] == '', f"Missing {column}")
+    flag(~df['email'].str.match(EMAIL_PATTERN), "Invalid email format")
+    flag(df['email'].duplicated(keep='first'), "Duplicate email in roster")
+
+    has_password = df['password'] != ''
+    flag(has_password & (df['password'].str.len() < 8), "Password must be at least 8 characters")
+    for pattern, requirement in PASSWORD_RULES:
+        flag(has_password & ~df['password'].str.contains(pattern, regex=True), f"Password needs {requirement}")
+
+    flag(df['email'].isin(_existing_emails(df['email'].unique().tolist())), "Email already registered")
+    return errors
+
+
+def _existing_emails(emails):
+    from models import User
+    existing = set()
+    # Stay well below SQLite's bound-parameter limit
+    for i in range(0, len(emails), 500):
+        existing.update(
+            row[0] for row in db.session.query(User.email).filter(User.email.in_(emails[i:i + 500])).all()
+        )
+    return existing
+
+
+def import_roster(df, course_id=None, chunk_size=500, report_passwords=True):
+    """
+    Create learner accounts for a roster, yielding progress events.
+
+    @param df (DataFrame): A roster from read_roster.
+    @param course_id (int): Optional course to enroll every imported learner in.
+    @param chunk_size (int): Rows per transaction.
+    @param report_passwords (bool): Include generated temporary passwords in 'created' events.
+    @return: A generator of event dicts with an 'event' key of 'validated', 'invalid',
+             'created', 'failed', 'progress' or 'done'.
+    """
+    from models import User, Learner, CourseEnrollment
+
+    errors = validate_roster(df)
+    invalid = errors != ''
+    total = len(df)
+    yield {'event': 'validated', 'total': total, 'valid': int((~invalid).sum()), 'invalid': int(invalid.sum())}
+    for index in df.index[invalid]:
+        yield {'event': 'invalid', 'row': int(index) + 1, 'email': df.at[index, 'email'], 'error': errors[index]}
+
+    valid = df[~invalid]
+    created = failed = 0
+    for start in range(0, len(valid), chunk_size):
+        chunk = valid.iloc[start:start + chunk_size]
+        generated = chunk['password'] == ''
+        passwords = [password or secrets.token_urlsafe(12) for password in chunk['password']]
+        hashes = password_hasher.hash_many(passwords)
+        now = datetime.utcnow()
+
+        try:
+            with db.engine.begin() as conn:
+                user_rows = conn.execute(
+                    insert(User.__table__).returning(User.__table__.c.id, User.__table__.c.email),
+                    [{
+                        'email': email,
+                        'password_hash': password_hash,
+                        'first_name': first_name,
+                        'last_name': last_name,
+                        'role': 'learner',
+                        'created_at': now,
+                        'is_active': True
+                    } for email, first_name, last_name, password_hash
+                        in zip(chunk['email'], chunk['first_name'], chunk['last_name'], hashes)]
+                ).all()
+                user_ids = {email: user_id for user_id, email in user_rows}
+
+                learner_rows = conn.execute(
+                    insert(Learner.__table__).returning(Learner.__table__.c.id, Learner.__table__.c.user_id),
+                    [{'user_id': user_ids[email], 'grade_level': grade_level or None}
+                     for email, grade_level in zip(chunk['email'], chunk['grade_level'])]
+                ).all()
+                learner_ids = {user_id: learner_id for learner_id, user_id in learner_rows}
+
+                if course_id is not None:
+                    conn.execute(
+                        insert(CourseEnrollment.__table__),
+                        [{'course_id': course_id, 'learner_id': learner_id, 'enrolled_date': now, 'is_active': True}
+                         for learner_id in learner_ids.values()]
+                    )
+        except IntegrityError as e:
+            # Typically an email registered after validation; the chunk was rolled back as a whole
+            failed += len(chunk)
+            for index, email in zip(chunk.index, chunk['email']):
+                yield {'event': 'failed', 'row': int(index) + 1, 'email': email, 'error': str(e.orig)}
+        else:
+            created += len(chunk)
+            for index, email, password, is_generated in zip(chunk.index, chunk['email'], passwords, generated):
+                event = {'event': 'created', 'row': int(index) + 1, 'email': email,
+                         'user_id': user_ids[email], 'learner_id': learner_ids[user_ids[email]]}
+                if is_generated and report_passwords:
+                    event['temporary_password'] = password
+                yield event
+
+        yield {'event': 'progress', 'processed': min(start + chunk_size, len(valid)), 'valid': len(valid),
+               'created': created, 'failed': failed}
+
+    if created:
+        # Core inserts bypass the ORM events that feed the caches
+        notify_model_write(User.__tablename__)
+        notify_model_write(Learner.__tablename__)
+        if course_id is not None:
+            notify_model_write(CourseEnrollment.__tablename__)
+    yield {'event': 'done', 'total': total, 'created': created, 'invalid': int(invalid.sum()), 'failed': failed}
+
+
+def course_exists(course_id):
+    """Check that a course id refers to an existing course."""
+    from models import Course
+    return db.session.execute(select(Course.id).where(Course.id == course_id)).first() is not None
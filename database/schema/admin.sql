@@ -24,8 +24,7 @@ CREATE TABLE IF NOT EXISTS admin_logs (
 
 -- Create indexes
 CREATE INDEX IF NOT EXISTS idx_admins_user_id ON admins(user_id);
-CREATE INDEX IF NOT EXISTS idx_admin_logs_admin_id ON admin_logs(admin_id);
-CREATE INDEX IF NOT EXISTS idx_admin_logs_action ON admin_logs(action);
+CREATE INDEX IF NOT EXISTS idx_admin_logs_admin_timestamp ON admin_logs(admin_id, timestamp);
+CREATE INDEX IF NOT EXISTS idx_admin_logs_action_timestamp ON admin_logs(action, timestamp);
 CREATE INDEX IF NOT EXISTS idx_admin_logs_timestamp ON admin_logs(timestamp);
-CREATE INDEX IF NOT EXISTS idx_admin_logs_target_type ON admin_logs(target_type);
-CREATE INDEX IF NOT EXISTS idx_admin_logs_target_id ON admin_logs(target_id);
+CREATE INDEX IF NOT EXISTS idx_admin_logs_target ON admin_logs(target_type, target_id, timestamp);
@@ -35,14 +35,137 @@ CREATE TABLE IF NOT EXISTS performance_metrics (
     FOREIGN KEY (tutor_id) REFERENCES tutors(id) ON DELETE CASCADE
 );
 
+-- Ingest Keys table (idempotency keys of ingested analytics events)
+CREATE TABLE IF NOT EXISTS ingest_keys (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    learner_id INTEGER NOT NULL,
+    idempotency_key TEXT NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    UNIQUE (learner_id, idempotency_key),
+    FOREIGN KEY (learner_id) REFERENCES learners(id) ON DELETE CASCADE
+);
+
+-- Learner Tutor Progress table (per learner and tutor totals, see database/progress_rollups.py)
+CREATE TABLE IF NOT EXISTS learner_tutor_progress (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    learner_tutor_id INTEGER NOT NULL UNIQUE,
+    learner_id INTEGER NOT NULL,
+    tutor_id INTEGER NOT NULL,
+    sessions INTEGER DEFAULT 0,
+    ended_sessions INTEGER DEFAULT 0,
+    total_minutes INTEGER DEFAULT 0,
+    activities INTEGER DEFAULT 0,
+    scored_activities INTEGER DEFAULT 0,
+    score_sum REAL DEFAULT 0,
+    last_score REAL,
+    last_score_at TIMESTAMP,
+    last_activity_at TIMESTAMP,
+    is_stale BOOLEAN DEFAULT 0,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (learner_tutor_id) REFERENCES learner_tutors(id) ON DELETE CASCADE,
+    FOREIGN KEY (learner_id) REFERENCES learners(id) ON DELETE CASCADE,
+    FOREIGN KEY (tutor_id) REFERENCES tutors(id) ON DELETE CASCADE
+);
+
+-- Learner Progress table (per learner totals and streak)
+CREATE TABLE IF NOT EXISTS learner_progress (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    learner_id INTEGER NOT NULL UNIQUE,
+    tutors INTEGER DEFAULT 0,
+    sessions INTEGER DEFAULT 0,
+    total_minutes INTEGER DEFAULT 0,
+    activities INTEGER DEFAULT 0,
+    scored_activities INTEGER DEFAULT 0,
+    score_sum REAL DEFAULT 0,
+    last_score REAL,
+    last_activity_at TIMESTAMP,
+    last_active_date DATE,
+    streak_days INTEGER DEFAULT 0,
+    longest_streak_days INTEGER DEFAULT 0,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (learner_id) REFERENCES learners(id) ON DELETE CASCADE
+);
+
+-- Metric Buckets table (minute, hour and day aggregates of performance metrics)
+CREATE TABLE IF NOT EXISTS metric_buckets (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    scope TEXT NOT NULL,
+    owner_id INTEGER NOT NULL,
+    metric_name TEXT NOT NULL,
+    resolution INTEGER NOT NULL,
+    bucket_start TIMESTAMP NOT NULL,
+    count INTEGER NOT NULL DEFAULT 0,
+    value_sum REAL NOT NULL DEFAULT 0,
+    min_value REAL,
+    max_value REAL,
+    UNIQUE (scope, owner_id, metric_name, resolution, bucket_start)
+);
+
+-- Quantile Sketches table (mergeable KLL sketches of metric values per tutor and course)
+CREATE TABLE IF NOT EXISTS quantile_sketches (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    scope TEXT NOT NULL,
+    owner_id INTEGER NOT NULL,
+    metric_name TEXT NOT NULL,
+    count INTEGER NOT NULL DEFAULT 0,
+    data BLOB NOT NULL,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    UNIQUE (scope, owner_id, metric_name)
+);
+
+-- Skill Parameters table (fitted knowledge tracing parameters per tutor skill)
+CREATE TABLE IF NOT EXISTS skill_parameters (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    tutor_id INTEGER NOT NULL,
+    skill TEXT NOT NULL,
+    p_init REAL NOT NULL,
+    p_learn REAL NOT NULL,
+    p_guess REAL NOT NULL,
+    p_slip REAL NOT NULL,
+    learners INTEGER NOT NULL DEFAULT 0,
+    observations INTEGER NOT NULL DEFAULT 0,
+    log_likelihood REAL,
+    fitted_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    UNIQUE (tutor_id, skill),
+    FOREIGN KEY (tutor_id) REFERENCES tutors(id) ON DELETE CASCADE
+);
+
+-- Skill Mastery table (knowledge tracing estimate per learner, tutor and skill)
+CREATE TABLE IF NOT EXISTS skill_mastery (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    learner_id INTEGER NOT NULL,
+    tutor_id INTEGER NOT NULL,
+    skill TEXT NOT NULL,
+    p_mastery REAL NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    correct INTEGER NOT NULL DEFAULT 0,
+    last_practiced_at TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    UNIQUE (learner_id, tutor_id, skill),
+    FOREIGN KEY (learner_id) REFERENCES learners(id) ON DELETE CASCADE,
+    FOREIGN KEY (tutor_id) REFERENCES tutors(id) ON DELETE CASCADE
+);
+
+-- Aggregate Watermarks table (last source row id read by each incremental aggregation)
+CREATE TABLE IF NOT EXISTS aggregate_watermarks (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT NOT NULL UNIQUE,
+    position INTEGER NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
 -- Create indexes
 CREATE INDEX IF NOT EXISTS idx_learner_sessions_learner_tutor_id ON learner_sessions(learner_tutor_id);
 CREATE INDEX IF NOT EXISTS idx_learner_sessions_start_time ON learner_sessions(start_time);
 CREATE INDEX IF NOT EXISTS idx_session_activities_session_id ON session_activities(session_id);
 CREATE INDEX IF NOT EXISTS idx_session_activities_timestamp ON session_activities(timestamp);
 CREATE INDEX IF NOT EXISTS idx_session_activities_activity_type ON session_activities(activity_type);
-CREATE INDEX IF NOT EXISTS idx_performance_metrics_learner_id ON performance_metrics(learner_id);
-CREATE INDEX IF NOT EXISTS idx_performance_metrics_tutor_id ON performance_metrics(tutor_id);
+CREATE INDEX IF NOT EXISTS idx_performance_metrics_learner_metric ON performance_metrics(learner_id, metric_name, recorded_at);
+CREATE INDEX IF NOT EXISTS idx_performance_metrics_tutor_metric ON performance_metrics(tutor_id, metric_name, recorded_at);
 CREATE INDEX IF NOT EXISTS idx_performance_metrics_metric_name ON performance_metrics(metric_name);
 CREATE INDEX IF NOT EXISTS idx_performance_metrics_recorded_at ON performance_metrics(recorded_at);
-
+CREATE INDEX IF NOT EXISTS idx_ingest_keys_created_at ON ingest_keys(created_at);
+CREATE INDEX IF NOT EXISTS idx_learner_tutor_progress_learner_id ON learner_tutor_progress(learner_id);
+CREATE INDEX IF NOT EXISTS idx_learner_tutor_progress_stale ON learner_tutor_progress(is_stale);
+CREATE INDEX IF NOT EXISTS idx_metric_buckets_resolution ON metric_buckets(resolution, bucket_start);
+CREATE INDEX IF NOT EXISTS idx_skill_mastery_tutor_id ON skill_mastery(tutor_id);
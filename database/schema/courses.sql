@@ -4,6 +4,7 @@ CREATE TABLE IF NOT EXISTS courses (
     instructor_id INTEGER NOT NULL,
     title TEXT NOT NULL,
     description TEXT,
+    course_code TEXT,
     start_date DATE,
     end_date DATE,
     is_active INTEGER DEFAULT 1,
@@ -15,4 +16,6 @@ CREATE TABLE IF NOT EXISTS courses (
 -- Create indexes
 CREATE INDEX IF NOT EXISTS idx_courses_instructor_id ON courses(instructor_id);
 CREATE INDEX IF NOT EXISTS idx_courses_is_active ON courses(is_active);
+CREATE INDEX IF NOT EXISTS idx_courses_created_at ON courses(created_at);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_courses_course_code ON courses(course_code);
 
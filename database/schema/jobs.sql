@@ -0,0 +1,26 @@
+-- Jobs table (background work run by the job scheduler)
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT NOT NULL,
+    job_key TEXT,
+    payload TEXT DEFAULT '{}',
+    priority INTEGER DEFAULT 0,
+    status TEXT NOT NULL DEFAULT 'queued', -- 'queued', 'running', 'succeeded', 'failed'
+    attempts INTEGER DEFAULT 0,
+    max_attempts INTEGER DEFAULT 3,
+    run_after TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    progress REAL DEFAULT 0,
+    message TEXT,
+    result TEXT,
+    error TEXT,
+    user_id INTEGER,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    started_at TIMESTAMP,
+    heartbeat_at TIMESTAMP,
+    finished_at TIMESTAMP
+);
+
+-- Create indexes
+CREATE INDEX IF NOT EXISTS idx_jobs_queue ON jobs(status, priority DESC, run_after);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_jobs_active_key ON jobs(job_key) WHERE status IN ('queued', 'running');
+CREATE INDEX IF NOT EXISTS idx_jobs_finished_at ON jobs(finished_at);
@@ -36,6 +36,18 @@ CREATE TABLE IF NOT EXISTS module_tutors (
     UNIQUE(module_id, tutor_id)
 );
 
+-- Course Tutors junction table
+CREATE TABLE IF NOT EXISTS course_tutors (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    course_id INTEGER NOT NULL,
+    tutor_id INTEGER NOT NULL,
+    assigned_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    due_date DATE,
+    is_required INTEGER DEFAULT 1,
+    FOREIGN KEY (course_id) REFERENCES courses(id) ON DELETE CASCADE,
+    FOREIGN KEY (tutor_id) REFERENCES tutors(id) ON DELETE CASCADE
+);
+
 -- Learner Tutors table
 CREATE TABLE IF NOT EXISTS learner_tutors (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -53,11 +65,12 @@ CREATE TABLE IF NOT EXISTS learner_tutors (
 
 -- Create indexes --
 
--- Course Learners
-CREATE INDEX IF NOT EXISTS idx_course_learners_course_id ON course_learners(course_id);
+-- Course Learners (lookups by course_id use the UNIQUE(course_id, learner_id) index)
 CREATE INDEX IF NOT EXISTS idx_course_learners_learner_id ON course_learners(learner_id);
 -- Course Modules
 CREATE INDEX IF NOT EXISTS idx_course_modules_course_id ON course_modules(course_id);
--- Learner Tutors
-CREATE INDEX IF NOT EXISTS idx_learner_tutors_learner_id ON learner_tutors(learner_id);
+-- Course Tutors
+CREATE INDEX IF NOT EXISTS idx_course_tutors_course_tutor ON course_tutors(course_id, tutor_id);
+CREATE INDEX IF NOT EXISTS idx_course_tutors_tutor_id ON course_tutors(tutor_id);
+-- Learner Tutors (lookups by learner_id use the UNIQUE(learner_id, tutor_id) index)
 CREATE INDEX IF NOT EXISTS idx_learner_tutors_tutor_id ON learner_tutors(tutor_id);
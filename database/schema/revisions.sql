@@ -0,0 +1,28 @@
+-- Content Chunks table (content-addressed, deduplicated tutor content)
+CREATE TABLE IF NOT EXISTS content_chunks (
+    hash TEXT PRIMARY KEY,
+    data TEXT NOT NULL, -- plain text, or a compressed BLOB (see database/compression.py)
+    size INTEGER NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Tutor Revisions table
+CREATE TABLE IF NOT EXISTS tutor_revisions (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    tutor_id INTEGER NOT NULL,
+    parent_id INTEGER,
+    content_hash TEXT NOT NULL,
+    manifest TEXT NOT NULL, -- chunk hashes, or delta ops against the parent revision
+    is_keyframe INTEGER DEFAULT 0,
+    depth INTEGER DEFAULT 0,
+    size INTEGER NOT NULL,
+    new_chunks INTEGER DEFAULT 0,
+    message TEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (tutor_id) REFERENCES tutors(id) ON DELETE CASCADE,
+    FOREIGN KEY (parent_id) REFERENCES tutor_revisions(id)
+);
+
+-- Create indexes
+CREATE INDEX IF NOT EXISTS idx_tutor_revisions_tutor_id ON tutor_revisions(tutor_id);
+CREATE INDEX IF NOT EXISTS idx_tutor_revisions_parent_id ON tutor_revisions(parent_id);
@@ -12,9 +12,31 @@ CREATE TABLE IF NOT EXISTS tutors (
     updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     is_published INTEGER DEFAULT 0,
     is_online INTEGER DEFAULT 0,
-    version TEXT DEFAULT '1.0'
+    version TEXT DEFAULT '1.0',
+    revision_id INTEGER, -- head of the tutor's revision history (tutor_revisions.id)
+    cloned_from_id INTEGER, -- source tutor of a copy-on-write clone
+    is_materialized INTEGER DEFAULT 1 -- 0 while a clone still shares its source's rows
+);
+
+-- Tutor Modules table
+CREATE TABLE IF NOT EXISTS tutor_modules (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    tutor_id INTEGER NOT NULL,
+    title TEXT NOT NULL,
+    sequence_order INTEGER NOT NULL,
+    content TEXT DEFAULT '{}',
+    module_type TEXT,
+    prerequisites TEXT DEFAULT '{}',
+    learning_objectives TEXT DEFAULT '{}',
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (tutor_id) REFERENCES tutors(id) ON DELETE CASCADE
 );
 
 -- Create indexes
+CREATE INDEX IF NOT EXISTS idx_tutors_instructor_updated ON tutors(instructor_id, updated_at);
+CREATE INDEX IF NOT EXISTS idx_tutors_created_at ON tutors(created_at);
 CREATE INDEX IF NOT EXISTS idx_tutors_subject_area ON tutors(subject_area);
 CREATE INDEX IF NOT EXISTS idx_tutors_is_published ON tutors(is_published);
+CREATE INDEX IF NOT EXISTS idx_tutors_cloned_from ON tutors(cloned_from_id);
+CREATE INDEX IF NOT EXISTS idx_tutor_modules_tutor_sequence ON tutor_modules(tutor_id, sequence_order);
@@ -26,6 +26,8 @@ CREATE TABLE IF NOT EXISTS instructors (
 CREATE TABLE IF NOT EXISTS learners (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
     user_id INTEGER UNIQUE NOT NULL,
+    grade_level TEXT,
+    learning_preferences TEXT DEFAULT '{}',
     preferences TEXT DEFAULT '{}',
     last_active TIMESTAMP, -- if can't figure out last logout, then last login
     FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
@@ -34,5 +36,7 @@ CREATE TABLE IF NOT EXISTS learners (
 -- Create indexes
 CREATE INDEX IF NOT EXISTS idx_users_email ON users(email);
 CREATE INDEX IF NOT EXISTS idx_users_role ON users(role);
+CREATE INDEX IF NOT EXISTS idx_users_created_at ON users(created_at);
+CREATE INDEX IF NOT EXISTS idx_users_last_login ON users(last_login);
 CREATE INDEX IF NOT EXISTS idx_instructors_user_id ON instructors(user_id);
 CREATE INDEX IF NOT EXISTS idx_learners_user_id ON learners(user_id);
@@ -0,0 +1,334 @@
+"""
+Server-side session storage.
+
+Replaces the one-file-per-session Flask-Session filesystem backend. Sessions
+live in a single SQLite file (SESSION_STORE_PATH, WAL mode, separate from the
+application database so session writes never wait on app transactions) with
+an in-memory LRU in front of it:
+
+- Reads are served from the LRU. An entry is trusted for
+  SESSION_STORE_CACHE_TTL seconds; after that one primary-key lookup of the
+  row's version tells whether another worker changed it before it is reused.
+- A request that does not modify its session writes nothing. The expiry of a
+  permanent session is pushed back at most every SESSION_STORE_TOUCH_INTERVAL
+  seconds rather than on every request.
+- Every write is a single upsert in its own transaction, so a
+  session row is always either the old or the new value.
+- Expired rows are deleted every SESSION_STORE_SWEEP_INTERVAL seconds.
+
+SESSION_TYPE = 'memory' keeps sessions in process memory only (single process,
+lost on restart), which is handy for development and tests.
+"""
+
+import logging
+import os
+import secrets
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from flask.json.tag import TaggedJSONSerializer
+from flask.sessions import SessionInterface, SessionMixin
+from werkzeug.datastructures import CallbackDict
+
+logger = logging.getLogger(__name__)
+
+
+class StoredSession(CallbackDict, SessionMixin):
+    """Session dict that tracks modification and remembers its stored state."""
+
+    def __init__(self, initial=None, sid=None, new=False, expires_at=None):
+        def on_update(self):
+            self.modified = True
+        super().__init__(initial, on_update)
+        self.sid = sid
+        self.new = new
+        self.expires_at = expires_at  # UNIX time the stored row expires, None if not stored
+        self.modified = False
+
+
+class MemorySessionBackend:
+    """Sessions kept in process memory only."""
+
+    def __init__(self):
+        self._rows = {}
+        self._lock = threading.Lock()
+
+    def load(self, sid):
+        with self._lock:
+            return self._rows.get(sid)
+
+    def version(self, sid):
+        row = self.load(sid)
+        return row[2] if row else None
+
+    def save(self, sid, data, expires_at):
+        with self._lock:
+            version = self._rows[sid][2] + 1 if sid in self._rows else 1
+            self._rows[sid] = (data, expires_at, version)
+            return version
+
+    def touch(self, sid, expires_at):
+        with self._lock:
+            if sid in self._rows:
+                data, _, version = self._rows[sid]
+                self._rows[sid] = (data, expires_at, version)
+
+    def delete(self, sid):
+        with self._lock:
+            self._rows.pop(sid, None)
+
+    def sweep(self, now):
+        with self._lock:
+            expired = [sid for sid, row in self._rows.items() if row[1] <= now]
+            for sid in expired:
+                del self._rows[sid]
+            return len(expired)
+
+
+class SQLiteSessionBackend:
+    """Sessions in a single SQLite file, one row per session."""
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._write() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS sessions ("
+                " sid TEXT PRIMARY KEY,"
+                " data BLOB NOT NULL,"
+                " expires_at REAL NOT NULL,"
+                " version INTEGER NOT NULL DEFAULT 1)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_sessions_expires_at ON sessions(expires_at)")
+
+    def _connect(self):
+        # One connection per thread; sqlite3 connections must not be shared across threads.
+        # In autocommit mode each statement outside a _Transaction is its own deferred read
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _write(self):
+        return _Transaction(self._connect())
+
+    def load(self, sid):
+        return self._connect().execute(
+            "SELECT data, expires_at, version FROM sessions WHERE sid = ?", (sid,)
+        ).fetchone()
+
+    def version(self, sid):
+        row = self._connect().execute("SELECT version FROM sessions WHERE sid = ?", (sid,)).fetchone()
+        return row[0] if row else None
+
+    def save(self, sid, data, expires_at):
+        with self._write() as conn:
+            conn.execute(
+                "INSERT INTO sessions (sid, data, expires_at, version) VALUES (?, ?, ?, 1) "
+                "ON CONFLICT(sid) DO UPDATE SET data = excluded.data, expires_at = excluded.expires_at,"
+                " version = sessions.version + 1",
+                (sid, data, expires_at)
+            )
+            return conn.execute("SELECT version FROM sessions WHERE sid = ?", (sid,)).fetchone()[0]
+
+    def touch(self, sid, expires_at):
+        with self._write() as conn:
+            conn.execute("UPDATE sessions SET expires_at = ? WHERE sid = ?", (expires_at, sid))
+
+    def delete(self, sid):
+        with self._write() as conn:
+            conn.execute("DELETE FROM sessions WHERE sid = ?", (sid,))
+
+    def sweep(self, now):
+        with self._write() as conn:
+            return conn.execute("DELETE FROM sessions WHERE expires_at <= ?", (now,)).rowcount
+
+
+class _Transaction:
+    """Runs the statements of a `with` block in one immediate (write-locking) transaction."""
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        self.conn.execute("BEGIN IMMEDIATE")
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        self.conn.execute("ROLLBACK" if exc_type else "COMMIT")
+        return False
+
+
+class SessionStore(SessionInterface):
+    """Flask session interface over a session backend with an LRU in front."""
+
+    serializer = TaggedJSONSerializer()
+    session_class = StoredSession
+
+    def __init__(self, max_entries=10000, cache_ttl=2.0, touch_interval=300, sweep_interval=600):
+        self.backend = None
+        self.shared = True  # whether other processes may write the same sessions
+        self.max_entries = max_entries
+        self.cache_ttl = cache_ttl
+        self.touch_interval = touch_interval
+        self.sweep_interval = sweep_interval
+        self._entries = OrderedDict()  # sid -> (data, expires_at, version, checked_at)
+        self._lock = threading.Lock()
+        self._next_sweep = 0.0
+
+    def init_app(self, app):
+        """Pick the backend from SESSION_TYPE and install the store as the app's session interface."""
+        session_type = app.config.get('SESSION_TYPE', 'sqlite')
+        if session_type == 'memory':
+            self.backend = MemorySessionBackend()
+            self.shared = False
+        elif session_type == 'sqlite':
+            path = app.config.get('SESSION_STORE_PATH', 'data/sessions.db')
+            if not os.path.isabs(path):
+                # Relative like the application database, not to the working directory
+                path = os.path.join(app.instance_path, path)
+            self.backend = SQLiteSessionBackend(path)
+            self.shared = True
+        else:
+            raise ValueError(f"Unsupported SESSION_TYPE: {session_type}")
+        self.max_entries = app.config.get('SESSION_STORE_MAX_ENTRIES', self.max_entries)
+        self.cache_ttl = app.config.get('SESSION_STORE_CACHE_TTL', self.cache_ttl)
+        self.touch_interval = app.config.get('SESSION_STORE_TOUCH_INTERVAL', self.touch_interval)
+        self.sweep_interval = app.config.get('SESSION_STORE_SWEEP_INTERVAL', self.sweep_interval)
+        app.session_interface = self
+        app.extensions['session_store'] = self
+
+    # SessionInterface
+
+    def open_session(self, app, request):
+        sid = request.cookies.get(self.get_cookie_name(app))
+        if sid:
+            entry = self._get(sid)
+            if entry is not None:
+                data, expires_at = entry
+                return self.session_class(self.serializer.loads(data), sid=sid, expires_at=expires_at)
+        session = self.session_class(sid=self._new_sid(), new=True)
+        session.permanent = app.config.get('SESSION_PERMANENT', True)
+        # The flag alone is not worth storing a row for
+        session.modified = False
+        return session
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+        self._maybe_sweep()
+
+        if not session:
+            if session.modified and not session.new:
+                # Emptied (e.g. logout): drop the stored row and the cookie
+                self._delete(session.sid)
+                response.delete_cookie(name, domain=domain, path=path,
+                                       secure=self.get_cookie_secure(app),
+                                       samesite=self.get_cookie_samesite(app),
+                                       httponly=self.get_cookie_httponly(app))
+            return
+
+        if session.accessed:
+            response.vary.add('Cookie')
+
+        lifetime = app.permanent_session_lifetime.total_seconds()
+        now = time.time()
+        if session.modified:
+            self._save(session.sid, self.serializer.dumps(dict(session)), now + lifetime)
+        elif session.permanent and self.should_set_cookie(app, session) \
+                and session.expires_at is not None and session.expires_at - now < lifetime - self.touch_interval:
+            self._touch(session.sid, now + lifetime)
+        else:
+            return
+
+        expires = self.get_expiration_time(app, session)
+        response.set_cookie(name, session.sid, expires=expires,
+                            httponly=self.get_cookie_httponly(app), domain=domain, path=path,
+                            secure=self.get_cookie_secure(app), samesite=self.get_cookie_samesite(app))
+
+    # Store
+
+    def _new_sid(self):
+        return secrets.token_urlsafe(32)
+
+    def _get(self, sid):
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(sid)
+            if entry is not None:
+                self._entries.move_to_end(sid)
+        if entry is not None:
+            data, expires_at, version, checked_at = entry
+            if expires_at <= now:
+                self._evict(sid)
+                return None
+            if not self.shared or time.monotonic() - checked_at < self.cache_ttl:
+                return data, expires_at
+            # Stale entry: reuse it if no other worker has written the session since
+            if self.backend.version(sid) == version:
+                self._cache(sid, data, expires_at, version)
+                return data, expires_at
+
+        row = self.backend.load(sid)
+        if row is None or row[1] <= now:
+            self._evict(sid)
+            return None
+        self._cache(sid, *row)
+        return row[0], row[1]
+
+    def _save(self, sid, data, expires_at):
+        version = self.backend.save(sid, data, expires_at)
+        self._cache(sid, data, expires_at, version)
+
+    def _touch(self, sid, expires_at):
+        self.backend.touch(sid, expires_at)
+        with self._lock:
+            entry = self._entries.get(sid)
+            if entry is not None:
+                self._entries[sid] = (entry[0], expires_at, entry[2], entry[3])
+
+    def _delete(self, sid):
+        self.backend.delete(sid)
+        self._evict(sid)
+
+    def _cache(self, sid, data, expires_at, version):
+        with self._lock:
+            self._entries[sid] = (data, expires_at, version, time.monotonic())
+            self._entries.move_to_end(sid)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def _evict(self, sid):
+        with self._lock:
+            self._entries.pop(sid, None)
+
+    def _maybe_sweep(self):
+        now = time.monotonic()
+        with self._lock:
+            if now < self._next_sweep:
+                return
+            self._next_sweep = now + self.sweep_interval
+        self.sweep()
+
+    def sweep(self):
+        """Delete expired sessions from the backend and the LRU. Returns the number of rows deleted."""
+        now = time.time()
+        deleted = self.backend.sweep(now)
+        with self._lock:
+            for sid in [sid for sid, entry in self._entries.items() if entry[1] <= now]:
+                del self._entries[sid]
+        if deleted:
+            logger.info("Swept %d expired sessions", deleted)
+        return deleted
+
+
+session_store = SessionStore()
@@ -7,9 +7,16 @@ constraint enforcement.
 """
 
 from sqlalchemy import event
+from sqlalchemy.orm import Session, object_session
 from sqlalchemy.sql import func
 from datetime import datetime
 import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Callbacks notified after a commit that inserted, updated or deleted rows
+_write_subscribers = []
 
 def update_timestamp(mapper, connection, target):
     """Update the updated_at timestamp on model update"""
@@ -69,6 +76,59 @@ def register_sqlite_listeners(models):
     # Also register timestamp listeners
     register_timestamp_listeners(models)
 
+    # And publish committed writes to caches
+    register_write_listeners(models)
+
+def subscribe_model_writes(callback):
+    """
+    Register a callback invoked as callback(table_name, row_id) for every row
+    written by a committed transaction. Returns the callback so it can be used
+    as a decorator.
+    """
+    _write_subscribers.append(callback)
+    return callback
+
+def record_model_write(mapper, connection, target):
+    """Remember a written row on its session until the transaction commits"""
+    session = object_session(target)
+    if session is None:
+        return
+    row_id = mapper.primary_key_from_instance(target)[0]
+    session.info.setdefault('model_writes', set()).add((mapper.persist_selectable.name, row_id))
+
+def publish_model_writes(session):
+    """Notify subscribers of the rows written by the transaction that just committed"""
+    writes = session.info.pop('model_writes', None)
+    if not writes:
+        return
+    for table_name, row_id in writes:
+        notify_model_write(table_name, row_id)
+
+def notify_model_write(table_name, row_id=None):
+    """
+    Notify subscribers of a committed write made outside the ORM unit of work
+    (e.g. a Core bulk insert). A row_id of None means "some rows in the table".
+    """
+    for callback in _write_subscribers:
+        try:
+            callback(table_name, row_id)
+        except Exception:
+            logger.exception("Model write subscriber failed for %s %s", table_name, row_id)
+
+def discard_model_writes(session):
+    """Forget pending writes when the transaction is rolled back"""
+    session.info.pop('model_writes', None)
+
+def register_write_listeners(models):
+    """Register insert/update/delete listeners that feed subscribe_model_writes"""
+    for model in models:
+        event.listen(model, 'after_insert', record_model_write)
+        event.listen(model, 'after_update', record_model_write)
+        event.listen(model, 'after_delete', record_model_write)
+
+event.listen(Session, 'after_commit', publish_model_writes)
+event.listen(Session, 'after_rollback', discard_model_writes)
+
 def calculate_session_duration(session):
     """Calculate session duration in minutes"""
     if session.start_time and session.end_time:
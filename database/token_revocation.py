@@ -0,0 +1,198 @@
+"""
+Persistent store of revoked JWTs.
+
+Revocations are written to the `revoked_tokens` table, so they survive restarts
+and are shared by every worker. Each process keeps a Bloom filter over the jtis
+of revoked tokens that have not expired yet: a token whose jti is not in the
+filter (every valid token, in practice) is accepted without touching the
+database, and only filter hits are confirmed with an indexed lookup.
+
+The filter is topped up with rows revoked by other workers at most every
+JWT_REVOCATION_REFRESH_INTERVAL seconds, reading only rows newer than the last
+one seen, and rebuilt from the unexpired rows every
+JWT_REVOCATION_PURGE_INTERVAL seconds so it stays proportional to the number of
+live revoked tokens. Expired rows are deleted by the `maintenance.purge` job
+(see database/jobs.py). One request thread at a time reads the table, without
+holding the lock that other requests need to consult the filter; the new
+filter is swapped in once it is built.
+"""
+
+import hashlib
+import logging
+import math
+import threading
+import time
+from datetime import datetime
+
+from sqlalchemy import delete, func, insert, select
+
+from database.db import db
+
+logger = logging.getLogger(__name__)
+
+
+class BloomFilter:
+    """Fixed-size Bloom filter over strings."""
+
+    def __init__(self, capacity, error_rate=0.001):
+        self.capacity = max(int(capacity), 1)
+        self.size = max(int(math.ceil(-self.capacity * math.log(error_rate) / math.log(2) ** 2)), 8)
+        self.hash_count = max(int(round(self.size / self.capacity * math.log(2))), 1)
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, key):
+        # Double hashing: k positions derived from two 64-bit halves of one digest
+        digest = hashlib.blake2b(key.encode('utf-8'), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hash_count)]
+
+    def add(self, key):
+        for position in self._positions(key):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, key):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+
+class TokenRevocationStore:
+    """Revoked-token table with an in-memory Bloom filter in front of it."""
+
+    def __init__(self, capacity=100000, error_rate=0.001, refresh_interval=2.0, purge_interval=3600):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.refresh_interval = refresh_interval
+        self.purge_interval = purge_interval
+        self._filter = None
+        self._watermark = 0      # highest revoked_tokens.id already in the filter
+        self._next_refresh = 0.0
+        self._next_rebuild = 0.0
+        self._revoked_during_rebuild = None  # jtis revoked here while a rebuild reads the table
+        self._lock = threading.Lock()          # guards the fields above; never held across a query
+        self._refresh_lock = threading.Lock()  # held by the one thread refreshing the filter
+
+    def init_app(self, app):
+        """Read JWT_REVOCATION_* settings from the app config."""
+        self.capacity = app.config.get('JWT_REVOCATION_CAPACITY', self.capacity)
+        self.error_rate = app.config.get('JWT_REVOCATION_ERROR_RATE', self.error_rate)
+        self.refresh_interval = app.config.get('JWT_REVOCATION_REFRESH_INTERVAL', self.refresh_interval)
+        self.purge_interval = app.config.get('JWT_REVOCATION_PURGE_INTERVAL', self.purge_interval)
+        app.extensions['token_revocation'] = self
+
+    @property
+    def _table(self):
+        from models import RevokedToken
+        return RevokedToken.__table__
+
+    def revoke(self, jti, expires_at, token_type='access', user_id=None):
+        """
+        Revoke a token until it expires.
+
+        @param jti (str): The token's unique identifier.
+        @param expires_at: The token's `exp` claim (a UNIX timestamp) or a naive UTC datetime.
+        @param token_type (str): 'access' or 'refresh'.
+        @param user_id: The token's identity, kept for auditing.
+        """
+        if not isinstance(expires_at, datetime):
+            expires_at = datetime.utcfromtimestamp(expires_at)
+        with db.engine.begin() as conn:
+            conn.execute(insert(self._table).prefix_with('OR IGNORE'), {
+                'jti': jti,
+                'token_type': token_type,
+                'user_id': user_id,
+                'expires_at': expires_at,
+                'revoked_at': datetime.utcnow()
+            })
+        with self._lock:
+            if self._filter is not None:
+                self._filter.add(jti)
+            if self._revoked_during_rebuild is not None:
+                self._revoked_during_rebuild.append(jti)
+
+    def is_revoked(self, jti):
+        """Check whether a token has been revoked. Costs no query unless the filter matches."""
+        if jti not in self._current_filter():
+            return False
+        # Either revoked or a false positive; the unique jti index settles it
+        with db.engine.connect() as conn:
+            return conn.execute(select(self._table.c.id).where(self._table.c.jti == jti)).first() is not None
+
+    def purge_expired(self):
+        """Delete rows of expired tokens and rebuild the filter from the rest."""
+        deleted = self._delete_expired()
+        with self._refresh_lock:
+            self._rebuild()
+        if deleted:
+            logger.info("Purged %d expired revoked tokens", deleted)
+        return deleted
+
+    def _current_filter(self):
+        with self._lock:
+            bloom = self._filter
+            due = bloom is None or time.monotonic() >= self._next_refresh
+        if not due:
+            return bloom
+        # Only the first requests wait for a filter; later ones keep the current one while another thread refreshes it
+        if not self._refresh_lock.acquire(blocking=bloom is None):
+            return bloom
+        try:
+            now = time.monotonic()
+            if self._filter is None or now >= self._next_rebuild:
+                self._rebuild()
+            elif now >= self._next_refresh:
+                self._load_new()
+        finally:
+            self._refresh_lock.release()
+        return self._filter
+
+    def _delete_expired(self):
+        with db.engine.begin() as conn:
+            return conn.execute(delete(self._table).where(self._table.c.expires_at <= datetime.utcnow())).rowcount
+
+    def _rebuild(self):
+        # Called with _refresh_lock held; the table is read without _lock
+        table = self._table
+        with self._lock:
+            self._revoked_during_rebuild = []
+        try:
+            with db.engine.connect() as conn:
+                watermark = conn.execute(select(func.coalesce(func.max(table.c.id), 0))).scalar()
+                jtis = conn.execute(
+                    select(table.c.jti).where(table.c.id <= watermark, table.c.expires_at > datetime.utcnow())
+                ).scalars().all()
+            bloom = BloomFilter(max(self.capacity, 2 * len(jtis)), self.error_rate)
+            for jti in jtis:
+                bloom.add(jti)
+            with self._lock:
+                for jti in self._revoked_during_rebuild:
+                    bloom.add(jti)
+                self._filter = bloom
+                self._watermark = watermark
+                now = time.monotonic()
+                self._next_refresh = now + self.refresh_interval
+                self._next_rebuild = now + self.purge_interval
+        finally:
+            with self._lock:
+                self._revoked_during_rebuild = None
+
+    def _load_new(self):
+        # Called with _refresh_lock held, so the watermark only moves here
+        table = self._table
+        with db.engine.connect() as conn:
+            rows = conn.execute(
+                select(table.c.id, table.c.jti).where(table.c.id > self._watermark).order_by(table.c.id)
+            ).all()
+        with self._lock:
+            for row_id, jti in rows:
+                self._filter.add(jti)
+                self._watermark = row_id
+            self._next_refresh = time.monotonic() + self.refresh_interval
+            full = self._filter.count > self._filter.capacity
+        if full:
+            # Past capacity the false-positive rate climbs; size a new filter for the live rows
+            self._rebuild()
+
+
+revocation_store = TokenRevocationStore()
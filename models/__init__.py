@@ -7,9 +7,14 @@ This package contains all SQLAlchemy models for the application.
 from .user import User, Instructor, Learner
 from .tutor import Tutor, TutorModule
 from .course import Course, CourseEnrollment, CourseTutor
-from .analytics import LearnerTutor, LearnerSession, SessionActivity, PerformanceMetric
+from .analytics import LearnerTutor, LearnerSession, SessionActivity, PerformanceMetric, IngestKey
+from .analytics import LearnerTutorProgress, LearnerProgress, MetricBucket, QuantileSketch, AggregateWatermark
+from .analytics import SkillParameters, SkillMastery
 from .admin import Admin, AdminLog
 from .agents import Agent
+from .revision import ContentChunk, TutorRevision
+from .token import RevokedToken
+from .job import Job
 
 __all__ = [
     'User',
@@ -24,9 +29,21 @@ __all__ = [
     'LearnerSession',
     'SessionActivity',
     'PerformanceMetric',
+    'IngestKey',
+    'LearnerTutorProgress',
+    'LearnerProgress',
+    'MetricBucket',
+    'QuantileSketch',
+    'SkillParameters',
+    'SkillMastery',
+    'AggregateWatermark',
     'Admin',
     'AdminLog',
-    'Agent'
+    'Agent',
+    'ContentChunk',
+    'TutorRevision',
+    'RevokedToken',
+    'Job'
 ]
 
 # Register all models in their respective files rather than here
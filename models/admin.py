@@ -8,7 +8,7 @@ from sqlalchemy.orm import relationship
 from datetime import datetime
 from database.db import db
 from .user import User
-from database.sqlite_helpers import register_timestamp_listeners, update_timestamp
+from database.sqlite_helpers import register_timestamp_listeners, register_write_listeners, update_timestamp
 
 class Admin(db.Model):
     """Admin model extending the base User model."""
@@ -56,16 +56,27 @@ class Admin(db.Model):
         return permissions.get(permission, False)
     
     def log_action(self, action, target_type=None, target_id=None, details=None, ip_address=None, user_agent=None):
-        """Log an admin action."""
-        log = AdminLog(
-            admin_id=self.id,
-            action=action,
-            target_type=target_type,
-            target_id=target_id,
-            details=json.dumps(details or {}),
-            ip_address=ip_address,
-            user_agent=user_agent
-        )
+        """
+        Log an admin action.
+
+        The record is handed to the background audit sink when it is running and
+        None is returned; otherwise an AdminLog is added to the current session.
+        """
+        from database.audit_sink import audit_sink
+
+        record = {
+            'admin_id': self.id,
+            'action': action,
+            'target_type': target_type,
+            'target_id': target_id,
+            'details': json.dumps(details or {}),
+            'ip_address': ip_address,
+            'user_agent': user_agent
+        }
+        if audit_sink.enqueue(record):
+            return None
+
+        log = AdminLog(**record)
         db.session.add(log)
         return log
     
@@ -139,3 +150,4 @@ class AdminLog(db.Model):
 
 # Register timestamp listeners for SQLite compatibility
 register_timestamp_listeners([Admin, AdminLog])
+register_write_listeners([Admin, AdminLog])
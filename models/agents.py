@@ -2,8 +2,9 @@
 import json
 from datetime import datetime
 from sqlalchemy import Column, Integer, ForeignKey, DateTime, Text
-from sqlalchemy.orm import relationship
+from sqlalchemy.orm import relationship, backref, deferred, undefer_group
 from database.db import db
+from database.compression import CompressedText
 from database.sqlite_helpers import register_sqlite_listeners
 
 
@@ -16,14 +17,16 @@ class Agent(db.Model):
 
     id = Column(Integer, primary_key=True)
     tutor_id = Column(Integer, ForeignKey('tutors.id', ondelete='CASCADE'), nullable=False)
-    operator_bank = Column(Text, default='{}')
-    sessions = Column(Text, default='{}')
-    expert_model = Column(Text, default='{}')
+    # Large JSON blobs are deferred as one group and loaded together on first access
+    operator_bank = deferred(Column(CompressedText, default='{}'), group='blobs')
+    sessions = deferred(Column(CompressedText, default='{}'), group='blobs')
+    expert_model = deferred(Column(CompressedText, default='{}'), group='blobs')
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow)
 
     # Relationships
-    tutor = relationship('Tutor', backref='agent', uselist=False)
+    # Deleting a tutor deletes its agent, matching the ON DELETE CASCADE foreign key
+    tutor = relationship('Tutor', backref=backref('agent', uselist=False, cascade='all, delete-orphan'))
 
     def __init__(self, tutor_id, operator_bank=None, sessions=None, expert_model=None):
         self.tutor_id = tutor_id
@@ -69,6 +72,17 @@ class Agent(db.Model):
     def expert_model_dict(self, value):
         self.expert_model = json.dumps(value or {})
 
+    @classmethod
+    def query_with_blobs(cls):
+        """Query agents with the deferred JSON blobs loaded up front."""
+        return cls.query.options(undefer_group('blobs'))
+
+    @classmethod
+    def get_by_tutor(cls, tutor_id, with_blobs=False):
+        """Get the agent for a tutor, optionally loading its JSON blobs in the same query."""
+        query = cls.query_with_blobs() if with_blobs else cls.query
+        return query.filter_by(tutor_id=tutor_id).first()
+
     def save(self):
         """Update timestamp and persist to the database."""
         self.updated_at = datetime.utcnow()
@@ -3,7 +3,8 @@ Models for analytics and tracking learner progress.
 """
 
 import json
-from sqlalchemy import Column, Integer, String, ForeignKey, DateTime, Text, Float
+from sqlalchemy import (Column, Integer, String, ForeignKey, DateTime, Date, Text, Float, Boolean, LargeBinary,
+                        UniqueConstraint)
 from sqlalchemy.orm import relationship
 from datetime import datetime
 
@@ -13,12 +14,14 @@ from database.sqlite_helpers import register_sqlite_listeners, calculate_session
 class LearnerTutor(db.Model):
     """Association between a learner and a tutor, tracking progress."""
     __tablename__ = 'learner_tutors'
+    __table_args__ = (UniqueConstraint('learner_id', 'tutor_id'),)
     
     id = Column(Integer, primary_key=True)
     learner_id = Column(Integer, ForeignKey('learners.id', ondelete='CASCADE'), nullable=False)
     tutor_id = Column(Integer, ForeignKey('tutors.id', ondelete='CASCADE'), nullable=False)
     first_access = Column(DateTime)
     last_access = Column(DateTime)
+    num_times_accessed = Column(Integer, default=0, nullable=False)
     completion_percentage = Column(Float, default=0)
     progress_data = Column(Text, default='{}')
     
@@ -270,24 +273,243 @@ class PerformanceMetric(db.Model):
         self.contextual_data = json.dumps(contextual_data_dict)
     
     @classmethod
-    def get_by_learner_and_metric(cls, learner_id, metric_name):
-        """Get all metrics of a specific type for a learner."""
-        return cls.query.filter_by(
-            learner_id=learner_id, 
-            metric_name=metric_name
-        ).order_by(cls.recorded_at.desc()).all()
+    def get_by_learner_and_metric(cls, learner_id, metric_name, since=None, limit=None):
+        """Get metrics of a specific type for a learner, newest first (see MetricBucket for charts)."""
+        return cls._recent(cls.query.filter_by(learner_id=learner_id, metric_name=metric_name), since, limit)
     
     @classmethod
-    def get_by_tutor_and_metric(cls, tutor_id, metric_name):
-        """Get all metrics of a specific type for a tutor."""
-        return cls.query.filter_by(
-            tutor_id=tutor_id, 
-            metric_name=metric_name
-        ).order_by(cls.recorded_at.desc()).all()
+    def get_by_tutor_and_metric(cls, tutor_id, metric_name, since=None, limit=None):
+        """Get metrics of a specific type for a tutor, newest first (see MetricBucket for charts)."""
+        return cls._recent(cls.query.filter_by(tutor_id=tutor_id, metric_name=metric_name), since, limit)
+    
+    @classmethod
+    def _recent(cls, query, since, limit):
+        # Served by the (owner, metric_name, recorded_at) indexes
+        if since is not None:
+            query = query.filter(cls.recorded_at >= since)
+        query = query.order_by(cls.recorded_at.desc())
+        return query.limit(limit).all() if limit else query.all()
     
     def __repr__(self):
         return f"<PerformanceMetric {self.id}: {self.metric_name} = {self.metric_value}, Learner {self.learner_id}>"
 
 
+class IngestKey(db.Model):
+    """An idempotency key of an ingested analytics event, so client retries are not recorded twice."""
+    __tablename__ = 'ingest_keys'
+    __table_args__ = (UniqueConstraint('learner_id', 'idempotency_key'),)
+    
+    id = Column(Integer, primary_key=True)
+    learner_id = Column(Integer, ForeignKey('learners.id', ondelete='CASCADE'), nullable=False)
+    idempotency_key = Column(String(128), nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f"<IngestKey {self.idempotency_key}, Learner {self.learner_id}>"
+
+
+class LearnerTutorProgress(db.Model):
+    """Precomputed totals for one learner on one tutor, maintained by database/progress_rollups.py."""
+    __tablename__ = 'learner_tutor_progress'
+    
+    id = Column(Integer, primary_key=True)
+    learner_tutor_id = Column(Integer, ForeignKey('learner_tutors.id', ondelete='CASCADE'), unique=True, nullable=False)
+    learner_id = Column(Integer, ForeignKey('learners.id', ondelete='CASCADE'), nullable=False)
+    tutor_id = Column(Integer, ForeignKey('tutors.id', ondelete='CASCADE'), nullable=False)
+    sessions = Column(Integer, default=0)
+    ended_sessions = Column(Integer, default=0)
+    total_minutes = Column(Integer, default=0)
+    activities = Column(Integer, default=0)
+    scored_activities = Column(Integer, default=0)
+    score_sum = Column(Float, default=0)
+    last_score = Column(Float)
+    last_score_at = Column(DateTime)  # timestamp of the activity last_score came from
+    last_activity_at = Column(DateTime)
+    is_stale = Column(Boolean, default=False)  # a session ended since the session totals were computed
+    updated_at = Column(DateTime, default=datetime.utcnow)
+    
+    @property
+    def mean_score(self):
+        return self.score_sum / self.scored_activities if self.scored_activities else None
+    
+    def to_dict(self):
+        return {
+            'learner_tutor_id': self.learner_tutor_id,
+            'tutor_id': self.tutor_id,
+            'sessions': self.sessions,
+            'ended_sessions': self.ended_sessions,
+            'total_minutes': self.total_minutes,
+            'activities': self.activities,
+            'mean_score': self.mean_score,
+            'last_score': self.last_score,
+            'last_activity_at': self.last_activity_at.isoformat() if self.last_activity_at else None
+        }
+    
+    def __repr__(self):
+        return f"<LearnerTutorProgress Learner {self.learner_id}, Tutor {self.tutor_id}: {self.sessions} sessions>"
+
+
+class LearnerProgress(db.Model):
+    """Precomputed totals and activity streak for one learner across all tutors."""
+    __tablename__ = 'learner_progress'
+    
+    id = Column(Integer, primary_key=True)
+    learner_id = Column(Integer, ForeignKey('learners.id', ondelete='CASCADE'), unique=True, nullable=False)
+    tutors = Column(Integer, default=0)
+    sessions = Column(Integer, default=0)
+    total_minutes = Column(Integer, default=0)
+    activities = Column(Integer, default=0)
+    scored_activities = Column(Integer, default=0)
+    score_sum = Column(Float, default=0)
+    last_score = Column(Float)
+    last_activity_at = Column(DateTime)
+    last_active_date = Column(Date)
+    streak_days = Column(Integer, default=0)  # consecutive active days ending on last_active_date
+    longest_streak_days = Column(Integer, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+    
+    @property
+    def mean_score(self):
+        return self.score_sum / self.scored_activities if self.scored_activities else None
+    
+    def current_streak(self, today=None):
+        """The streak still counts if the learner was active today or yesterday."""
+        today = today or datetime.utcnow().date()
+        if self.last_active_date and (today - self.last_active_date).days <= 1:
+            return self.streak_days
+        return 0
+    
+    def to_dict(self):
+        return {
+            'learner_id': self.learner_id,
+            'tutors': self.tutors,
+            'sessions': self.sessions,
+            'total_minutes': self.total_minutes,
+            'activities': self.activities,
+            'mean_score': self.mean_score,
+            'last_score': self.last_score,
+            'last_activity_at': self.last_activity_at.isoformat() if self.last_activity_at else None,
+            'streak_days': self.current_streak(),
+            'longest_streak_days': self.longest_streak_days
+        }
+    
+    def __repr__(self):
+        return f"<LearnerProgress Learner {self.learner_id}: {self.total_minutes} min, streak {self.streak_days}>"
+
+
+class MetricBucket(db.Model):
+    """
+    Count, sum, min and max of one metric of a learner or tutor over one minute,
+    hour or day, maintained by database/metric_series.py.
+    """
+    __tablename__ = 'metric_buckets'
+    __table_args__ = (UniqueConstraint('scope', 'owner_id', 'metric_name', 'resolution', 'bucket_start'),)
+    
+    id = Column(Integer, primary_key=True)
+    scope = Column(String(10), nullable=False)  # 'learner' or 'tutor'
+    owner_id = Column(Integer, nullable=False)  # learner or tutor id
+    metric_name = Column(String(100), nullable=False)
+    resolution = Column(Integer, nullable=False)  # bucket width in seconds: 60, 3600 or 86400
+    bucket_start = Column(DateTime, nullable=False)
+    count = Column(Integer, nullable=False, default=0)
+    value_sum = Column(Float, nullable=False, default=0)
+    min_value = Column(Float)
+    max_value = Column(Float)
+    
+    def __repr__(self):
+        return f"<MetricBucket {self.scope} {self.owner_id} {self.metric_name} @ {self.bucket_start}/{self.resolution}s>"
+
+
+class QuantileSketch(db.Model):
+    """
+    Mergeable KLL quantile sketch of one metric over a tutor's or course's
+    learners, maintained by database/quantile_sketches.py.
+    """
+    __tablename__ = 'quantile_sketches'
+    __table_args__ = (UniqueConstraint('scope', 'owner_id', 'metric_name'),)
+    
+    id = Column(Integer, primary_key=True)
+    scope = Column(String(10), nullable=False)  # 'tutor' or 'course'
+    owner_id = Column(Integer, nullable=False)  # tutor or course id
+    metric_name = Column(String(100), nullable=False)  # a performance metric, or 'activity_score'
+    count = Column(Integer, nullable=False, default=0)  # values folded in
+    data = Column(LargeBinary, nullable=False)  # serialized sketch
+    updated_at = Column(DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f"<QuantileSketch {self.scope} {self.owner_id} {self.metric_name} ({self.count} values)>"
+
+
+class SkillParameters(db.Model):
+    """
+    Knowledge tracing parameters of one skill of a tutor, fitted by
+    database/knowledge_tracing.py. Skills without a row use the defaults.
+    """
+    __tablename__ = 'skill_parameters'
+    __table_args__ = (UniqueConstraint('tutor_id', 'skill'),)
+    
+    id = Column(Integer, primary_key=True)
+    tutor_id = Column(Integer, ForeignKey('tutors.id', ondelete='CASCADE'), nullable=False)
+    skill = Column(String(100), nullable=False)
+    p_init = Column(Float, nullable=False)  # P(mastered before the first attempt)
+    p_learn = Column(Float, nullable=False)  # P(mastering the skill at each attempt)
+    p_guess = Column(Float, nullable=False)  # P(correct without mastery)
+    p_slip = Column(Float, nullable=False)  # P(incorrect despite mastery)
+    learners = Column(Integer, nullable=False, default=0)  # learners the fit used
+    observations = Column(Integer, nullable=False, default=0)  # attempts the fit used
+    log_likelihood = Column(Float)
+    fitted_at = Column(DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f"<SkillParameters Tutor {self.tutor_id} {self.skill}>"
+
+
+class SkillMastery(db.Model):
+    """Estimated probability that a learner has mastered a skill of a tutor, after their latest attempt."""
+    __tablename__ = 'skill_mastery'
+    __table_args__ = (UniqueConstraint('learner_id', 'tutor_id', 'skill'),)
+    
+    id = Column(Integer, primary_key=True)
+    learner_id = Column(Integer, ForeignKey('learners.id', ondelete='CASCADE'), nullable=False)
+    tutor_id = Column(Integer, ForeignKey('tutors.id', ondelete='CASCADE'), nullable=False)
+    skill = Column(String(100), nullable=False)
+    p_mastery = Column(Float, nullable=False)
+    attempts = Column(Integer, nullable=False, default=0)
+    correct = Column(Integer, nullable=False, default=0)
+    last_practiced_at = Column(DateTime)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+    
+    def to_dict(self):
+        return {
+            'tutor_id': self.tutor_id,
+            'skill': self.skill,
+            'p_mastery': round(self.p_mastery, 4),
+            'attempts': self.attempts,
+            'correct': self.correct,
+            'last_practiced_at': self.last_practiced_at.isoformat() if self.last_practiced_at else None
+        }
+    
+    def __repr__(self):
+        return f"<SkillMastery Learner {self.learner_id}, Tutor {self.tutor_id} {self.skill}: {self.p_mastery:.2f}>"
+
+
+class AggregateWatermark(db.Model):
+    """How far an incremental aggregation has read a source table (the last row id processed).
+
+    Periodic jobs also keep their last enqueue time here, as updated_at of 'jobs.periodic:<name>'.
+    """
+    __tablename__ = 'aggregate_watermarks'
+    
+    id = Column(Integer, primary_key=True)
+    name = Column(String(100), unique=True, nullable=False)
+    position = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f"<AggregateWatermark {self.name} = {self.position}>"
+
+
 # Register model listeners for SQLite compatibility
-register_sqlite_listeners([LearnerTutor, LearnerSession, SessionActivity, PerformanceMetric])
+register_sqlite_listeners([LearnerTutor, LearnerSession, SessionActivity, PerformanceMetric, IngestKey,
+                           LearnerTutorProgress, LearnerProgress, MetricBucket, QuantileSketch,
+                           SkillParameters, SkillMastery, AggregateWatermark])
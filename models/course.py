@@ -2,7 +2,7 @@
 Models for courses and enrollments.
 """
 
-from sqlalchemy import Column, Integer, String, ForeignKey, DateTime, Text, Boolean, Date
+from sqlalchemy import Column, Integer, String, ForeignKey, DateTime, Text, Boolean, Date, UniqueConstraint
 from sqlalchemy.orm import relationship
 from datetime import datetime
 
@@ -140,6 +140,7 @@ class Course(db.Model):
 class CourseEnrollment(db.Model):
     """Junction table for course-learner relationships."""
     __tablename__ = 'course_learners'  # Using the course_learners table name
+    __table_args__ = (UniqueConstraint('course_id', 'learner_id'),)
     
     id = Column(Integer, primary_key=True)
     course_id = Column(Integer, ForeignKey('courses.id', ondelete='CASCADE'), nullable=False)
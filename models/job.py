@@ -0,0 +1,78 @@
+"""
+Model for background jobs.
+"""
+
+import json
+from datetime import datetime
+from sqlalchemy import Column, Integer, String, DateTime, Text, Float, Index, text
+
+from database.db import db
+from database.sqlite_helpers import register_sqlite_listeners
+
+
+class Job(db.Model):
+    """A unit of background work run by the job scheduler (see database/jobs.py)."""
+    __tablename__ = 'jobs'
+    __table_args__ = (
+        Index('idx_jobs_active_key', 'job_key', unique=True, sqlite_where=text("status IN ('queued', 'running')")),
+    )
+
+    id = Column(Integer, primary_key=True)
+    name = Column(String(100), nullable=False)  # registered handler
+    job_key = Column(String(255))  # at most one queued or running job per key
+    payload = Column(Text, default='{}')
+    priority = Column(Integer, default=0)  # higher runs first
+    status = Column(String(20), nullable=False, default='queued')  # 'queued', 'running', 'succeeded', 'failed'
+    attempts = Column(Integer, default=0)
+    max_attempts = Column(Integer, default=3)
+    run_after = Column(DateTime, default=datetime.utcnow)
+    progress = Column(Float, default=0)
+    message = Column(Text)
+    result = Column(Text)
+    error = Column(Text)
+    user_id = Column(Integer)  # who asked for the job, if anyone
+    created_at = Column(DateTime, default=datetime.utcnow)
+    started_at = Column(DateTime)
+    heartbeat_at = Column(DateTime)
+    finished_at = Column(DateTime)
+
+    @property
+    def payload_dict(self):
+        """Get the payload as a Python dictionary."""
+        try:
+            return json.loads(self.payload or '{}')
+        except Exception:
+            return {}
+
+    @property
+    def result_dict(self):
+        """Get the result as a Python object (None until the job has succeeded)."""
+        try:
+            return json.loads(self.result) if self.result else None
+        except Exception:
+            return None
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'name': self.name,
+            'job_key': self.job_key,
+            'priority': self.priority,
+            'status': self.status,
+            'attempts': self.attempts,
+            'max_attempts': self.max_attempts,
+            'progress': self.progress,
+            'message': self.message,
+            'result': self.result_dict,
+            'error': self.error,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None
+        }
+
+    def __repr__(self):
+        return f"<Job {self.id}: {self.name} ({self.status})>"
+
+
+# Register model listeners for SQLite compatibility
+register_sqlite_listeners([Job])
@@ -0,0 +1,321 @@
+"""
+Models for the content-addressed tutor revision store.
+
+Tutor content is split into content-defined chunks that are stored once per
+distinct SHA-256 hash. A revision records the list of chunk hashes that make
+up the content. Consecutive revisions are delta-encoded: the manifest of a
+non-keyframe revision holds runs copied from the parent's chunk list plus the
+hashes of new chunks, so a save only writes the chunks and manifest entries
+that changed.
+"""
+
+import hashlib
+import json
+import re
+import threading
+import zlib
+from collections import OrderedDict
+from datetime import datetime
+
+from sqlalchemy import Column, Integer, String, ForeignKey, DateTime, Text, Boolean
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import relationship
+
+from database.db import db
+from database.compression import CompressedText
+from database.sqlite_helpers import register_sqlite_listeners
+
+# Chunking parameters (in characters)
+MIN_CHUNK_SIZE = 1024
+MAX_CHUNK_SIZE = 16384
+# A boundary token whose CRC has these low bits clear ends a chunk (~1 in 64 tokens)
+BOUNDARY_MASK = 0x3F
+# Every Nth revision stores a full manifest so materializing never walks far back
+KEYFRAME_INTERVAL = 16
+
+# Split after newlines and closing angle brackets, i.e. between HTML tags and JSON lines
+_TOKEN_RE = re.compile(r'(?<=[\n>])')
+
+
+def chunk_content(content):
+    """
+    Split text into content-defined chunks.
+
+    Chunk boundaries depend only on nearby content, so an edit in one place
+    leaves the chunks elsewhere in the document (and their hashes) unchanged.
+
+    @param content (str): The text to split.
+    @return (list): A list of chunk strings whose concatenation is the content.
+    """
+    chunks = []
+    current = []
+    size = 0
+    for token in _TOKEN_RE.split(content):
+        while len(token) > MAX_CHUNK_SIZE:
+            # A long run without boundaries (e.g. minified markup) gets hard cuts
+            head, token = token[:MAX_CHUNK_SIZE - size], token[MAX_CHUNK_SIZE - size:]
+            current.append(head)
+            chunks.append(''.join(current))
+            current, size = [], 0
+        if not token:
+            continue
+        if current and size + len(token) > MAX_CHUNK_SIZE:
+            # Cut before a token that would overflow the chunk
+            chunks.append(''.join(current))
+            current, size = [], 0
+        current.append(token)
+        size += len(token)
+        if size >= MAX_CHUNK_SIZE or (size >= MIN_CHUNK_SIZE and zlib.crc32(token.encode('utf-8')) & BOUNDARY_MASK == 0):
+            chunks.append(''.join(current))
+            current, size = [], 0
+    if current:
+        chunks.append(''.join(current))
+    return chunks
+
+
+def hash_chunk(chunk):
+    """Return the content address of a chunk."""
+    return hashlib.sha256(chunk.encode('utf-8')).hexdigest()
+
+
+def encode_delta(parent_hashes, hashes):
+    """
+    Encode a chunk list relative to its parent's.
+
+    @return (list): Ops where [start, length] copies a run of the parent list
+                    and a string is a literal chunk hash.
+    """
+    positions = {}
+    for index, chunk_hash in enumerate(parent_hashes):
+        positions.setdefault(chunk_hash, index)
+
+    ops = []
+    i = 0
+    while i < len(hashes):
+        start = positions.get(hashes[i])
+        if start is None:
+            ops.append(hashes[i])
+            i += 1
+            continue
+        length = 1
+        while (i + length < len(hashes) and start + length < len(parent_hashes)
+               and parent_hashes[start + length] == hashes[i + length]):
+            length += 1
+        ops.append([start, length])
+        i += length
+    return ops
+
+
+def apply_delta(parent_hashes, ops):
+    """Rebuild a chunk list from its parent's list and delta ops."""
+    hashes = []
+    for op in ops:
+        if isinstance(op, str):
+            hashes.append(op)
+        else:
+            start, length = op
+            hashes.extend(parent_hashes[start:start + length])
+    return hashes
+
+
+class ContentChunk(db.Model):
+    """A deduplicated chunk of tutor content, addressed by its SHA-256 hash."""
+    __tablename__ = 'content_chunks'
+
+    hash = Column(String(64), primary_key=True)
+    data = Column(CompressedText, nullable=False)
+    size = Column(Integer, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    def __init__(self, hash, data):
+        self.hash = hash
+        self.data = data
+        self.size = len(data)
+        self.created_at = datetime.utcnow()
+
+    @classmethod
+    def store_many(cls, chunks):
+        """
+        Insert the chunks that are not stored yet, in the session's transaction.
+
+        Another process may store the same chunk between the existence check
+        and the insert (e.g. two clones saving shared content), so the insert
+        skips hashes that are already present rather than failing.
+
+        @param chunks (dict): hash -> chunk text.
+        @return (int): The number of new chunks.
+        """
+        if not chunks:
+            return 0
+        existing = set()
+        hashes = list(chunks)
+        # Stay well below SQLite's bound-parameter limit
+        for i in range(0, len(hashes), 500):
+            existing.update(
+                row[0] for row in db.session.query(cls.hash).filter(cls.hash.in_(hashes[i:i + 500])).all()
+            )
+        now = datetime.utcnow()
+        rows = [{'hash': chunk_hash, 'data': chunks[chunk_hash], 'size': len(chunks[chunk_hash]), 'created_at': now}
+                for chunk_hash in hashes if chunk_hash not in existing]
+        if not rows:
+            return 0
+        stmt = sqlite_insert(cls.__table__).on_conflict_do_nothing(index_elements=['hash'])
+        return db.session.execute(stmt, rows).rowcount
+
+    @classmethod
+    def load_many(cls, hashes):
+        """Load chunk texts for a list of hashes, returned as a dict."""
+        unique = list(set(hashes))
+        found = {}
+        for i in range(0, len(unique), 500):
+            found.update(
+                db.session.query(cls.hash, cls.data).filter(cls.hash.in_(unique[i:i + 500])).all()
+            )
+        return found
+
+    def __repr__(self):
+        return f"<ContentChunk {self.hash[:12]}: {self.size} chars>"
+
+
+class TutorRevision(db.Model):
+    """A saved version of a tutor's content, stored as a (delta-encoded) chunk manifest."""
+    __tablename__ = 'tutor_revisions'
+
+    id = Column(Integer, primary_key=True)
+    tutor_id = Column(Integer, ForeignKey('tutors.id', ondelete='CASCADE'), nullable=False)
+    parent_id = Column(Integer, ForeignKey('tutor_revisions.id'))
+    content_hash = Column(String(64), nullable=False)
+    manifest = Column(Text, nullable=False)
+    is_keyframe = Column(Boolean, default=False)
+    depth = Column(Integer, default=0)  # revisions since the last keyframe
+    size = Column(Integer, nullable=False)
+    new_chunks = Column(Integer, default=0)
+    message = Column(Text)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    # Relationships
+    parent = relationship('TutorRevision', remote_side=[id])
+
+    # Resolved chunk lists of recently used revisions, shared across requests
+    _hash_cache = OrderedDict()
+    _hash_cache_lock = threading.Lock()
+    _hash_cache_size = 256
+
+    def __init__(self, tutor_id, content_hash, manifest, size, parent_id=None, is_keyframe=False,
+                 depth=0, new_chunks=0, message=None):
+        self.tutor_id = tutor_id
+        self.parent_id = parent_id
+        self.content_hash = content_hash
+        self.manifest = json.dumps(manifest)
+        self.is_keyframe = is_keyframe
+        self.depth = depth
+        self.size = size
+        self.new_chunks = new_chunks
+        self.message = message
+        self.created_at = datetime.utcnow()
+
+    @property
+    def manifest_list(self):
+        """Get the stored manifest (hashes or delta ops) as a Python list."""
+        try:
+            return json.loads(self.manifest)
+        except Exception:
+            return []
+
+    @classmethod
+    def create(cls, tutor, content, parent=None, message=None):
+        """
+        Store content as a new revision, writing only chunks not stored yet.
+        The revision is added to the session; the caller flushes. Nothing is
+        flushed here, so this is safe to call from a before_flush hook.
+
+        @param tutor (Tutor): The tutor the revision belongs to; it may not have an ID yet.
+        @param content (str): The serialized tutor content.
+        @param parent (TutorRevision): The previous revision, if any.
+        @param message (str): Optional description of the change.
+        @return (TutorRevision): The new revision, or the parent if the content is unchanged.
+        """
+        content = content or ''
+        content_hash = hash_chunk(content)
+        if parent is not None and parent.tutor_id != tutor.id:
+            # A clone's first own revision starts a new history; deltas never reach
+            # into another tutor's revisions, which are deleted along with it
+            parent = None
+        if parent is not None and parent.content_hash == content_hash:
+            return parent
+
+        chunks = chunk_content(content)
+        hashes = [hash_chunk(chunk) for chunk in chunks]
+        new_chunks = ContentChunk.store_many(dict(zip(hashes, chunks)))
+
+        is_keyframe = parent is None or parent.depth + 1 >= KEYFRAME_INTERVAL
+        manifest = hashes if is_keyframe else encode_delta(parent.chunk_hashes(), hashes)
+        revision = cls(
+            tutor_id=tutor.id,
+            content_hash=content_hash,
+            manifest=manifest,
+            size=len(content),
+            is_keyframe=is_keyframe,
+            depth=0 if is_keyframe else parent.depth + 1,
+            new_chunks=new_chunks,
+            message=message
+        )
+        revision.tutor = tutor
+        revision.parent = parent
+        db.session.add(revision)
+        return revision
+
+    def chunk_hashes(self):
+        """Resolve the full chunk list of this revision, following deltas back to a keyframe."""
+        # Keyed with the content hash too, since a rolled-back insert can free an id for reuse
+        cache_key = (self.id, self.content_hash)
+        with self._hash_cache_lock:
+            cached = self._hash_cache.get(cache_key)
+            if cached is not None:
+                self._hash_cache.move_to_end(cache_key)
+                return cached
+
+        if self.is_keyframe or self.parent is None:
+            hashes = self.manifest_list
+        else:
+            hashes = apply_delta(self.parent.chunk_hashes(), self.manifest_list)
+        self._remember(cache_key, hashes)
+        return hashes
+
+    def materialize(self):
+        """Rebuild the full content of this revision."""
+        hashes = self.chunk_hashes()
+        chunks = ContentChunk.load_many(hashes)
+        return ''.join(chunks[chunk_hash] for chunk_hash in hashes)
+
+    @classmethod
+    def _remember(cls, cache_key, hashes):
+        with cls._hash_cache_lock:
+            cls._hash_cache[cache_key] = hashes
+            cls._hash_cache.move_to_end(cache_key)
+            while len(cls._hash_cache) > cls._hash_cache_size:
+                cls._hash_cache.popitem(last=False)
+
+    @classmethod
+    def get_history(cls, tutor_id, limit=50):
+        """Get the most recent revisions of a tutor, newest first."""
+        return cls.query.filter_by(tutor_id=tutor_id).order_by(cls.id.desc()).limit(limit).all()
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'tutor_id': self.tutor_id,
+            'parent_id': self.parent_id,
+            'content_hash': self.content_hash,
+            'size': self.size,
+            'new_chunks': self.new_chunks,
+            'message': self.message,
+            'created_at': self.created_at.isoformat() if self.created_at else None
+        }
+
+    def __repr__(self):
+        return f"<TutorRevision {self.id}: Tutor {self.tutor_id}, {self.size} chars>"
+
+
+# Register model listeners for SQLite compatibility
+register_sqlite_listeners([ContentChunk, TutorRevision])
@@ -0,0 +1,45 @@
+"""
+Model for revoked JWTs.
+"""
+
+from datetime import datetime
+from sqlalchemy import Column, Integer, String, DateTime
+
+from database.db import db
+from database.sqlite_helpers import register_sqlite_listeners
+
+
+class RevokedToken(db.Model):
+    """A JWT revoked before its expiry (e.g. on logout). Rows are purged once the token expires."""
+    __tablename__ = 'revoked_tokens'
+
+    id = Column(Integer, primary_key=True)
+    jti = Column(String(36), unique=True, nullable=False)
+    token_type = Column(String(10), default='access')  # 'access' or 'refresh'
+    user_id = Column(Integer)
+    expires_at = Column(DateTime, nullable=False)
+    revoked_at = Column(DateTime, default=datetime.utcnow)
+
+    def __init__(self, jti, expires_at, token_type='access', user_id=None):
+        self.jti = jti
+        self.expires_at = expires_at
+        self.token_type = token_type
+        self.user_id = user_id
+        self.revoked_at = datetime.utcnow()
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'jti': self.jti,
+            'token_type': self.token_type,
+            'user_id': self.user_id,
+            'expires_at': self.expires_at.isoformat() if self.expires_at else None,
+            'revoked_at': self.revoked_at.isoformat() if self.revoked_at else None
+        }
+
+    def __repr__(self):
+        return f"<RevokedToken {self.jti} ({self.token_type})>"
+
+
+# Register model listeners for SQLite compatibility
+register_sqlite_listeners([RevokedToken])
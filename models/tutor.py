@@ -3,11 +3,13 @@ Models for tutors and their modules.
 """
 
 import json
-from sqlalchemy import Column, Integer, String, ForeignKey, DateTime, Text, Boolean
-from sqlalchemy.orm import relationship
+from itertools import chain
+from sqlalchemy import Column, Integer, String, ForeignKey, DateTime, Text, Boolean, event, inspect, select
+from sqlalchemy.orm import relationship, deferred, undefer, Session
 from datetime import datetime
 
 from database.db import db
+from database.compression import CompressedText
 from database.sqlite_helpers import register_sqlite_listeners
 
 class Tutor(db.Model):
@@ -19,15 +21,25 @@ class Tutor(db.Model):
     title = Column(String(255), nullable=False)
     description = Column(Text)
     subject_area = Column(String(100))
-    content = Column(Text, default='{}')
+    # Content written since the last flush, or of a tutor saved before the revision
+    # store; the before_flush hook moves it into a revision and empties the column
+    content = deferred(Column(CompressedText, default='{}'))
     settings = Column(Text, default='{}')
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow)
     is_published = Column(Boolean, default=False)
     version = Column(String(20), default='1.0')
+    revision_id = Column(Integer)  # head of the revision history in tutor_revisions
+    # Copy-on-write clones share their source's revision, modules and agent until first edited
+    cloned_from_id = Column(Integer)
+    is_materialized = Column(Boolean, default=True)
     
     # Relationships
     modules = relationship('TutorModule', backref='tutor', cascade='all, delete-orphan', order_by='TutorModule.sequence_order')
+    revisions = relationship('TutorRevision', backref='tutor', cascade='all, delete-orphan', lazy='dynamic')
+    # The saved content; updated after the revision row is inserted
+    head_revision = relationship('TutorRevision', primaryjoin='foreign(Tutor.revision_id) == TutorRevision.id',
+                                 post_update=True)
     
     def __init__(self, instructor_id, title, description=None, subject_area=None, grade_level=None, 
                  difficulty_level=None, content=None, settings=None, is_published=False, version='1.0'):
@@ -39,20 +51,52 @@ class Tutor(db.Model):
         self.settings = json.dumps(settings or {})
         self.is_published = is_published
         self.version = version
+        self.is_materialized = True
         self.created_at = datetime.utcnow()
         self.updated_at = datetime.utcnow()
     
+    @property
+    def is_clone(self):
+        """Whether this tutor still shares its source's content, modules and agent."""
+        return self.cloned_from_id is not None and not self.is_materialized
+    
+    @property
+    def source_id(self):
+        """The tutor whose modules and agent this one reads (itself unless it is an unedited clone)."""
+        return self.cloned_from_id if self.is_clone else self.id
+    
+    @property
+    def resolved_content(self):
+        """Get the content string: unsaved content if any, else the head revision's."""
+        if self.content:
+            return self.content
+        head = self.head_revision
+        return head.materialize() if head is not None else '{}'
+    
+    @property
+    def effective_modules(self):
+        """Get the modules of this tutor, or of its source while it is an unedited clone."""
+        if self.is_clone:
+            return TutorModule.query.filter_by(tutor_id=self.cloned_from_id).order_by(TutorModule.sequence_order).all()
+        return self.modules
+    
+    def get_agent(self, with_blobs=False):
+        """Get the agent of this tutor, or of its source while it is an unedited clone."""
+        from .agents import Agent
+        return Agent.get_by_tutor(self.source_id, with_blobs=with_blobs)
+    
     @property
     def content_dict(self):
         """Get content as a Python dictionary."""
         try:
-            return json.loads(self.content)
+            return json.loads(self.resolved_content)
         except Exception:
             return {}
     
     @content_dict.setter
     def content_dict(self, content_dict):
         """Set content from a Python dictionary."""
+        self.materialize()
         self.content = json.dumps(content_dict)
     
     @property
@@ -68,6 +112,130 @@ class Tutor(db.Model):
         """Set settings from a Python dictionary."""
         self.settings = json.dumps(settings_dict)
     
+    def record_revision(self, message=None):
+        """
+        Move content written since the last save into a new head revision and
+        empty the column, so the content is only stored as chunks. Only chunks
+        that are not stored yet are written. The before_flush hook calls this for
+        every content write; the caller flushes.
+        
+        @return (TutorRevision): The head revision (unchanged if no content was written).
+        """
+        from .revision import TutorRevision
+        content = self.content
+        if not content:
+            return self.head_revision
+        self.head_revision = TutorRevision.create(self, content, parent=self.head_revision, message=message)
+        self.content = ''
+        return self.head_revision
+    
+    def save_revision(self, message=None):
+        """Record content written since the last save as a revision with a message, and commit."""
+        self.materialize()
+        revision = self.record_revision(message=message)
+        db.session.commit()
+        return revision
+    
+    def restore_revision(self, revision_id):
+        """
+        Make an earlier revision the head again (e.g. for undo) and commit.
+        No chunks are written; the next save branches from the restored revision.
+        """
+        from .revision import TutorRevision
+        revision = TutorRevision.query.filter_by(id=revision_id, tutor_id=self.id).first()
+        if not revision:
+            raise ValueError(f"Revision {revision_id} does not belong to tutor {self.id}")
+        self.head_revision = revision
+        self.content = ''
+        self.updated_at = datetime.utcnow()
+        db.session.commit()
+        return revision
+    
+    def undo(self):
+        """Step the head back to its parent revision. Returns None if there is nothing to undo."""
+        head = self.head_revision
+        if head is None or head.parent_id is None:
+            return None
+        parent = head.parent
+        if parent.tutor_id != self.id:
+            return None  # the parent belongs to the tutor this one was cloned from
+        return self.restore_revision(parent.id)
+    
+    def clone(self, instructor_id=None, title=None):
+        """
+        Create a copy-on-write clone of this tutor and add it to the session.
+        
+        The clone points at this tutor's head revision and reads its modules and
+        agent until it is first edited, so cloning inserts a single row no matter
+        how large the tutor is. The caller commits.
+        """
+        if self.head_revision is None or self.content:
+            # Unsaved content, or a tutor saved before the revision store, needs a snapshot first
+            self.save_revision(message="Snapshot for cloning")
+        
+        clone = Tutor(
+            instructor_id=instructor_id or self.instructor_id,
+            title=title or f"{self.title} (Copy)",
+            description=self.description,
+            subject_area=self.subject_area,
+            is_published=False,
+            version=self.version
+        )
+        clone.settings = self.settings
+        clone.content = ''
+        clone.head_revision = self.head_revision
+        # Clones of clones point at the tutor that actually holds the rows
+        clone.cloned_from_id = self.source_id
+        clone.is_materialized = False
+        db.session.add(clone)
+        return clone
+    
+    def materialize(self):
+        """
+        Give an unedited clone its own copy of the shared modules and agent.
+        Called before the first edit of a clone, and before a flush that would
+        change or delete the rows it shares. The clone keeps the shared head
+        revision until its content is first written. The source rows are read
+        as stored, ignoring pending changes, and nothing is flushed or committed.
+        
+        @return (dict): Shared module ID -> the clone's copy of that module.
+        """
+        if not self.is_clone:
+            return {}
+        from .agents import Agent
+        
+        source_id = self.cloned_from_id
+        copies = {}
+        with db.session.no_autoflush:
+            modules = TutorModule.__table__
+            rows = db.session.execute(
+                select(modules).where(modules.c.tutor_id == source_id).order_by(modules.c.sequence_order)
+            ).mappings().all()
+            for row in rows:
+                module = TutorModule(tutor_id=self.id, title=row['title'], sequence_order=row['sequence_order'],
+                                     module_type=row['module_type'])
+                # Copy the stored strings as-is instead of decoding and re-encoding them
+                module.content = row['content']
+                module.prerequisites = row['prerequisites']
+                module.learning_objectives = row['learning_objectives']
+                self.modules.append(module)
+                copies[row['id']] = module
+            
+            agents = Agent.__table__
+            agent_row = db.session.execute(
+                select(agents.c.operator_bank, agents.c.expert_model).where(agents.c.tutor_id == source_id)
+            ).mappings().first()
+            if agent_row is not None:
+                # Learner sessions stay with the source; the clone starts with none
+                agent = Agent(tutor_id=self.id)
+                agent.operator_bank = agent_row['operator_bank']
+                agent.expert_model = agent_row['expert_model']
+                db.session.add(agent)
+        
+        self.is_materialized = True
+        self.updated_at = datetime.utcnow()
+        return copies
+    
     def publish(self):
         """Publish the tutor."""
         self.is_published = True
@@ -83,6 +251,7 @@ class Tutor(db.Model):
     def add_module(self, title, sequence_order=None, content=None, module_type='lesson', 
                    prerequisites=None, learning_objectives=None):
         """Add a new module to this tutor."""
+        self.materialize()
         
         # If sequence_order is not provided, place at the end
         if sequence_order is None:
@@ -113,8 +282,8 @@ class Tutor(db.Model):
         if not module_order or not all(isinstance(id_, int) for id_ in module_order):
             raise ValueError("module_order must be a list of module IDs (integers)")
         
-        # Ensure all modules exist
-        modules = {m.id: m for m in self.modules}
+        # Ensure all modules exist; a clone's copies are keyed by the shared IDs the caller saw
+        modules = self.materialize() if self.is_clone else {m.id: m for m in self.modules}
         if not all(id_ in modules for id_ in module_order):
             raise ValueError("module_order contains invalid module IDs")
         
@@ -125,6 +294,41 @@ class Tutor(db.Model):
         self.updated_at = datetime.utcnow()
         db.session.commit()
     
+    def to_dict(self, include_details=False):
+        """
+        Serialize the tutor. The deferred content column is only loaded
+        (and included) when include_details is True.
+        """
+        data = {
+            'id': self.id,
+            'instructor_id': self.instructor_id,
+            'title': self.title,
+            'description': self.description,
+            'subject_area': self.subject_area,
+            'settings': self.settings_dict,
+            'is_published': self.is_published,
+            'version': self.version,
+            'revision_id': self.revision_id,
+            'cloned_from_id': self.cloned_from_id,
+            'is_clone': self.is_clone,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None
+        }
+        if include_details:
+            data['content'] = self.content_dict
+            data['modules'] = [module.to_dict() for module in self.effective_modules]
+        return data
+    
+    @classmethod
+    def query_with_content(cls):
+        """Query tutors with the deferred content column loaded up front."""
+        return cls.query.options(undefer(cls.content))
+    
+    @classmethod
+    def get_tutor_with_content(cls, tutor_id):
+        """Get a tutor by ID with its content loaded in the same query."""
+        return cls.query_with_content().filter_by(id=tutor_id).first()
+    
     @classmethod
     def get_published_tutors(cls):
         """Get all published tutors."""
@@ -148,7 +352,7 @@ class TutorModule(db.Model):
     tutor_id = Column(Integer, ForeignKey('tutors.id', ondelete='CASCADE'), nullable=False)
     title = Column(String(255), nullable=False)
     sequence_order = Column(Integer, nullable=False)
-    content = Column(Text, default='{}')
+    content = deferred(Column(CompressedText, default='{}'))
     module_type = Column(String(50))  # 'lesson', 'quiz', 'practice', 'assessment', 'other'
     prerequisites = Column(Text, default='{}')
     learning_objectives = Column(Text, default='{}')
@@ -206,6 +410,26 @@ class TutorModule(db.Model):
         """Set learning objectives from a Python dictionary."""
         self.learning_objectives = json.dumps(learning_objectives_dict)
     
+    def to_dict(self, include_content=False):
+        """Serialize the module, loading the deferred content only on request."""
+        data = {
+            'id': self.id,
+            'tutor_id': self.tutor_id,
+            'title': self.title,
+            'sequence_order': self.sequence_order,
+            'module_type': self.module_type,
+            'prerequisites': self.prerequisites_dict,
+            'learning_objectives': self.learning_objectives_dict
+        }
+        if include_content:
+            data['content'] = self.content_dict
+        return data
+    
+    @classmethod
+    def query_with_content(cls):
+        """Query modules with the deferred content column loaded up front."""
+        return cls.query.options(undefer(cls.content))
+    
     def get_next_module(self):
         """Get the next module in sequence."""
         return TutorModule.query.filter_by(
@@ -224,5 +448,72 @@ class TutorModule(db.Model):
         return f"<TutorModule {self.id}: {self.title} ({self.module_type})>"
 
 
+# Agent columns an unedited clone reads from its source (see Tutor.materialize)
+_SHARED_AGENT_COLUMNS = ('operator_bank', 'expert_model')
+
+
+def _materialize_dependent_clones(session, flush_context, instances):
+    """
+    Before a flush changes a tutor's modules or the agent columns clones share,
+    deletes its agent, or deletes the tutor, materialize the unedited clones that
+    still read those rows. Writes to the agent's learner sessions, which clones
+    do not share, leave them alone. Tutors whose head is a revision of a deleted
+    tutor get the content back as unsaved content, which is recorded as their
+    own revision.
+    """
+    from .agents import Agent
+    from .revision import TutorRevision
+    
+    deleted_tutors = {obj.id for obj in session.deleted if isinstance(obj, Tutor)}
+    sources = {
+        obj.tutor_id for obj in chain(session.new, session.dirty, session.deleted)
+        if isinstance(obj, TutorModule)
+    } | {
+        obj.tutor_id for obj in session.dirty
+        if isinstance(obj, Agent) and any(
+            inspect(obj).attrs[key].history.has_changes() for key in _SHARED_AGENT_COLUMNS
+        )
+    } | {obj.tutor_id for obj in session.deleted if isinstance(obj, Agent)} | deleted_tutors
+    sources.discard(None)
+    if not sources:
+        return
+    
+    with session.no_autoflush:
+        clones = session.query(Tutor).filter(
+            Tutor.cloned_from_id.in_(sources), Tutor.is_materialized == False  # noqa: E712
+        ).all()
+        for clone in clones:
+            if clone not in session.deleted:
+                clone.materialize()
+        
+        if deleted_tutors:
+            sharing = session.query(Tutor).join(TutorRevision, Tutor.revision_id == TutorRevision.id).filter(
+                TutorRevision.tutor_id.in_(deleted_tutors), ~Tutor.id.in_(deleted_tutors)
+            ).all()
+            for tutor in sharing:
+                tutor.content = tutor.head_revision.materialize()
+                tutor.head_revision = None
+
+
+def _record_content_revisions(session, flush_context, instances):
+    """
+    Before a flush writes tutor content, record it as the tutor's head revision,
+    so the revision is current however the content was written.
+    """
+    for tutor in list(chain(session.new, session.dirty)):
+        if not isinstance(tutor, Tutor) or tutor in session.deleted:
+            continue
+        if not inspect(tutor).attrs.content.history.has_changes() or not tutor.content:
+            continue
+        with session.no_autoflush:
+            # Writing content edits a clone
+            tutor.materialize()
+            tutor.record_revision()
+
+
+event.listen(Session, 'before_flush', _materialize_dependent_clones)
+# Registered second, so it also records content restored by the listener above
+event.listen(Session, 'before_flush', _record_content_revisions)
+
 # Register model listeners for SQLite compatibility
 register_sqlite_listeners([Tutor, TutorModule])
@@ -6,10 +6,10 @@ import json
 from sqlalchemy import Column, Integer, String, ForeignKey, DateTime, Text, Boolean
 from sqlalchemy.orm import relationship
 from datetime import datetime
-from werkzeug.security import generate_password_hash, check_password_hash
 from flask_login import UserMixin
 
 from database.db import db
+from database.passwords import password_hasher
 from database.sqlite_helpers import register_sqlite_listeners
 
 class User(db.Model, UserMixin):
@@ -48,11 +48,11 @@ class User(db.Model, UserMixin):
     @password.setter
     def password(self, password):
         """Set password hash."""
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = password_hasher.hash(password)
     
     def verify_password(self, password):
         """Check if password matches."""
-        return check_password_hash(self.password_hash, password)
+        return password_hasher.verify(self.password_hash, password)[0]
     
     def update_last_login(self):
         """Update last login timestamp."""
@@ -14,10 +14,22 @@ from .analytics import analytics_bp
 from .admin import admin_bp
 from .admin_logs import admin_logs_bp
 from .dashboard import dashboard_bp
+from .jobs import jobs_bp
+from .response_cache import response_cache
+from .view_cache import view_cache
+from .static_assets import static_assets
+from .fragment_cache import fragment_cache
+from database.identity_cache import identity_cache
 
 
 def register_blueprints(app):
     """Register all blueprints with the application"""
+    response_cache.max_entries = app.config.get('RESPONSE_CACHE_MAX_ENTRIES', response_cache.max_entries)
+    view_cache.max_entries = app.config.get('VIEW_CACHE_MAX_ENTRIES', view_cache.max_entries)
+    view_cache.compress_level = app.config.get('VIEW_CACHE_GZIP_LEVEL', view_cache.compress_level)
+    fragment_cache.init_app(app)
+    identity_cache.principal_ttl = app.config.get('PRINCIPAL_CACHE_TTL', identity_cache.principal_ttl)
+
     # App routes
     app.register_blueprint(main_bp, url_prefix='/')
     app.register_blueprint(auth_bp, url_prefix='/auth')
@@ -29,6 +41,7 @@ def register_blueprints(app):
     app.register_blueprint(admin_bp, url_prefix='/admin')
     app.register_blueprint(admin_logs_bp, url_prefix='/admin/logs')
     app.register_blueprint(dashboard_bp, url_prefix='/dashboard')
+    app.register_blueprint(jobs_bp, url_prefix='/jobs')
 
     # Serve files from templates directory as static files
     @app.route('/templates/<path:filename>')
@@ -39,14 +52,9 @@ def register_blueprints(app):
 
         return send_from_directory('templates', filename)
 
-    # Serve static javascript files
-    @app.route('/static/<path:filename>')
-    def javascript(filename):
-        resp, resp_code = _check_file_request_safe(filename)
-        if resp_code != 200:
-            return resp, resp_code
-
-        return send_from_directory('static', filename)
+    # Static files use Flask's built-in endpoint, served fingerprinted and
+    # precompressed once `run.py --build-assets` has produced a manifest
+    static_assets.init_app(app)
 
 
     def _check_file_request_safe(filename: str, valid_extensions: list = ('.html', '.js')) -> (str, int):
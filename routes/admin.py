@@ -1,10 +1,14 @@
-from flask import Blueprint, request, jsonify, render_template
+from flask import Blueprint, request, jsonify, render_template, Response, stream_with_context, current_app
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from models import User, Instructor, Learner, Tutor, Course
 from database.db import db
+from database.identity_cache import identity_cache, UNKNOWN_NAME
+from database.passwords import password_hasher
+from database.roster_import import RosterError, course_exists, detect_format, import_roster, read_roster
 from sqlalchemy import func
 import datetime
 from functools import wraps
+import json
 
 admin_bp = Blueprint('admin', __name__)
 
@@ -13,10 +17,10 @@ def admin_required(fn):
     @wraps(fn)
     @jwt_required()
     def wrapper(*args, **kwargs):
-        current_user_id = get_jwt_identity()
-        user = User.query.get(current_user_id)
+        # Served from the request/process principal cache; no query in the common case
+        principal = identity_cache.principal(get_jwt_identity())
         
-        if not user or user.role != 'admin':
+        if not principal or principal.role != 'admin':
             return jsonify({"error": "Admin privileges required"}), 403
         
         return fn(*args, **kwargs)
@@ -299,8 +303,6 @@ def reset_user_password(user_id):
     Function: Password Reset
     """
     try:
-        from werkzeug.security import generate_password_hash
-        
         user = User.query.get(user_id)
         
         if not user:
@@ -315,7 +317,7 @@ def reset_user_password(user_id):
         if len(data['new_password']) < 8:
             return jsonify({"error": "Password must be at least 8 characters"}), 400
         
-        user.password_hash = generate_password_hash(data['new_password'])
+        user.password_hash = password_hasher.hash(data['new_password'])
         db.session.commit()
         
         return jsonify({"message": "Password reset successfully"}), 200
@@ -324,6 +326,48 @@ def reset_user_password(user_id):
         db.session.rollback()
         return jsonify({"error": str(e)}), 500
 
+@admin_bp.route('/users/import', methods=['POST'])
+@admin_required
+def import_users():
+    """Bulk-create learner accounts from a CSV or JSONL roster (API)
+    
+    Function: Roster Import
+    
+    The roster is sent as a 'file' upload or as the raw request body. Query
+    parameters: format ('csv' or 'jsonl', guessed from the filename or content
+    type otherwise), course_id (enroll every imported learner) and chunk_size.
+    Progress is streamed back as newline-delimited JSON events, ending with a
+    'done' event, or an 'error' event if the import stops early.
+    """
+    upload = request.files.get('file')
+    source = upload.stream if upload else request.get_data()
+    fmt = request.args.get('format') or detect_format(
+        upload.filename if upload else None, upload.content_type if upload else request.content_type
+    )
+    course_id = request.args.get('course_id', type=int)
+    chunk_size = min(max(request.args.get('chunk_size', 500, type=int), 1), 5000)
+    
+    if course_id is not None and not course_exists(course_id):
+        return jsonify({"error": "Course not found"}), 404
+    try:
+        roster = read_roster(source, fmt)
+    except RosterError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    def generate():
+        processed = 0
+        try:
+            for event in import_roster(roster, course_id=course_id, chunk_size=chunk_size):
+                if event['event'] == 'progress':
+                    processed = event['processed']
+                yield json.dumps(event) + '\n'
+        except Exception as e:
+            # Chunks before the failing one stay committed; tell the client where the import stopped
+            current_app.logger.exception("Roster import failed after %d rows", processed)
+            yield json.dumps({"event": "error", "processed": processed, "error": str(e)}) + '\n'
+    
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
 # Content management endpoints
 
 @admin_bp.route('/tutors', methods=['GET'])
@@ -362,9 +406,11 @@ def get_all_tutors():
         # Paginate results
         pagination = query.order_by(Tutor.created_at.desc()).paginate(page=page, per_page=per_page)
         
+        instructor_names = identity_cache.instructor_names(tutor.instructor_id for tutor in pagination.items)
+        
         tutors_data = []
         for tutor in pagination.items:
-            instructor_name = f"{tutor.instructor.user.first_name} {tutor.instructor.user.last_name}" if tutor.instructor and tutor.instructor.user else "Unknown"
+            instructor_name = instructor_names.get(tutor.instructor_id, UNKNOWN_NAME)
             
             tutors_data.append({
                 "id": tutor.id,
@@ -377,7 +423,7 @@ def get_all_tutors():
                 "is_published": tutor.is_published,
                 "created_at": tutor.created_at.isoformat() if tutor.created_at else None,
                 "updated_at": tutor.updated_at.isoformat() if tutor.updated_at else None,
-                "modules_count": len(tutor.modules)
+                "modules_count": len(tutor.effective_modules)
             })
         
         return jsonify({
@@ -429,9 +475,11 @@ def get_all_courses():
         # Paginate results
         pagination = query.order_by(Course.created_at.desc()).paginate(page=page, per_page=per_page)
         
+        instructor_names = identity_cache.instructor_names(course.instructor_id for course in pagination.items)
+        
         courses_data = []
         for course in pagination.items:
-            instructor_name = f"{course.instructor.user.first_name} {course.instructor.user.last_name}" if course.instructor and course.instructor.user else "Unknown"
+            instructor_name = instructor_names.get(course.instructor_id, UNKNOWN_NAME)
             
             courses_data.append({
                 "id": course.id,
@@ -1,7 +1,10 @@
 from flask import Blueprint, request, jsonify, render_template
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from models import User, Admin, AdminLog
+from database.db import db
+from database.identity_cache import identity_cache, UNKNOWN_NAME
 from routes.admin import admin_required
+from routes.response_cache import cached_response
 
 admin_logs_bp = Blueprint('admin_logs', __name__)
 
@@ -38,14 +41,15 @@ def get_admin_logs():
         # Order and paginate
         pagination = query.order_by(AdminLog.timestamp.desc()).paginate(page=page, per_page=per_page)
         
+        # Resolve every admin on the page with one query instead of one per row
+        admin_names = identity_cache.admin_names(log.admin_id for log in pagination.items)
+        
         logs_data = []
         for log in pagination.items:
-            admin_name = f"{log.admin.user.full_name}" if log.admin and log.admin.user else "Unknown"
-            
             logs_data.append({
                 "id": log.id,
                 "admin_id": log.admin_id,
-                "admin_name": admin_name,
+                "admin_name": admin_names.get(log.admin_id, UNKNOWN_NAME),
                 "timestamp": log.timestamp.isoformat() if log.timestamp else None,
                 "action": log.action,
                 "target_type": log.target_type,
@@ -69,6 +73,7 @@ def get_admin_logs():
 
 @admin_logs_bp.route('/actions', methods=['GET'])
 @admin_required
+@cached_response(ttl=300, depends_on=('admin_logs',), vary_on_identity=False)
 def get_admin_actions():
     """Get distinct admin actions for filtering (API)
     
@@ -86,23 +91,24 @@ def get_admin_actions():
 
 @admin_logs_bp.route('/admins', methods=['GET'])
 @admin_required
+@cached_response(ttl=300, depends_on=('admins', 'users'), vary_on_identity=False)
 def get_admin_users():
     """Get all admin users for filtering (API)
     
     Function: Admin Users
     """
     try:
-        admins = Admin.query.all()
-        admin_data = []
-        
-        for admin in admins:
-            if admin.user:
-                admin_data.append({
-                    "id": admin.id,
-                    "name": admin.user.full_name,
-                    "email": admin.user.email,
-                    "level": admin.admin_level
-                })
+        admins = db.session.query(Admin.id, Admin.admin_level, User.first_name, User.last_name, User.email) \
+            .join(User, Admin.user_id == User.id).all()
+        admin_data = [
+            {
+                "id": admin_id,
+                "name": f"{first_name} {last_name}",
+                "email": email,
+                "level": admin_level
+            }
+            for admin_id, admin_level, first_name, last_name, email in admins
+        ]
         
         return jsonify({
             "admins": admin_data
@@ -146,15 +152,16 @@ def get_admin_log_stats():
             func.count(AdminLog.id).label('count')
         ).group_by(AdminLog.admin_id).order_by(desc('count')).limit(5).all()
         
-        active_admins_data = []
-        for admin_id, count in active_admins:
-            admin = Admin.query.get(admin_id)
-            if admin and admin.user:
-                active_admins_data.append({
-                    "admin_id": admin_id,
-                    "name": admin.user.full_name,
-                    "count": count
-                })
+        admin_names = identity_cache.admin_names(admin_id for admin_id, _ in active_admins)
+        active_admins_data = [
+            {
+                "admin_id": admin_id,
+                "name": admin_names[admin_id],
+                "count": count
+            }
+            for admin_id, count in active_admins
+            if admin_id in admin_names
+        ]
         
         return jsonify({
             "total_logs": total_logs,
@@ -1,19 +1,87 @@
-from flask import Blueprint, request, jsonify, render_template
+import math
+from flask import Blueprint, request, jsonify, render_template, current_app, Response
 from flask_jwt_extended import jwt_required, get_jwt_identity
+from datetime import datetime, timezone
+from database.activity_ingest import activity_ingestor, IngestError
+from database import analytics_engine
+from database.progress_rollups import learner_summary
+from database import report_export
+from database import metric_series
+from database import quantile_sketches
+from database.jobs import job_scheduler
+from database.identity_cache import identity_cache
+from models import LearnerTutor, Tutor, Course
+from database.db import db
+from routes.response_cache import cached_response
 
 analytics_bp = Blueprint('analytics', __name__)
 
+
+def current_learner_id():
+    """Learner profile id of the authenticated user, or None if they are not a learner"""
+    principal = identity_cache.principal(get_jwt_identity())
+    return principal.learner_id if principal else None
+
+
+def can_view_instructor_data(instructor_id):
+    """Analytics of an instructor's tutors and courses are visible to that instructor and to admins"""
+    principal = identity_cache.principal(get_jwt_identity())
+    return bool(principal) and (principal.role == 'admin' or principal.instructor_id == instructor_id)
+
+
+def can_view_learner_data(learner_id):
+    """A learner's progress is visible to the learner, to admins and to instructors whose tutors they use"""
+    principal = identity_cache.principal(get_jwt_identity())
+    if not principal:
+        return False
+    if principal.role == 'admin' or principal.learner_id == learner_id:
+        return True
+    return principal.instructor_id is not None and db.session.query(
+        LearnerTutor.query.join(Tutor, Tutor.id == LearnerTutor.tutor_id)
+        .filter(LearnerTutor.learner_id == learner_id, Tutor.instructor_id == principal.instructor_id)
+        .exists()
+    ).scalar()
+
+
+def check_report_access(scope, object_id):
+    """Error response if an instructor, course or tutor report is missing or not visible, else None"""
+    if scope == 'instructor':
+        owner_id = object_id
+    elif scope == 'course':
+        course = db.session.get(Course, object_id)
+        if not course:
+            return jsonify({"error": "Course not found"}), 404
+        owner_id = course.instructor_id
+    elif scope == 'tutor':
+        tutor = db.session.get(Tutor, object_id)
+        if not tutor:
+            return jsonify({"error": "Tutor not found"}), 404
+        owner_id = tutor.instructor_id
+    else:
+        return jsonify({"error": "Unknown report scope"}), 404
+    if not can_view_instructor_data(owner_id):
+        return jsonify({"error": "Access denied"}), 403
+    return None
+
+
+# Tables the computed analytics are read from; a write to any of them drops cached results
+ANALYTICS_TABLES = ('learner_tutors', 'learner_sessions', 'session_activities', 'performance_metrics',
+                    'course_tutors', 'course_learners', 'tutors')
+
 # API Endpoints
 
 @analytics_bp.route('/dashboard/instructor/<int:instructor_id>', methods=['GET'])
 @jwt_required()
+@cached_response(ttl=60, depends_on=ANALYTICS_TABLES)
 def get_instructor_dashboard(instructor_id):
     """Get analytics dashboard data for an instructor (API)
     
     Function: Instructor Dashboard Analytics
     """
-    # Logic would go here
-    return jsonify({"dashboard": {}}), 200
+    if not can_view_instructor_data(instructor_id):
+        return jsonify({"error": "Access denied"}), 403
+    
+    return jsonify({"dashboard": analytics_engine.instructor_overview(instructor_id)}), 200
 
 @analytics_bp.route('/dashboard/learner/<int:learner_id>', methods=['GET'])
 @jwt_required()
@@ -22,18 +90,28 @@ def get_learner_dashboard(learner_id):
     
     Function: Learner Dashboard Analytics
     """
-    # Logic would go here
-    return jsonify({"dashboard": {}}), 200
+    if not can_view_learner_data(learner_id):
+        return jsonify({"error": "Access denied"}), 403
+    
+    # Reads the rollups kept current by database/progress_rollups.py
+    summary = learner_summary(learner_id)
+    return jsonify({"dashboard": summary}), 200
 
 @analytics_bp.route('/tutors/<int:tutor_id>', methods=['GET'])
 @jwt_required()
+@cached_response(ttl=60, depends_on=ANALYTICS_TABLES)
 def get_tutor_analytics(tutor_id):
     """Get analytics for a specific tutor (API)
     
     Function: Tutor Analytics
     """
-    # Logic would go here
-    return jsonify({"analytics": {}}), 200
+    tutor = db.session.get(Tutor, tutor_id)
+    if not tutor:
+        return jsonify({"error": "Tutor not found"}), 404
+    if not can_view_instructor_data(tutor.instructor_id):
+        return jsonify({"error": "Access denied"}), 403
+    
+    return jsonify({"analytics": analytics_engine.tutor_analytics(tutor_id)}), 200
 
 @analytics_bp.route('/learners/<int:learner_id>', methods=['GET'])
 @jwt_required()
@@ -42,8 +120,11 @@ def get_learner_analytics(learner_id):
     
     Function: Learner Analytics
     """
-    # Logic would go here
-    return jsonify({"analytics": {}}), 200
+    if not can_view_learner_data(learner_id):
+        return jsonify({"error": "Access denied"}), 403
+    
+    summary = learner_summary(learner_id)
+    return jsonify({"analytics": summary}), 200
 
 @analytics_bp.route('/sessions/<int:session_id>', methods=['GET'])
 @jwt_required()
@@ -62,8 +143,48 @@ def record_session():
     
     Function: Session Recording
     """
-    # Logic would go here
-    return jsonify({"message": "Session recorded successfully", "session_id": 1}), 201
+    learner_id = current_learner_id()
+    if not learner_id:
+        return jsonify({"error": "Only learners can record sessions"}), 403
+    
+    data = request.get_json(silent=True) or {}
+    tutor_id = data.get('tutor_id')
+    if not isinstance(tutor_id, int) or not db.session.get(Tutor, tutor_id):
+        return jsonify({"error": "Tutor not found"}), 404
+    
+    learner_tutor = LearnerTutor.get_by_learner_and_tutor(learner_id, tutor_id)
+    if not learner_tutor:
+        learner_tutor = LearnerTutor(learner_id=learner_id, tutor_id=tutor_id)
+        db.session.add(learner_tutor)
+        db.session.flush()
+    session = learner_tutor.start_session()
+    
+    return jsonify({"message": "Session recorded successfully", "session_id": session.id}), 201
+
+@analytics_bp.route('/ingest', methods=['POST'])
+@jwt_required()
+def ingest_events():
+    """Record a batch of activity, progress, metric and session-end events (API)
+    
+    Function: Batched Event Ingestion
+    
+    The body is NDJSON or a JSON array of events (see database/activity_ingest.py).
+    Events already recorded under the same idempotency key are skipped, so a
+    failed batch can be retried as a whole.
+    """
+    learner_id = current_learner_id()
+    if not learner_id:
+        return jsonify({"error": "Only learners can record events"}), 403
+    
+    try:
+        result = activity_ingestor.ingest(learner_id, request.get_data())
+    except IngestError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        current_app.logger.error(f"Error ingesting analytics events: {str(e)}")
+        return jsonify({"error": "An error occurred while recording events"}), 500
+    
+    return jsonify(result), 200
 
 @analytics_bp.route('/activities', methods=['POST'])
 @jwt_required()
@@ -85,25 +206,156 @@ def record_performance_metric():
     # Logic would go here
     return jsonify({"message": "Performance metric recorded successfully", "metric_id": 1}), 201
 
+@analytics_bp.route('/metrics/<scope>/<int:owner_id>/<metric_name>/series', methods=['GET'])
+@jwt_required()
+@cached_response(ttl=60, depends_on=('metric_buckets',))
+def get_metric_series(scope, owner_id, metric_name):
+    """Get a downsampled series of a learner's or tutor's performance metric for charting (API)
+    
+    Function: Metric Series
+    
+    Query parameters: start and end (ISO 8601; default to the first recorded
+    value and now) and points (at most this many points, default 200). The
+    series uses the coarsest minute, hour or day buckets that give that many.
+    """
+    if scope == 'learner':
+        if not can_view_learner_data(owner_id):
+            return jsonify({"error": "Access denied"}), 403
+    elif scope == 'tutor':
+        tutor = db.session.get(Tutor, owner_id)
+        if not tutor:
+            return jsonify({"error": "Tutor not found"}), 404
+        if not can_view_instructor_data(tutor.instructor_id):
+            return jsonify({"error": "Access denied"}), 403
+    else:
+        return jsonify({"error": "Unknown metric scope"}), 404
+    
+    try:
+        start, end = (_parse_utc(request.args.get(name)) for name in ('start', 'end'))
+    except ValueError:
+        return jsonify({"error": "start and end must be ISO 8601 timestamps"}), 400
+    if start and end and start > end:
+        return jsonify({"error": "start must not be after end"}), 400
+    points = min(max(request.args.get('points', 200, type=int), 1), 1000)
+    
+    series = metric_series.metric_series(scope, owner_id, metric_name, start=start, end=end, max_points=points)
+    series.update({'scope': scope, 'owner_id': owner_id, 'metric_name': metric_name})
+    return jsonify({"series": series}), 200
+
+@analytics_bp.route('/cohorts/<scope>/<metric_name>/percentiles', methods=['GET'])
+@jwt_required()
+@cached_response(ttl=60, depends_on=('quantile_sketches', 'learner_progress', 'metric_buckets'))
+def get_cohort_percentiles(scope, metric_name):
+    """Get the distribution of a metric over a cohort of courses or tutors, and where a learner or value falls in it (API)
+    
+    Function: Cohort Comparison
+    
+    The metric is a performance metric name, or activity_score for activity
+    scores. Query parameters:
+    - ids: comma-separated course or tutor ids. The cohort is their union. Defaults to all of the caller's own.
+    - q: comma-separated fractions to report. Defaults to 0.1,0.25,0.5,0.75,0.9.
+    - learner_id: adds the learner's mean value on the cohort's tutors and its percentile in the cohort.
+    - value: adds the percentile of that value in the cohort.
+    - members=1: adds the distribution of each course or tutor, so each can be compared with the union.
+    Percentiles are estimated from precomputed sketches, to within about 1%.
+    A value counts towards every course that assigns its tutor and enrolls its
+    learner, so in a union of courses that share tutors and learners it is
+    counted once per such course. Tutor cohorts count every value once.
+    """
+    if scope not in quantile_sketches.SCOPES:
+        return jsonify({"error": "Unknown cohort scope"}), 404
+    try:
+        ids = [int(part) for part in request.args.get('ids', '').split(',') if part.strip()]
+        fractions = [float(part) for part in request.args.get('q', '').split(',') if part.strip()] \
+            or list(quantile_sketches.DEFAULT_FRACTIONS)
+        value = float(request.args['value']) if request.args.get('value') else None
+        learner_id = int(request.args['learner_id']) if request.args.get('learner_id') else None
+    except ValueError:
+        return jsonify({"error": "ids, q, value and learner_id must be numbers"}), 400
+    if value is not None and not math.isfinite(value):
+        return jsonify({"error": "value must be a finite number"}), 400
+    if not all(0 <= fraction <= 1 for fraction in fractions):
+        return jsonify({"error": "q fractions must be between 0 and 1"}), 400
+    
+    if not ids:
+        principal = identity_cache.principal(get_jwt_identity())
+        if not principal or principal.instructor_id is None:
+            return jsonify({"error": "ids is required"}), 400
+        model = Course if scope == 'course' else Tutor
+        ids = [row.id for row in model.query.with_entities(model.id).filter_by(instructor_id=principal.instructor_id)]
+    for object_id in ids:
+        denied = check_report_access(scope, object_id)
+        if denied:
+            return denied
+    
+    if learner_id is not None and not can_view_learner_data(learner_id):
+        return jsonify({"error": "Access denied"}), 403
+    
+    sketches = quantile_sketches.owner_sketches(scope, ids, metric_name)
+    cohort = quantile_sketches.KLLSketch()
+    for sketch in sketches.values():
+        cohort.merge(sketch)
+    result = {'scope': scope, 'ids': ids, 'metric_name': metric_name,
+              'cohort': quantile_sketches.describe(cohort, fractions)}
+    if request.args.get('members') in ('1', 'true'):
+        result['members'] = {
+            str(object_id): quantile_sketches.describe(sketches.get(object_id, quantile_sketches.KLLSketch()),
+                                                       fractions)
+            for object_id in ids
+        }
+    if learner_id is not None:
+        if scope == 'tutor':
+            tutor_ids = ids
+        else:
+            tutor_ids = {tutor_id for course_id in ids for tutor_id in analytics_engine.course_scope(course_id)[0]}
+        mean = quantile_sketches.learner_mean(learner_id, metric_name, tutor_ids)
+        result['learner'] = {'learner_id': learner_id, 'mean': mean,
+                             'percentile': _percentile(cohort, mean)}
+    if value is not None:
+        result['value'] = {'value': value, 'percentile': _percentile(cohort, value)}
+    return jsonify({"percentiles": result}), 200
+
+def _percentile(sketch, value):
+    rank = sketch.rank(value) if value is not None else None
+    return round(rank * 100, 1) if rank is not None else None
+
+def _parse_utc(value):
+    # Naive UTC, as the metric timestamps are stored
+    if not value:
+        return None
+    parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    return parsed.astimezone(timezone.utc).replace(tzinfo=None) if parsed.tzinfo else parsed
+
 @analytics_bp.route('/courses/<int:course_id>/performance', methods=['GET'])
 @jwt_required()
+@cached_response(ttl=60, depends_on=ANALYTICS_TABLES)
 def get_course_performance(course_id):
     """Get performance metrics for an entire course (API)
     
     Function: Course Performance
     """
-    # Logic would go here
-    return jsonify({"performance": {}}), 200
+    course = db.session.get(Course, course_id)
+    if not course:
+        return jsonify({"error": "Course not found"}), 404
+    if not can_view_instructor_data(course.instructor_id):
+        return jsonify({"error": "Access denied"}), 403
+    
+    return jsonify({"performance": analytics_engine.course_performance(course_id)}), 200
 
 @analytics_bp.route('/reports/instructor/<int:instructor_id>', methods=['GET'])
 @jwt_required()
+@cached_response(ttl=60, depends_on=ANALYTICS_TABLES)
 def generate_instructor_report(instructor_id):
     """Generate a comprehensive report for an instructor (API)
     
     Function: Instructor Reporting
     """
-    # Logic would go here
-    return jsonify({"report": {}}), 200
+    if not can_view_instructor_data(instructor_id):
+        return jsonify({"error": "Access denied"}), 403
+    
+    report = analytics_engine.instructor_overview(instructor_id)
+    report.update({'instructor_id': instructor_id, 'generated_at': datetime.utcnow().isoformat()})
+    return jsonify({"report": report}), 200
 
 @analytics_bp.route('/reports/learner/<int:learner_id>', methods=['GET'])
 @jwt_required()
@@ -112,28 +364,123 @@ def generate_learner_report(learner_id):
     
     Function: Learner Reporting
     """
-    # Logic would go here
-    return jsonify({"report": {}}), 200
+    if not can_view_learner_data(learner_id):
+        return jsonify({"error": "Access denied"}), 403
+    
+    summary = learner_summary(learner_id)
+    summary.update({'learner_id': learner_id, 'generated_at': datetime.utcnow().isoformat()})
+    return jsonify({"report": summary}), 200
 
 @analytics_bp.route('/reports/course/<int:course_id>', methods=['GET'])
 @jwt_required()
+@cached_response(ttl=60, depends_on=ANALYTICS_TABLES)
 def generate_course_report(course_id):
     """Generate a comprehensive report for a course (API)
     
     Function: Course Reporting
     """
-    # Logic would go here
-    return jsonify({"report": {}}), 200
+    course = db.session.get(Course, course_id)
+    if not course:
+        return jsonify({"error": "Course not found"}), 404
+    if not can_view_instructor_data(course.instructor_id):
+        return jsonify({"error": "Access denied"}), 403
+    
+    report = analytics_engine.course_performance(course_id)
+    report.update({'course_id': course.id, 'title': course.title, 'course_code': course.course_code,
+                   'generated_at': datetime.utcnow().isoformat()})
+    return jsonify({"report": report}), 200
 
 @analytics_bp.route('/reports/tutor/<int:tutor_id>', methods=['GET'])
 @jwt_required()
+@cached_response(ttl=60, depends_on=ANALYTICS_TABLES)
 def generate_tutor_report(tutor_id):
     """Generate a comprehensive report for a tutor (API)
     
     Function: Tutor Reporting
     """
-    # Logic would go here
-    return jsonify({"report": {}}), 200
+    tutor = db.session.get(Tutor, tutor_id)
+    if not tutor:
+        return jsonify({"error": "Tutor not found"}), 404
+    if not can_view_instructor_data(tutor.instructor_id):
+        return jsonify({"error": "Access denied"}), 403
+    
+    report = analytics_engine.tutor_analytics(tutor_id)
+    report.update({'tutor_id': tutor.id, 'title': tutor.title, 'generated_at': datetime.utcnow().isoformat()})
+    return jsonify({"report": report}), 200
+
+@analytics_bp.route('/reports/<scope>/<int:object_id>/export', methods=['GET'])
+@jwt_required()
+def export_report(scope, object_id):
+    """Stream the activities or sessions behind an instructor, course or tutor report (API)
+    
+    Function: Report Export
+    
+    Query parameters: format ('csv' or 'ndjson'), dataset ('activities' or
+    'sessions') and after (resume after the row with this id; rows are ordered
+    by id, which is always the first column).
+    """
+    fmt = request.args.get('format', 'csv')
+    dataset = request.args.get('dataset', 'activities')
+    after = request.args.get('after', 0, type=int)
+    if fmt not in report_export.EXPORT_FORMATS or dataset not in report_export.EXPORT_DATASETS:
+        return jsonify({"error": "Unsupported format or dataset"}), 400
+    
+    error = check_report_access(scope, object_id)
+    if error:
+        return error
+    
+    learner_ids = None
+    if scope == 'instructor':
+        tutor_ids = analytics_engine.instructor_tutor_ids(object_id)
+    elif scope == 'course':
+        tutor_ids, learner_ids = analytics_engine.course_scope(object_id)
+    else:
+        tutor_ids = [object_id]
+    
+    columns, chunks = report_export.export_rows(tutor_ids, learner_ids, dataset=dataset, after=after,
+                                                chunk_size=current_app.config.get('EXPORT_CHUNK_SIZE', 1000))
+    filename = f"{scope}-{object_id}-{dataset}{'-after-%d' % after if after else ''}.{fmt}"
+    return Response(report_export.encode(fmt, columns, chunks), mimetype=report_export.EXPORT_FORMATS[fmt],
+                    headers={'Content-Disposition': f'attachment; filename="{filename}"',
+                             'X-Accel-Buffering': 'no'})
+
+@analytics_bp.route('/reports/<scope>/<int:object_id>/jobs', methods=['POST'])
+@jwt_required()
+def queue_report(scope, object_id):
+    """Build an instructor, course or tutor report in the background (API)
+    
+    Function: Background Reporting
+    
+    Returns the job; poll GET /jobs/<id> or join its Socket.IO room with the
+    `watch_job` event for progress. The report is the job's result. While a
+    report is queued or running, asking for it again returns the same job.
+    """
+    error = check_report_access(scope, object_id)
+    if error:
+        return error
+    
+    job_id, created = job_scheduler.enqueue('analytics.report', {'scope': scope, 'object_id': object_id},
+                                            key=f"report:{scope}:{object_id}", user_id=int(get_jwt_identity()))
+    return jsonify({"job": job_scheduler.get(job_id), "created": created}), 202
+
+@analytics_bp.route('/tutors/<int:tutor_id>/mastery/jobs', methods=['POST'])
+@jwt_required()
+def queue_mastery_refit(tutor_id):
+    """Refit the skill mastery model of a tutor in the background (API)
+    
+    Function: Knowledge Tracing Refit
+    
+    Fits each skill's knowledge tracing parameters to every learner's attempts
+    and recomputes their mastery. Returns the job, as for background reports.
+    Every tutor with new attempts is also refit daily.
+    """
+    error = check_report_access('tutor', tutor_id)
+    if error:
+        return error
+    
+    job_id, created = job_scheduler.enqueue('knowledge_tracing.refit', {'tutor_id': tutor_id},
+                                            key=f"knowledge_tracing.refit:{tutor_id}", user_id=int(get_jwt_identity()))
+    return jsonify({"job": job_scheduler.get(job_id), "created": created}), 202
 
 # Web UI Endpoints
 
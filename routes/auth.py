@@ -4,16 +4,15 @@ from flask_jwt_extended import (
     jwt_required, get_jwt_identity, get_jwt,
     set_access_cookies, set_refresh_cookies, unset_jwt_cookies
 )
-from werkzeug.security import generate_password_hash, check_password_hash
 from datetime import datetime, timezone, timedelta
 import uuid
 from database.db import db
+from database.token_revocation import revocation_store
+from database.identity_cache import identity_cache
+from database.passwords import password_hasher, PasswordHasherBusy
 from models import User, Instructor, Learner
 import re
 
-# Create a token blocklist
-jwt_blocklist = set()
-
 auth_bp = Blueprint('auth', __name__)
 
 
@@ -119,7 +118,7 @@ def register():
         # Create user
         new_user = User(
             email=data['email'].lower(),
-            password_hash=generate_password_hash(data['password']),
+            password_hash=password_hasher.hash(data['password']),
             first_name=data['first_name'],
             last_name=data['last_name'],
             role=data['role'],
@@ -160,6 +159,10 @@ def register():
             "refresh_token": refresh_token
         }), 201
 
+    except PasswordHasherBusy:
+        db.session.rollback()
+        return jsonify({"error": "Server is busy, please retry"}), 503, {"Retry-After": "1"}
+
     except Exception as e:
         db.session.rollback()
         current_app.logger.error(f"Error in user registration: {str(e)}")
@@ -186,15 +189,18 @@ def login():
         user = User.query.filter_by(email=data['email'].lower()).first()
 
         # Check if user exists and password is correct
-        if not user or not check_password_hash(user.password_hash, data['password']):
+        password_ok, upgraded_hash = password_hasher.verify(user.password_hash, data['password']) if user else (False, None)
+        if not password_ok:
             return jsonify({"error": "Invalid email or password"}), 401
 
         # Check if user is active
         if not user.is_active:
             return jsonify({"error": "Account is inactive"}), 403
 
-        # Update last login time
+        # Update last login time, and the hash if the hashing parameters have changed
         user.last_login = datetime.now(timezone.utc)
+        if upgraded_hash:
+            user.password_hash = upgraded_hash
         db.session.commit()
 
         # Create tokens
@@ -215,6 +221,9 @@ def login():
 
         return response, 200
 
+    except PasswordHasherBusy:
+        return jsonify({"error": "Server is busy, please retry"}), 503, {"Retry-After": "1"}
+
     except Exception as e:
         current_app.logger.error(f"Error in user login: {str(e)}")
         return jsonify({"error": "An error occurred during login"}), 500
@@ -229,9 +238,9 @@ def refresh():
     """
     try:
         current_user_id = get_jwt_identity()
-        user = User.query.get(current_user_id)
+        principal = identity_cache.principal(current_user_id)
 
-        if not user or not user.is_active:
+        if not principal or not principal.is_active:
             return jsonify({"error": "Invalid user or inactive account"}), 401
 
         access_token = create_access_token(identity=current_user_id)
@@ -260,8 +269,9 @@ def logout():
     Function: User Logout
     """
     try:
-        jti = get_jwt()["jti"]
-        jwt_blocklist.add(jti)
+        token = get_jwt()
+        revocation_store.revoke(token["jti"], token["exp"], token_type=token.get("type", "access"),
+                                user_id=get_jwt_identity())
 
         response = jsonify({"message": "Successfully logged out"})
 
@@ -284,13 +294,12 @@ def get_user_info():
     Function: User Information
     """
     try:
-        current_user_id = get_jwt_identity()
-        user = User.query.get(current_user_id)
+        principal = identity_cache.principal(get_jwt_identity())
 
-        if not user:
+        if not principal:
             return jsonify({"error": "User not found"}), 404
 
-        return jsonify({"user": get_user_data(user)}), 200
+        return jsonify({"user": principal.to_dict()}), 200
 
     except Exception as e:
         current_app.logger.error(f"Error retrieving user info: {str(e)}")
@@ -0,0 +1,117 @@
+"""
+Fragment caching for Jinja templates.
+
+Wrap an expensive, mostly static part of a template in a `cache` block:
+
+    {% cache "component-sidebar" %} ... {% endcache %}
+    {% cache "tutor-card", tutor.id, tutor.updated_at %} ... {% endcache %}
+
+The first argument names the fragment and any further arguments complete its
+key, so a fragment that varies must list what it varies on. Rendered output is
+kept in a bounded in-process LRU for FRAGMENT_CACHE_TTL seconds; call
+`fragment_cache.invalidate(name, *parts)` after a change that affects a
+fragment to drop it (and every entry whose key starts with those parts) early.
+
+`init_app` also turns on Jinja's bytecode cache, so compiled templates are
+reused across processes and restarts instead of being recompiled per worker.
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from jinja2 import FileSystemBytecodeCache, nodes
+from jinja2.ext import Extension
+
+
+class FragmentCache:
+    """Bounded LRU of rendered template fragments with a per-entry TTL."""
+
+    def __init__(self, max_entries=512, ttl=300):
+        self.enabled = True
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()  # key tuple -> (expires_at, markup)
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        """Read FRAGMENT_CACHE_* settings and configure the app's Jinja environment."""
+        self.enabled = app.config.get('FRAGMENT_CACHE_ENABLED', self.enabled)
+        self.max_entries = app.config.get('FRAGMENT_CACHE_MAX_ENTRIES', self.max_entries)
+        self.ttl = app.config.get('FRAGMENT_CACHE_TTL', self.ttl)
+
+        app.jinja_env.add_extension(FragmentCacheExtension)
+        bytecode_dir = app.config.get('JINJA_BYTECODE_CACHE_DIR')
+        if bytecode_dir:
+            if not os.path.isabs(bytecode_dir):
+                bytecode_dir = os.path.join(app.root_path, bytecode_dir)
+            os.makedirs(bytecode_dir, exist_ok=True)
+            app.jinja_env.bytecode_cache = FileSystemBytecodeCache(bytecode_dir)
+
+    def get(self, key):
+        with self._lock:
+            item = self._entries.get(key)
+            if item is None:
+                return None
+            expires_at, value = item
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, name, *parts):
+        """Drop the fragments whose key starts with the given name and parts."""
+        prefix = _make_key((name,) + parts)
+        with self._lock:
+            for key in [key for key in self._entries if key[:len(prefix)] == prefix]:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+fragment_cache = FragmentCache()
+
+
+def _make_key(parts):
+    # Keep hashable scalars as they are; anything else is keyed by its repr
+    return tuple(
+        part if isinstance(part, (str, int, float, bool, type(None))) else repr(part)
+        for part in parts
+    )
+
+
+class FragmentCacheExtension(Extension):
+    """Adds the `{% cache name[, part...] %}...{% endcache %}` tag."""
+
+    tags = {'cache'}
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        parts = [parser.parse_expression()]
+        while parser.stream.skip_if('comma'):
+            parts.append(parser.parse_expression())
+        body = parser.parse_statements(('name:endcache',), drop_needle=True)
+        return nodes.CallBlock(
+            self.call_method('_render_cached', [nodes.List(parts)]), [], [], body
+        ).set_lineno(lineno)
+
+    def _render_cached(self, parts, caller):
+        if not fragment_cache.enabled:
+            return caller()
+        key = _make_key(parts)
+        value = fragment_cache.get(key)
+        if value is None:
+            value = caller()
+            fragment_cache.set(key, value)
+        return value
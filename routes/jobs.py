@@ -0,0 +1,29 @@
+from flask import Blueprint, jsonify
+from flask_jwt_extended import jwt_required, get_jwt_identity
+from database.db import db
+from database.identity_cache import identity_cache
+from models import Job
+
+jobs_bp = Blueprint('jobs', __name__)
+
+
+def can_view_job(job):
+    """A job is visible to the user who queued it and to admins"""
+    principal = identity_cache.principal(get_jwt_identity())
+    return bool(principal) and (principal.role == 'admin' or principal.id == job.user_id)
+
+
+@jobs_bp.route('/<int:job_id>', methods=['GET'])
+@jwt_required()
+def get_job(job_id):
+    """Get a background job's status, progress and, once it has succeeded, its result (API)
+    
+    Function: Job Status
+    """
+    job = db.session.get(Job, job_id)
+    if not job:
+        return jsonify({"error": "Job not found"}), 404
+    if not can_view_job(job):
+        return jsonify({"error": "Access denied"}), 403
+    
+    return jsonify({"job": job.to_dict()}), 200
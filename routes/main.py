@@ -1,8 +1,11 @@
 # routes/main.py
-from flask import Blueprint, render_template, redirect, url_for, flash, request
+from flask import Blueprint, render_template, redirect, url_for, flash, request, current_app
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from models import Tutor
 from models import User
+from database.db import db
+from routes.view_cache import view_cache, build_view_response
+from routes.response_cache import cached_response
 from flask import session as flask_session
 import uuid
 import json
@@ -105,43 +108,50 @@ def tutor_view(tutor_id):
         return redirect(url_for('auth.login_page'))
 
     # --- Fetch tutor record from the database ---
-    tutor = Tutor.query.filter_by(id=tutor_id).first()
+    # The content column stays deferred; it is only loaded when the page has to be rendered
+    tutor = db.session.get(Tutor, tutor_id)
     if not tutor:
         flash("Tutor not found.", "error")
         return redirect(url_for('main.dashboard'))
 
-    print(tutor)
-    print(tutor.content)
-    print(tutor.id)
-    raw = tutor.content or "{}"
+    # Get parameters
+    is_preview = str_to_bool(request.args.get('preview'))
+
+    # The rendered page only varies with the content revision, the viewer's role and
+    # preview mode; learner-specific state is loaded client-side
+    cache_enabled = current_app.config.get('VIEW_CACHE_ENABLED', True)
+    cache_key = (tutor.id, tutor.revision_id or tutor.updated_at, user.role, is_preview)
+    entry = view_cache.get(cache_key) if cache_enabled else None
+    if entry is not None:
+        current_app.logger.debug("Tutor view %s served from cache (revision %s)", tutor.id, tutor.revision_id)
+        return build_view_response(entry)
+
+    current_app.logger.debug("Rendering tutor view %s (revision %s, role %s)", tutor.id, tutor.revision_id, user.role)
+    raw = tutor.resolved_content or "{}"
     try:
         payload = json.loads(raw) if isinstance(raw, str) else raw
         # If your content is exactly {"html": "..."} this will extract the HTML
         tutor_html = payload.get("html", raw if isinstance(raw, str) else "")
     except Exception:
         # fallback: if somehow content is already raw HTML
+        current_app.logger.warning("Tutor %s content is not JSON; rendering it as raw HTML", tutor.id)
         tutor_html = raw
 
-    # Parse tutor content
-    #tutor_html = tutor.content
-
-    # Get parameters
-    user_id = request.args.get('user_id', type=int, default=user.id)
-    is_preview = str_to_bool(request.args.get('preview'))
-
     sidebar_html = None
     # Render sidebar conditionally
     if user.role == 'instructor':
         sidebar_html = render_template('instructor/left-sidebars/sidebar-instructor.html')
 
-    return render_template(
+    html = render_template(
         'learner/main-content/tutor-view.html',
         tutor_titles=["Tutor Title1", "Tutor Title2", "Tutor Title3"],
         sidebarHtml=sidebar_html,
         tutorHtml=tutor_html,
-        userId=user_id,
         isPreview=is_preview
     )
+    if not cache_enabled:
+        return html
+    return build_view_response(view_cache.store(cache_key, html))
 
 
 
@@ -177,6 +187,7 @@ def instructor_manage_learners():
 
 @main_bp.route('/get-component-sidebar')
 #@jwt_required()
+@cached_response(ttl=3600, vary_on_identity=False)
 def instructor_component_sidebar():
     """Serves the component-sidebar HTML partial."""
     return render_template('instructor/right-sidebars/builder/component-sidebar.html')
@@ -184,6 +195,7 @@ def instructor_component_sidebar():
 
 @main_bp.route('/get-expert-model-sidebar')
 #@jwt_required()
+@cached_response(ttl=3600, vary_on_identity=False)
 def instructor_expert_model_sidebar():
     """Serves the expert-model-sidebar HTML partial."""
     return render_template('instructor/right-sidebars/builder/expert-model-sidebar.html')
@@ -0,0 +1,174 @@
+"""
+In-process response cache for read-only JSON endpoints.
+
+Decorate a view with `cached_response` to keep its rendered body in memory for
+a per-route TTL. Cache keys are derived from the endpoint, view arguments,
+query string and (optionally) the JWT identity. Every cached response carries
+an ETag, so clients that send If-None-Match get a 304 without a body.
+
+Entries are dropped as soon as a committed write touches one of the tables the
+route depends on (see `database.sqlite_helpers.subscribe_model_writes`). The
+cache is per process; other workers only see those writes once their TTL runs
+out.
+"""
+
+import hashlib
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from functools import wraps
+
+from flask import current_app, make_response, request
+
+from database.sqlite_helpers import subscribe_model_writes
+
+
+class _CacheEntry:
+    __slots__ = ('body', 'mimetype', 'etag', 'expires_at', 'tables')
+
+    def __init__(self, body, mimetype, etag, expires_at, tables):
+        self.body = body
+        self.mimetype = mimetype
+        self.etag = etag
+        self.expires_at = expires_at
+        self.tables = tables
+
+
+class ResponseCache:
+    """LRU map of cache keys to rendered responses, indexed by the tables they depend on."""
+
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._keys_by_table = defaultdict(set)
+        self._generations = defaultdict(int)
+        self._lock = threading.RLock()
+
+    def generation(self, tables):
+        """Snapshot the write generation of the given tables."""
+        with self._lock:
+            return tuple(self._generations[table] for table in tables)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry.expires_at <= time.monotonic():
+                self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def store(self, key, response, ttl, tables, generation):
+        """
+        Cache a rendered 200 response. Nothing is stored if one of the tables was
+        written while the response was being computed.
+        """
+        body = response.get_data()
+        entry = _CacheEntry(
+            body=body,
+            mimetype=response.mimetype,
+            etag=hashlib.sha1(body).hexdigest(),
+            expires_at=time.monotonic() + ttl,
+            tables=tuple(tables)
+        )
+        with self._lock:
+            if self.generation(tables) != generation:
+                return entry
+            self._remove(key)
+            self._entries[key] = entry
+            for table in entry.tables:
+                self._keys_by_table[table].add(key)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+        return entry
+
+    def invalidate_table(self, table_name):
+        """Drop every entry that depends on a table."""
+        with self._lock:
+            self._generations[table_name] += 1
+            for key in list(self._keys_by_table.pop(table_name, ())):
+                self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            for table_name in list(self._keys_by_table):
+                self._generations[table_name] += 1
+            self._entries.clear()
+            self._keys_by_table.clear()
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        for table in entry.tables:
+            keys = self._keys_by_table.get(table)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._keys_by_table[table]
+
+
+response_cache = ResponseCache()
+
+
+@subscribe_model_writes
+def _invalidate_on_write(table_name, row_id):
+    response_cache.invalidate_table(table_name)
+
+
+def _current_identity():
+    """Return the JWT identity of the request, or None if no token was verified."""
+    try:
+        from flask_jwt_extended import get_jwt_identity
+        return get_jwt_identity()
+    except Exception:
+        return None
+
+
+def _cache_key(view_kwargs, vary_on_identity):
+    return (
+        request.endpoint,
+        tuple(sorted(view_kwargs.items())),
+        tuple(sorted(request.args.items(multi=True))),
+        _current_identity() if vary_on_identity else None
+    )
+
+
+def _build_response(entry):
+    response = current_app.response_class(entry.body, status=200, mimetype=entry.mimetype)
+    response.set_etag(entry.etag)
+    # Let clients keep the body but revalidate it, which costs a 304 at most
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response.make_conditional(request)
+
+
+def cached_response(ttl=60, depends_on=(), vary_on_identity=True):
+    """
+    Cache a GET view's response in memory.
+
+    @param ttl (int): Seconds an entry stays valid.
+    @param depends_on (tuple): Table names whose committed writes invalidate the entry.
+    @param vary_on_identity (bool): Whether the JWT identity is part of the cache key.
+
+    Apply it below authorization decorators so access checks still run on cache hits.
+    """
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            if request.method not in ('GET', 'HEAD') or not current_app.config.get('RESPONSE_CACHE_ENABLED', True):
+                return fn(*args, **kwargs)
+
+            key = _cache_key(kwargs, vary_on_identity)
+            entry = response_cache.get(key)
+            if entry is None:
+                generation = response_cache.generation(depends_on)
+                response = make_response(fn(*args, **kwargs))
+                if response.status_code != 200 or response.direct_passthrough:
+                    return response
+                entry = response_cache.store(key, response, ttl, depends_on, generation)
+
+            return _build_response(entry)
+        return wrapper
+    return decorator
@@ -0,0 +1,154 @@
+"""
+Fingerprinted, precompressed static assets.
+
+`build_assets` (run.py --build-assets) copies every stylesheet and script under
+`static/` into `static/dist/` with a content hash in its filename, writes
+gzip (and, when the `brotli` package is installed, brotli) variants next to
+it, and records the mapping in `static/dist/manifest.json`.
+
+At startup `static_assets.init_app` loads that manifest into memory. From then
+on `url_for('static', filename=...)` points at the fingerprinted copy, which is
+served with the best precompressed variant the client accepts and an immutable
+one-year cache lifetime. A changed file gets a new name, so browsers never
+revalidate assets they already have. Files missing from the manifest (or every
+file, when no build has been run) are served as before.
+"""
+
+import gzip
+import hashlib
+import json
+import logging
+import os
+import shutil
+
+from flask import request, send_from_directory
+
+try:
+    import brotli
+except ImportError:  # optional dependency
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_NAME = 'manifest.json'
+FINGERPRINT_EXTENSIONS = ('.js', '.css')
+# Content-Encoding -> file suffix, in order of preference
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+MIMETYPES = {'.js': 'text/javascript', '.css': 'text/css'}
+
+
+def build_assets(static_folder, output_dir='dist', compress_level=9):
+    """
+    Fingerprint and precompress the assets under a static folder.
+
+    @param static_folder (str): The app's static folder.
+    @param output_dir (str): Subdirectory of the static folder to write to; it is rebuilt from scratch.
+    @param compress_level (int): gzip level; brotli always uses its maximum quality.
+    @return (dict): The manifest that was written.
+    """
+    dist = os.path.join(static_folder, output_dir)
+    if os.path.isdir(dist):
+        shutil.rmtree(dist)
+
+    files = {}
+    for root, dirs, names in os.walk(static_folder):
+        if os.path.abspath(root) == os.path.abspath(static_folder) and output_dir in dirs:
+            dirs.remove(output_dir)
+        for name in sorted(names):
+            stem, ext = os.path.splitext(name)
+            if ext not in FINGERPRINT_EXTENSIONS:
+                continue
+            source = os.path.join(root, name)
+            logical = os.path.relpath(source, static_folder).replace(os.sep, '/')
+            with open(source, 'rb') as f:
+                data = f.read()
+
+            digest = hashlib.sha256(data).hexdigest()[:12]
+            fingerprinted = f"{os.path.dirname(logical) + '/' if os.path.dirname(logical) else ''}{stem}.{digest}{ext}"
+            target = os.path.join(dist, fingerprinted)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            with open(target, 'wb') as f:
+                f.write(data)
+
+            encodings = []
+            # mtime=0 keeps rebuilds byte-identical
+            variants = [('gzip', '.gz', gzip.compress(data, compresslevel=compress_level, mtime=0))]
+            if brotli is not None:
+                variants.insert(0, ('br', '.br', brotli.compress(data, quality=11)))
+            for encoding, suffix, payload in variants:
+                if len(payload) < len(data):
+                    with open(target + suffix, 'wb') as f:
+                        f.write(payload)
+                    encodings.append(encoding)
+
+            files[logical] = {'path': fingerprinted, 'encodings': encodings, 'size': len(data)}
+
+    manifest = {'files': files}
+    os.makedirs(dist, exist_ok=True)
+    with open(os.path.join(dist, MANIFEST_NAME), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    logger.info("Built %d fingerprinted assets in %s", len(files), dist)
+    return manifest
+
+
+class StaticAssets:
+    """Serves fingerprinted assets from an in-memory manifest."""
+
+    def __init__(self):
+        self.output_dir = 'dist'
+        self.max_age = 31536000
+        self.files = {}     # logical filename -> manifest entry
+        self.served = {}    # fingerprinted filename -> manifest entry
+        self.app = None
+
+    def init_app(self, app):
+        """Load the manifest and take over the app's static endpoint."""
+        self.app = app
+        self.output_dir = app.config.get('STATIC_ASSETS_DIR', self.output_dir)
+        self.max_age = app.config.get('STATIC_ASSETS_MAX_AGE', self.max_age)
+        app.extensions['static_assets'] = self
+        if not app.config.get('STATIC_ASSETS_ENABLED', True) or not app.static_folder:
+            return
+
+        manifest_path = os.path.join(app.static_folder, self.output_dir, MANIFEST_NAME)
+        if not os.path.exists(manifest_path):
+            logger.info("No asset manifest at %s; serving static files unfingerprinted", manifest_path)
+            return
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            self.files = json.load(f).get('files', {})
+        self.served = {f"{self.output_dir}/{entry['path']}": entry for entry in self.files.values()}
+
+        app.url_defaults(self._fingerprint_url)
+        app.view_functions['static'] = self.send_static_file
+
+    def _fingerprint_url(self, endpoint, values):
+        if endpoint != 'static':
+            return
+        entry = self.files.get(values.get('filename'))
+        if entry is not None:
+            values['filename'] = f"{self.output_dir}/{entry['path']}"
+
+    def send_static_file(self, filename):
+        """Serve a static file, using the precompressed immutable copy when there is one."""
+        entry = self.served.get(filename)
+        if entry is None:
+            return self.app.send_static_file(filename)
+
+        mimetype = MIMETYPES.get(os.path.splitext(filename)[1])
+        encoding = next(
+            (encoding for encoding, suffix in ENCODINGS
+             if encoding in entry['encodings'] and encoding in request.accept_encodings),
+            None
+        )
+        path = filename + dict(ENCODINGS)[encoding] if encoding else filename
+        response = send_from_directory(self.app.static_folder, path, mimetype=mimetype, max_age=self.max_age)
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+        response.vary.add('Accept-Encoding')
+        # The name changes with the content, so browsers never need to revalidate
+        response.cache_control.public = True
+        response.cache_control.immutable = True
+        return response
+
+
+static_assets = StaticAssets()
@@ -1,8 +1,9 @@
 from flask import Blueprint, request, jsonify, render_template
 from flask_jwt_extended import jwt_required, get_jwt_identity
-from models import Tutor, TutorModule
+from models import Tutor, TutorModule, TutorRevision
 from database.db import db
 from database.client import SQLiteDatabaseClient
+from routes.response_cache import cached_response
 import json
 from datetime import datetime
 
@@ -40,6 +41,7 @@ def create_tutor():
 
     # NOTE on IDs: The Tutor model uses an auto-incrementing Integer for the 'id'.
     # A UUID is not used as it is incompatible with the current database schema.
+    # The content is recorded as the tutor's first revision when it is committed
     tutor = db_client.create('Tutor', data)
     return jsonify({"message": "Tutor created successfully", "tutor": tutor.to_dict()}), 201
 
@@ -51,14 +53,16 @@ def get_tutors():
     """
     data = request.get_json()
     tutors = db_client.read_all('Tutor', filters=data)
-    return jsonify({"tutors": tutors.to_list(include_details=True)}), 200
+    # Listings leave the deferred content column unloaded
+    return jsonify({"tutors": [tutor.to_dict() for tutor in tutors]}), 200
 
 
 @tutor_bp.route('/find/<int:tutor_id>', methods=['GET'])
 #@jwt_required()
+@cached_response(ttl=300, depends_on=('tutors', 'tutor_modules'), vary_on_identity=False)
 def get_tutor(tutor_id):
     """Get a specific tutor's details (API)"""
-    tutor = db_client.read_by_id('Tutor', tutor_id)
+    tutor = Tutor.get_tutor_with_content(tutor_id)
     if not tutor:
         return jsonify({"error": "Tutor not found"}), 404
     return jsonify({"tutor": tutor.to_dict(include_details=True)}), 200
@@ -107,13 +111,20 @@ def update_tutor(tutor_id):
         # --- UPDATE THE EXISTING TUTOR ---
         # This block executes if a valid, existing tutor_id was provided.
         data['updated_at'] = datetime.utcnow()
+        # Clone bookkeeping is managed by the model, not the client
+        for key in ('cloned_from_id', 'is_materialized', 'revision_id'):
+            data.pop(key, None)
+        # The first edit of a clone gives it its own content, modules and agent
+        existing_tutor.materialize()
 
         # Ensure content and settings are JSON strings if they are being updated
         if 'content' in data and not isinstance(data.get('content'), str):
-            data['content'] = data['content']
+            data['content'] = json.dumps(data['content'])
         if 'settings' in data and not isinstance(data.get('settings'), str):
-            data['settings'] = data['settings']
+            data['settings'] = json.dumps(data['settings'])
 
+        # New content becomes the head revision when it is committed; unchanged
+        # chunks are shared with earlier revisions
         updated_tutor = db_client.update('Tutor', tutor_id, data)
 
         return jsonify({
@@ -157,16 +168,66 @@ def clone_tutor(tutor_id):
     if not original_tutor:
         return jsonify({"error": "Tutor not found"}), 404
 
-    clone_data = original_tutor.to_dict()
-    # Modify for clone
-    del clone_data['id']
-    clone_data['title'] = f"{clone_data['title']} (Copy)"
-    clone_data['is_published'] = False
-
-    new_tutor = db_client.create('Tutor', clone_data)
+    # Copy-on-write: content, modules and agent are shared until the clone is first edited
+    new_tutor = original_tutor.clone()
+    db.session.commit()
     return jsonify({"message": "Tutor cloned successfully", "new_tutor_id": new_tutor.id}), 201
 
 
+@tutor_bp.route('/<int:tutor_id>/revisions', methods=['GET'])
+@jwt_required()
+def get_tutor_revisions(tutor_id):
+    """List a tutor's saved revisions, newest first (API)
+
+    Function: Tutor Revision History
+    """
+    tutor = db_client.read_by_id('Tutor', tutor_id)
+    if not tutor:
+        return jsonify({"error": "Tutor not found"}), 404
+
+    limit = request.args.get('limit', 50, type=int)
+    revisions = TutorRevision.get_history(tutor_id, limit=limit)
+    return jsonify({
+        "head_revision_id": tutor.revision_id,
+        "revisions": [revision.to_dict() for revision in revisions]
+    }), 200
+
+
+@tutor_bp.route('/<int:tutor_id>/revisions/<int:revision_id>/restore', methods=['POST'])
+@jwt_required()
+def restore_tutor_revision(tutor_id, revision_id):
+    """Restore a tutor's content to an earlier revision (API)
+
+    Function: Tutor Revision Restore
+    """
+    tutor = Tutor.get_tutor_with_content(tutor_id)
+    if not tutor:
+        return jsonify({"error": "Tutor not found"}), 404
+
+    try:
+        revision = tutor.restore_revision(revision_id)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 404
+    return jsonify({"message": "Tutor revision restored", "revision_id": revision.id}), 200
+
+
+@tutor_bp.route('/<int:tutor_id>/undo', methods=['POST'])
+@jwt_required()
+def undo_tutor_change(tutor_id):
+    """Step a tutor back to its previous revision (API)
+
+    Function: Tutor Undo
+    """
+    tutor = Tutor.get_tutor_with_content(tutor_id)
+    if not tutor:
+        return jsonify({"error": "Tutor not found"}), 404
+
+    revision = tutor.undo()
+    if revision is None:
+        return jsonify({"error": "Nothing to undo"}), 409
+    return jsonify({"message": "Tutor change undone", "revision_id": revision.id}), 200
+
+
 @tutor_bp.route('/<int:tutor_id>/modules', methods=['GET'])
 @jwt_required()
 def get_tutor_modules(tutor_id):
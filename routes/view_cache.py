@@ -0,0 +1,101 @@
+"""
+In-memory cache of rendered tutor views.
+
+A tutor page only depends on the tutor's content revision, the viewer's role
+and whether it is a preview, so `routes/main.tutor_view` renders it once per
+such key and keeps the HTML together with a gzip-compressed copy. A classroom
+opening the same tutor is then served from memory without touching the
+content column, the JSON parser or Jinja, and clients that accept gzip get the
+precompressed bytes directly.
+
+The revision in the key keeps a hit from serving stale content; entries of a
+tutor are also dropped when a committed write touches its row, so deleted or
+edited tutors do not linger.
+"""
+
+import gzip
+import hashlib
+import threading
+from collections import OrderedDict
+
+from flask import current_app, request
+
+from database.sqlite_helpers import subscribe_model_writes
+
+
+class RenderedView:
+    __slots__ = ('body', 'gzipped', 'etag')
+
+    def __init__(self, body, gzipped, etag):
+        self.body = body
+        self.gzipped = gzipped
+        self.etag = etag
+
+
+class ViewCache:
+    """LRU map of (tutor id, revision, role, preview) keys to rendered pages."""
+
+    def __init__(self, max_entries=256, compress_level=6):
+        self.max_entries = max_entries
+        self.compress_level = compress_level
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def store(self, key, html):
+        """Compress and cache a rendered page, returning the cached entry."""
+        body = html.encode('utf-8')
+        entry = RenderedView(
+            body=body,
+            # mtime=0 keeps the output byte-identical across processes and restarts
+            gzipped=gzip.compress(body, compresslevel=self.compress_level, mtime=0),
+            etag=hashlib.sha1(body).hexdigest()
+        )
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return entry
+
+    def invalidate_tutor(self, tutor_id):
+        """Drop every cached page of a tutor."""
+        with self._lock:
+            for key in [key for key in self._entries if key[0] == tutor_id]:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+view_cache = ViewCache()
+
+
+@subscribe_model_writes
+def _invalidate_on_write(table_name, row_id):
+    if table_name != 'tutors':
+        return
+    if row_id is None:
+        view_cache.clear()
+    else:
+        view_cache.invalidate_tutor(row_id)
+
+
+def build_view_response(entry):
+    """Serve a cached page, gzip-encoded when the client accepts it."""
+    use_gzip = 'gzip' in request.accept_encodings
+    response = current_app.response_class(entry.gzipped if use_gzip else entry.body, mimetype='text/html')
+    if use_gzip:
+        response.headers['Content-Encoding'] = 'gzip'
+    response.vary.add('Accept-Encoding')
+    # Each encoding is a distinct representation and needs its own strong ETag
+    response.set_etag(entry.etag + '-gz' if use_gzip else entry.etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response.make_conditional(request)
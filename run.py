@@ -10,6 +10,10 @@ import sys
 import argparse
 from app import create_app
 from database.db import get_db_info, force_init_db
+from database.compression import compress_existing_rows
+from database.query_plans import check_query_plans, format_report
+from routes.static_assets import build_assets
+from database.roster_import import RosterError, detect_format, import_roster, read_roster
 
 
 def parse_args():
@@ -21,15 +25,39 @@ def parse_args():
     parser.add_argument('--port', '-p', type=int, default=5000, help='Port to bind to')
     parser.add_argument('--init-db', action='store_true', help='Force re-initialization of the database, dropping existing data.')
     parser.add_argument('--db-info', action='store_true', help='Print database information')
+    parser.add_argument('--compress-blobs', action='store_true',
+                        help='Compress existing large tutor and agent blobs in place (one-time migration)')
+    parser.add_argument('--build-assets', action='store_true',
+                        help='Fingerprint and precompress static assets into static/dist')
+    parser.add_argument('--check-query-plans', action='store_true',
+                        help='EXPLAIN every model and route query on a seeded scratch database; fail on full table scans')
+    parser.add_argument('--verbose', '-v', action='store_true', help='Print every query plan (with --check-query-plans)')
+    parser.add_argument('--import-roster', metavar='PATH',
+                        help='Create learner accounts from a CSV or JSONL roster file')
+    parser.add_argument('--course-id', type=int, help='Course to enroll imported learners in (with --import-roster)')
 
     return parser.parse_args()
 
 
+def background_overrides(args):
+    """
+    Config keeping background workers out of processes that serve no requests:
+    the one-shot commands, and the debug reloader's watcher process (the server
+    runs in the child it restarts).
+    """
+    one_shot = (args.init_db or args.db_info or args.compress_blobs or args.build_assets
+                or args.check_query_plans or args.import_roster)
+    reloader_watcher = args.env == 'development' and os.environ.get('WERKZEUG_RUN_MAIN') != 'true'
+    if one_shot or reloader_watcher:
+        return {'JOBS_ENABLED': False, 'PROGRESS_ROLLUP_ENABLED': False}
+    return {}
+
+
 def main():
     """Main entry point function"""
     args = parse_args()
     os.environ['FLASK_CONFIG'] = args.env
-    app = create_app()
+    app = create_app(overrides=background_overrides(args))
 
     # Handle database CLI commands
     if args.init_db:
@@ -54,6 +82,43 @@ def main():
                 print(f"  {key}: {value}")
         return 0
 
+    if args.compress_blobs:
+        print("Compressing existing blobs...")
+        for column, count in compress_existing_rows(app).items():
+            print(f"  {column}: {count} rows compressed")
+        return 0
+
+    if args.build_assets:
+        print("Building static assets...")
+        manifest = build_assets(app.static_folder, app.config.get('STATIC_ASSETS_DIR', 'dist'))
+        print(f"  {len(manifest['files'])} assets written")
+        return 0
+
+    if args.check_query_plans:
+        print("Checking query plans...")
+        results = check_query_plans()
+        print(format_report(results, verbose=args.verbose))
+        return 0 if all(result.ok for result in results) else 1
+
+    if args.import_roster:
+        print(f"Importing roster {args.import_roster}...")
+        with app.app_context():
+            try:
+                roster = read_roster(args.import_roster, detect_format(args.import_roster))
+            except RosterError as e:
+                print(f"Error: {e}")
+                return 1
+            for event in import_roster(roster, course_id=args.course_id):
+                if event['event'] in ('invalid', 'failed'):
+                    print(f"  row {event['row']} ({event['email']}): {event['error']}")
+                elif event['event'] == 'created' and 'temporary_password' in event:
+                    print(f"  {event['email']}: temporary password {event['temporary_password']}")
+                elif event['event'] == 'progress':
+                    print(f"  {event['processed']}/{event['valid']} processed, {event['created']} created")
+                elif event['event'] == 'done':
+                    print(f"Done: {event['created']} created, {event['invalid']} invalid, {event['failed']} failed")
+        return 0
+
     # Start the application server
     print(f"Starting server in {args.env} mode on {args.host}:{args.port}")
     # Use SocketIO's run method if you are using it, otherwise app.run
@@ -141,6 +141,62 @@ function populateActivityFeed(activityFeed) {
     });
 }
 
+let progressSocket = null;
+
+function formatProgressDelta(delta) {
+    const who = delta.learner_name || `Learner #${delta.learner_id}`;
+    const ended = delta.sessions.find(session => !session.active);
+    if (ended) {
+        return `${who} finished a ${ended.minutes || 0} min session on '${delta.tutor_title}' (${delta.completion}% complete)`;
+    }
+    return `${who} reached ${delta.completion}% on '${delta.tutor_title}'`;
+}
+
+function prependActivity(item) {
+    const container = document.getElementById('activity-feed');
+    const placeholder = container.querySelector('p');
+    if (placeholder && !container.querySelector('li')) {
+        container.innerHTML = '';
+    }
+    container.insertAdjacentHTML('afterbegin', `
+        <li class="flex items-start">
+            <div class="flex-shrink-0">
+                <span class="w-8 h-8 rounded-full bg-green-100 text-green-500 flex items-center justify-center">
+                    <i class="fas ${item.icon}"></i>
+                </span>
+            </div>
+            <div class="ml-3">
+                <p class="text-sm text-gray-700"></p>
+                <p class="text-xs text-gray-500"></p>
+            </div>
+        </li>
+    `);
+    // Learner names and tutor titles are user input: set them as text, never as HTML
+    const [text, time] = container.firstElementChild.querySelectorAll('p');
+    text.textContent = item.text;
+    time.textContent = item.time;
+}
+
+/**
+ * Subscribes to live progress of the instructor's courses; the server pushes
+ * batched `progress` deltas, so the feed updates without re-fetching the dashboard.
+ */
+function subscribeToCourseProgress(courses) {
+    if (typeof io === 'undefined' || courses.length === 0) {
+        return;
+    }
+    if (!progressSocket) {
+        // Socket.IO events are authorized with the same access token as the API
+        progressSocket = io({ auth: { token: localStorage.getItem('jwt_token') } });
+        progressSocket.on('progress', message => {
+            message.deltas.forEach(delta => {
+                prependActivity({ icon: 'fa-chart-line', text: formatProgressDelta(delta), time: 'Just now' });
+            });
+        });
+    }
+    courses.forEach(course => progressSocket.emit('subscribe_progress', { course_id: course.id }));
+}
+
 /**
  * Fetches dashboard data from the backend API.
  */
@@ -169,6 +225,7 @@ async function fetchDashboardData() {
         populateCourses(data.courses);
         populateTutors(data.tutors);
         populateActivityFeed(data.activityFeed);
+        subscribeToCourseProgress(data.courses);
 
     } catch (error) {
         console.error('Failed to fetch dashboard data:', error);